@@ -0,0 +1,183 @@
+"""Structured findings of AI detection.
+
+The LLM is asked to answer with a JSON object listing its findings, each with
+a type, a masked value and a confidence. Answers are parsed strictly (the
+whole answer must be the JSON object), with a fallback that extracts the
+object from a fenced or surrounded answer. Individual findings that do not
+validate are dropped; an answer without any valid JSON object yields no
+findings, so detection falls back to pattern matching alone.
+
+Findings are stored one row per finding in attachment_findings, where they
+can be aggregated per site and type.
+"""
+import json
+import re
+from datetime import datetime
+from typing import List, Optional
+
+from pydantic import BaseModel, Field, ValidationError
+from sqlalchemy import case, func
+from sqlalchemy.orm import Session
+
+from config import settings
+from models import Attachment, AttachmentFinding
+
+
+FINDING_TYPES = ("id_card", "phone", "bank_card", "passport", "address", "email", "other")
+
+# Names models commonly use instead of the schema's types
+TYPE_ALIASES = {
+    "idcard": "id_card",
+    "id_number": "id_card",
+    "identity_card": "id_card",
+    "id_card_number": "id_card",
+    "mobile": "phone",
+    "telephone": "phone",
+    "phone_number": "phone",
+    "bank_account": "bank_card",
+}
+
+FINDINGS_JSON_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "findings": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "type": {"type": "string", "enum": list(FINDING_TYPES)},
+                    "value": {"type": "string"},
+                    "confidence": {"type": "number"},
+                },
+                "required": ["type", "value", "confidence"],
+                "additionalProperties": False,
+            },
+        },
+    },
+    "required": ["findings"],
+    "additionalProperties": False,
+}
+
+FINDINGS_INSTRUCTIONS = (
+    "Answer only with a JSON object of the form "
+    '{"findings": [{"type": "...", "value": "...", "confidence": 0.0}]}. '
+    f"type is one of {', '.join(FINDING_TYPES)}. "
+    "value is the sensitive value with all but the first 3 and last 2 characters replaced by *. "
+    "confidence is between 0 and 1. "
+    "List only personal data that is actually present in the content; "
+    'answer {"findings": []} when there is none.'
+)
+
+
+class Finding(BaseModel):
+    type: str
+    value: str = ""
+    confidence: float = Field(ge=0, le=1)
+
+
+def response_format():
+    """The response_format request option for LLM_RESPONSE_FORMAT, or None for plain text"""
+    if settings.LLM_RESPONSE_FORMAT == "json_schema":
+        return {
+            "type": "json_schema",
+            "json_schema": {"name": "sensitive_findings", "strict": True, "schema": FINDINGS_JSON_SCHEMA},
+        }
+    if settings.LLM_RESPONSE_FORMAT == "json_object":
+        return {"type": "json_object"}
+    return None
+
+
+def _load_object(text):
+    try:
+        return json.loads(text)
+    except ValueError:
+        pass
+    # Fallback: an object inside a ```json fence or surrounded by prose
+    fenced = re.search(r"```(?:json)?\s*(\{.*?\})\s*```", text, re.DOTALL)
+    candidate = fenced.group(1) if fenced else text[text.find("{"):text.rfind("}") + 1]
+    try:
+        return json.loads(candidate) if candidate else None
+    except ValueError:
+        return None
+
+
+def parse_findings(text) -> Optional[List[Finding]]:
+    """Valid findings of an LLM answer, or None when it holds no findings object"""
+    data = _load_object(text or "")
+    if not isinstance(data, dict) or not isinstance(data.get("findings"), list):
+        return None
+
+    findings = []
+    for item in data["findings"]:
+        try:
+            finding = Finding.model_validate(item)
+        except ValidationError:
+            continue
+        finding_type = finding.type.strip().lower().replace(" ", "_").replace("-", "_")
+        finding_type = TYPE_ALIASES.get(finding_type, finding_type)
+        finding.type = finding_type if finding_type in FINDING_TYPES else "other"
+        # Never store a value the model failed to mask
+        finding.value = mask_value(finding.value)
+        findings.append(finding)
+    return findings
+
+
+def mask_value(value):
+    """Keep the first 3 and last 2 characters of a value, mask the rest"""
+    value = (value or "").strip()
+    if len(value) <= 5:
+        return "*" * len(value)
+    return value[:3] + "*" * (len(value) - 5) + value[-2:]
+
+
+def flags_from_findings(findings):
+    """(has_id_card, has_phone) from findings at or above LLM_FINDING_MIN_CONFIDENCE"""
+    confident = {f.type for f in findings if f.confidence >= settings.LLM_FINDING_MIN_CONFIDENCE}
+    return "id_card" in confident, "phone" in confident
+
+
+def findings_json(findings, unparsed=None):
+    """The llm_content stored for structured findings"""
+    data = {"findings": [finding.model_dump() for finding in findings]}
+    if unparsed:
+        data["unparsed"] = unparsed
+    return json.dumps(data, ensure_ascii=False)
+
+
+def store_attachment_findings(db: Session, attachment: Attachment, findings):
+    """Replace the stored findings of an attachment. The caller is responsible for committing."""
+    db.query(AttachmentFinding).filter(AttachmentFinding.attachment_id == attachment.id).delete(synchronize_session=False)
+    now = datetime.utcnow()
+    for finding in findings:
+        db.add(AttachmentFinding(
+            attachment_id=attachment.id,
+            site_id=attachment.site_id,
+            finding_type=finding.type,
+            masked_value=finding.value,
+            confidence=finding.confidence,
+            created_datetime=now,
+        ))
+
+
+def findings_statistics(db: Session, site_owner=None):
+    """Finding counts per type, optionally for one site, over attachments that are not deleted"""
+    query = db.query(
+        AttachmentFinding.finding_type,
+        func.count(AttachmentFinding.id),
+        func.count(func.distinct(AttachmentFinding.attachment_id)),
+        func.avg(AttachmentFinding.confidence),
+        func.sum(case((AttachmentFinding.confidence >= settings.LLM_FINDING_MIN_CONFIDENCE, 1), else_=0)),
+    ).join(Attachment, Attachment.id == AttachmentFinding.attachment_id).filter(Attachment.is_deleted.isnot(True))
+    if site_owner is not None:
+        query = query.filter(AttachmentFinding.site_id == str(site_owner))
+    return [
+        {
+            "type": finding_type,
+            "findings": count,
+            "attachments": attachments,
+            "average_confidence": round(average or 0.0, 3),
+            "confident_findings": int(confident or 0),
+        }
+        for finding_type, count, attachments, average, confident in
+        query.group_by(AttachmentFinding.finding_type).order_by(func.count(AttachmentFinding.id).desc())
+    ]
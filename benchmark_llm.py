@@ -0,0 +1,93 @@
+"""Throughput benchmark for AI detection calls.
+
+Starts the mock chat completions server in-process and sends the same
+analysis requests through the pooled LLM client one at a time (like the
+former per-attachment loop) and from LLM_MAX_CONCURRENCY worker threads (like
+site detection now does), reporting throughput and p50/p95 latency.
+
+    python benchmark_llm.py --requests 40 --latency 0.5 --concurrency 8 --error-rate 0.05
+"""
+import argparse
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from config import settings
+from llm_client import LLMClient, LLMError
+from mock_llm_server import create_server
+
+
+def run(client, requests_count, workers):
+    messages = [
+        {"role": "system", "content": settings.PROMPTS},
+        {"role": "user", "content": "姓名 张伟 电话 13812345678 " * 20},
+    ]
+    latencies = []
+    failures = 0
+
+    def call(_):
+        started = time.perf_counter()
+        try:
+            client.chat_completion(messages, max_tokens=500)
+        except LLMError:
+            return None
+        return time.perf_counter() - started
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for latency in executor.map(call, range(requests_count)):
+            if latency is None:
+                failures += 1
+            else:
+                latencies.append(latency)
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "seconds": elapsed,
+        "throughput": requests_count / elapsed,
+        "p50": statistics.median(latencies) if latencies else 0,
+        "p95": latencies[int(len(latencies) * 0.95) - 1] if latencies else 0,
+        "failures": failures,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=40)
+    parser.add_argument("--latency", type=float, default=0.5)
+    parser.add_argument("--concurrency", type=int, default=settings.LLM_MAX_CONCURRENCY)
+    parser.add_argument("--rpm", type=int, default=0, help="Requests per minute limit, 0 for none")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    # Short backoff so injected errors do not dominate the run
+    settings.LLM_BACKOFF_BASE = 0.1
+    settings.LLM_BACKOFF_MAX = 1
+
+    server = create_server(latency=args.latency, error_rate=args.error_rate, rate_limit_rate=args.rate_limit_rate)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_port}/v1"
+
+    results = {}
+    for label, workers in (("serial", 1), ("concurrent", args.concurrency)):
+        client = LLMClient(base_url=base_url, api_key="test", max_concurrency=workers, requests_per_minute=args.rpm)
+        server.max_in_flight = 0
+        results[label] = run(client, args.requests, workers)
+        results[label]["max_in_flight"] = server.max_in_flight
+        client.close()
+    server.shutdown()
+    server.server_close()
+
+    print(f"{'mode':<11} {'seconds':>8} {'req/s':>7} {'p50 s':>7} {'p95 s':>7} {'in flight':>10} {'failed':>7}")
+    for label, result in results.items():
+        print(
+            f"{label:<11} {result['seconds']:>8.2f} {result['throughput']:>7.2f} {result['p50']:>7.2f} "
+            f"{result['p95']:>7.2f} {result['max_in_flight']:>10} {result['failures']:>7}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""Latency versus OCR score of image normalisation before OCR.
+
+OCRs a sample of images once per OCR_MAX_DIMENSION value (0 is full size)
+and reports the time per image, split into normalisation and OCR, the
+average ocr_score and the number of recognised characters. Lower caps are
+faster; the score and character count show when text starts to get lost.
+
+The sample is a directory of images; without --sample, large synthetic scans
+with small and normal text and a long screenshot are generated. Needs the
+configured OCR engine (OCR_ENGINE); without it only normalisation is timed.
+
+    python benchmark_ocr_prep.py --sample ./scans --dimensions 0,4000,2500,1600,1000
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from PIL import Image, ImageDraw, ImageFont
+
+import utils
+from config import settings
+from ocr_prep import ocr_pages
+
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".gif", ".tiff")
+
+LINE = "姓名 张伟 电话 13812345678 身份证 530102199001011234 address Room 301"
+
+
+def _font(size):
+    try:
+        return ImageFont.load_default(size=size)
+    except TypeError:
+        # Pillow before 10.1 has a single bitmap font
+        return ImageFont.load_default()
+
+
+def generate_sample(directory):
+    """Write scans of 2480x3508 and 6000x8000 with small and normal text, and a long screenshot"""
+    for width, height in ((2480, 3508), (6000, 8000)):
+        for size in (width // 100, width // 60):
+            image = Image.new("RGB", (width, height), (250, 250, 245))
+            draw = ImageDraw.Draw(image)
+            font = _font(size)
+            for y in range(size * 4, height - size * 4, size * 2):
+                draw.text((size * 4, y), LINE, font=font, fill=(20, 20, 20))
+            image.save(os.path.join(directory, f"scan_{width}x{height}_{size}px.jpg"), quality=85)
+    image = Image.new("RGB", (1080, 12000), (255, 255, 255))
+    draw = ImageDraw.Draw(image)
+    for y in range(40, 11960, 60):
+        draw.text((30, y), LINE, font=_font(30), fill=(0, 0, 0))
+    image.save(os.path.join(directory, "screenshot_1080x12000.png"))
+
+
+def recognised_characters(results):
+    if isinstance(results, dict):
+        return sum(len(str(text).strip()) for text in results.get("text", []))
+    characters = 0
+    for page in results:
+        for line in page or []:
+            if line and len(line) > 1:
+                characters += len(line[1][0])
+    return characters
+
+
+def run(images, engine_available):
+    prep_seconds = 0.0
+    ocr_seconds = 0.0
+    scores = []
+    characters = 0
+    for image_path in images:
+        started = time.perf_counter()
+        ocr_pages(image_path)
+        prep_seconds += time.perf_counter() - started
+        if engine_available:
+            # Pages come from the cache now, so this is OCR time
+            started = time.perf_counter()
+            results = utils.extract_ocr_from_image_with_confidence(image_path)
+            ocr_seconds += time.perf_counter() - started
+            scores.append(utils.calculate_ocr_confidence_score(results))
+            characters += recognised_characters(results)
+    return {
+        "prep": prep_seconds / len(images),
+        "ocr": ocr_seconds / len(images),
+        "score": sum(scores) / len(scores) if scores else None,
+        "characters": characters,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sample", help="Directory of images")
+    parser.add_argument("--dimensions", default="0,4000,2500,1600,1000", help="OCR_MAX_DIMENSION values")
+    args = parser.parse_args()
+
+    utils.initialize_ocr()
+    engine_available = utils.PADDLE_OCR_AVAILABLE or utils.TESSERACT_OCR_AVAILABLE
+    if not engine_available:
+        print(f"OCR engine '{utils.OCR_ENGINE}' not available, timing normalisation only")
+    # Measure normalisation alone, not the text pre-check
+    settings.OCR_TEXT_PRECHECK = False
+
+    with tempfile.TemporaryDirectory() as directory:
+        sample = args.sample
+        if not sample:
+            sample = os.path.join(directory, "sample")
+            os.makedirs(sample)
+            generate_sample(sample)
+        images = [
+            os.path.join(sample, name) for name in sorted(os.listdir(sample))
+            if name.lower().endswith(IMAGE_EXTENSIONS)
+        ]
+        if not images:
+            print(f"No images in {sample}")
+            return
+
+        print(f"{len(images)} images, engine {utils.OCR_ENGINE}")
+        print(f"{'max side':>8} {'prep s':>7} {'OCR s':>7} {'total s':>8} {'ocr_score':>9} {'chars':>7}")
+        for dimension in (int(value) for value in args.dimensions.split(",")):
+            settings.OCR_MAX_DIMENSION = dimension
+            # A fresh page cache per setting, so normalisation is measured every time
+            settings.ATTACHMENT_CACHE_DIR = os.path.join(directory, f"cache_{dimension}")
+            result = run(images, engine_available)
+            score = f"{result['score']:.3f}" if result["score"] is not None else "-"
+            characters = result["characters"] if engine_available else "-"
+            print(
+                f"{dimension or 'full':>8} {result['prep']:>7.2f} {result['ocr']:>7.2f} "
+                f"{result['prep'] + result['ocr']:>8.2f} {score:>9} {characters:>7}"
+            )
+
+
+if __name__ == "__main__":
+    main()
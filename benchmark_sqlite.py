@@ -0,0 +1,142 @@
+"""Concurrency benchmark for the SQLite profiles.
+
+Seeds a temporary database, then runs reader threads (attachment list queries
+like GET /api/attachments) next to writer threads (detection result updates)
+for a fixed time, once per profile. Reports throughput, p95 latency and the
+number of failed operations, e.g. "database is locked".
+
+    python benchmark_sqlite.py --readers 8 --writers 4 --seconds 10
+"""
+import argparse
+import os
+import random
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy import insert, update
+from sqlalchemy.orm import sessionmaker
+
+from models import Attachment, Base
+from sqlite_profile import create_sqlite_engines
+
+
+def seed(engine, rows, sites):
+    session = sessionmaker(bind=engine)()
+    batch = []
+    for i in range(rows):
+        batch.append({
+            "site_id": str(i % sites),
+            "show_name": f"attachment {i}",
+            "file_path": f"/upload/{i}.docx",
+            "url_path": f"/files/{i}.docx",
+            "file_ext": ".docx",
+            "create_date": datetime(2024, 1, 1 + i % 28),
+            "text_content": "x" * 2000,
+        })
+        if len(batch) == 5000:
+            session.execute(insert(Attachment), batch)
+            batch = []
+    if batch:
+        session.execute(insert(Attachment), batch)
+    session.commit()
+    session.close()
+
+
+def run_profile(profile, args):
+    with tempfile.TemporaryDirectory() as directory:
+        url = f"sqlite:///{os.path.join(directory, 'benchmark.db')}"
+        write_engine, read_engine = create_sqlite_engines(url, profile)
+        Base.metadata.create_all(bind=write_engine)
+        seed(write_engine, args.rows, args.sites)
+
+        WriteSession = sessionmaker(bind=write_engine)
+        ReadSession = sessionmaker(bind=read_engine)
+        stop = threading.Event()
+        results = {"read": [], "write": [], "read_errors": 0, "write_errors": 0}
+        results_lock = threading.Lock()
+
+        def reader():
+            db = ReadSession()
+            latencies, errors = [], 0
+            while not stop.is_set():
+                started = time.perf_counter()
+                try:
+                    db.query(Attachment.id, Attachment.show_name).filter(
+                        Attachment.site_id == str(random.randrange(args.sites))
+                    ).order_by(Attachment.create_date.desc()).limit(50).all()
+                    db.commit()
+                    latencies.append(time.perf_counter() - started)
+                except Exception:
+                    errors += 1
+                    db.rollback()
+            db.close()
+            with results_lock:
+                results["read"].extend(latencies)
+                results["read_errors"] += errors
+
+        def writer():
+            db = WriteSession()
+            latencies, errors = [], 0
+            while not stop.is_set():
+                started = time.perf_counter()
+                try:
+                    # Read then write in one session, like process_attachment_file
+                    attachment_id = random.randrange(1, args.rows + 1)
+                    db.get(Attachment, attachment_id)
+                    db.execute(update(Attachment).where(Attachment.id == attachment_id).values(
+                        has_phone=random.random() < 0.5,
+                        processed_datetime=datetime.utcnow(),
+                    ))
+                    db.commit()
+                    latencies.append(time.perf_counter() - started)
+                except Exception:
+                    errors += 1
+                    db.rollback()
+                db.expunge_all()
+            db.close()
+            with results_lock:
+                results["write"].extend(latencies)
+                results["write_errors"] += errors
+
+        threads = [threading.Thread(target=reader) for _ in range(args.readers)]
+        threads += [threading.Thread(target=writer) for _ in range(args.writers)]
+        for thread in threads:
+            thread.start()
+        time.sleep(args.seconds)
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+        write_engine.dispose()
+        read_engine.dispose()
+        return results
+
+
+def p95(latencies):
+    if not latencies:
+        return 0.0
+    return sorted(latencies)[int(len(latencies) * 0.95)] * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=50000)
+    parser.add_argument("--sites", type=int, default=100)
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--writers", type=int, default=4)
+    parser.add_argument("--seconds", type=float, default=10)
+    args = parser.parse_args()
+
+    print(f"{'profile':<12} {'reads/s':>9} {'p95 read ms':>12} {'read errors':>12} {'writes/s':>9} {'p95 write ms':>13} {'write errors':>13}")
+    for profile in ("default", "performance"):
+        results = run_profile(profile, args)
+        print(
+            f"{profile:<12} {len(results['read']) / args.seconds:>9.0f} {p95(results['read']):>12.1f} {results['read_errors']:>12} "
+            f"{len(results['write']) / args.seconds:>9.0f} {p95(results['write']):>13.1f} {results['write_errors']:>13}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+"""Precision and recall of the text pre-check that runs before OCR.
+
+Classifies a labelled sample with text_presence.text_line_count and reports,
+for each OCR_TEXT_MIN_LINES threshold, how many images with text are still
+sent to OCR (recall) and how many of the images sent to OCR have text
+(precision), plus the time the check takes per image.
+
+The sample is a directory with a text/ and a no_text/ subdirectory of images,
+e.g. attachments sorted by hand. Without --sample, a synthetic sample of
+documents, screenshots and captioned pictures against photos, textures,
+fractals and shapes is generated into a temporary directory.
+
+    python benchmark_text_presence.py --sample ./labelled_images
+    python benchmark_text_presence.py --count 60
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from PIL import Image, ImageDraw, ImageFilter, ImageFont
+
+from text_presence import text_line_count
+
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".gif", ".tiff", ".webp")
+
+WORDS = (
+    "姓名 name phone 13812345678 address student department score 2024 report notice "
+    "ID 530102199001011234 table total 学院 通知"
+).split()
+
+
+def _sentence(words):
+    return " ".join(random.choice(WORDS) for _ in range(words))
+
+
+def _font(size):
+    try:
+        return ImageFont.load_default(size=size)
+    except TypeError:
+        # Pillow before 10.1 has a single bitmap font
+        return ImageFont.load_default()
+
+
+def _text_image(i):
+    width, height = random.choice([(800, 600), (1200, 1600), (1920, 1080), (600, 200), (2480, 3508)])
+    kind = i % 5
+    background = [(255, 255, 255), (240, 240, 230), (30, 30, 60), (200, 220, 255)][i % 4]
+    image = Image.new("RGB", (width, height), background)
+    if kind == 3:
+        # Banner with a gradient behind the text
+        draw = ImageDraw.Draw(image)
+        for y in range(height):
+            draw.line([(0, y), (width, y)], fill=(int(255 * y / height), 100, 150))
+    elif kind == 4:
+        # Picture with a caption
+        image = Image.effect_noise((width // 8, height // 8), 80).resize((width, height))
+        image = image.filter(ImageFilter.GaussianBlur(6)).convert("RGB")
+    draw = ImageDraw.Draw(image)
+    size = random.choice([max(12, width // 80), max(14, width // 50), max(20, width // 30)])
+    font = _font(size)
+    color = (0, 0, 0) if sum(background) > 300 else (255, 255, 255)
+    lines = random.randint(1, 30) if kind in (0, 1) else random.randint(1, 3)
+    y = random.randint(0, height // 4)
+    for _ in range(lines):
+        if y > height - size:
+            break
+        draw.text((random.randint(5, width // 10), y), _sentence(random.randint(2, 10)), font=font, fill=color)
+        y += int(size * 1.5)
+    if kind == 2:
+        # Table rules
+        for x in range(0, width, width // 6):
+            draw.line([(x, 0), (x, height)], fill=color)
+    return image
+
+
+def _random_color():
+    return tuple(random.randrange(256) for _ in range(3))
+
+
+def _no_text_image(i):
+    width, height = random.choice([(800, 600), (1200, 900), (1920, 1080), (400, 400), (64, 64)])
+    kind = i % 6
+    if kind == 0:
+        image = Image.effect_noise((width // random.choice([4, 8, 16]), height // 8), random.randint(30, 90))
+        image = image.resize((width, height), Image.BICUBIC).filter(ImageFilter.GaussianBlur(random.randint(1, 8)))
+        return image.convert("RGB")
+    if kind == 1:
+        return Image.linear_gradient("L").resize((width, height)).convert("RGB")
+    if kind == 2:
+        image = Image.new("RGB", (width, height), _random_color())
+        draw = ImageDraw.Draw(image)
+        for _ in range(random.randint(1, 8)):
+            x, y, r = random.randrange(width), random.randrange(height), random.randint(5, width // 3)
+            draw.ellipse([x - r, y - r, x + r, y + r], fill=_random_color())
+        return image
+    if kind == 3:
+        # Fine texture such as foliage
+        radius = random.choice([0.5, 1, 2])
+        return Image.merge("RGB", [
+            Image.effect_noise((width, height), random.randint(20, 60)).filter(ImageFilter.GaussianBlur(radius))
+            for _ in range(3)
+        ])
+    if kind == 4:
+        return Image.effect_mandelbrot((width, height), (-2, -1.5, 1, 1.5), random.randint(20, 100)).convert("RGB")
+    image = Image.new("RGB", (width, height), (255, 255, 255))
+    draw = ImageDraw.Draw(image)
+    draw.rectangle([width // 4, height // 4, 3 * width // 4, 3 * height // 4], fill=(200, 30, 30))
+    draw.polygon([(width // 2, 0), (width, height), (0, height)], outline=(0, 0, 0))
+    return image
+
+
+def generate_sample(directory, count, seed=1):
+    """Write count images with text and count without into directory/text and directory/no_text"""
+    random.seed(seed)
+    for label, make in (("text", _text_image), ("no_text", _no_text_image)):
+        os.makedirs(os.path.join(directory, label), exist_ok=True)
+        for i in range(count):
+            name = f"{i}.jpg" if i % 2 else f"{i}.png"
+            make(i).save(os.path.join(directory, label, name), quality=85)
+
+
+def classify(directory):
+    """(label has text, line count, seconds) for every image of the sample"""
+    results = []
+    for label, has_text in (("text", True), ("no_text", False)):
+        folder = os.path.join(directory, label)
+        for name in sorted(os.listdir(folder)):
+            if not name.lower().endswith(IMAGE_EXTENSIONS):
+                continue
+            started = time.perf_counter()
+            lines = text_line_count(os.path.join(folder, name))
+            results.append((has_text, lines, time.perf_counter() - started))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sample", help="Directory with text/ and no_text/ subdirectories")
+    parser.add_argument("--count", type=int, default=60, help="Images per label in the synthetic sample")
+    parser.add_argument("--thresholds", default="1,2,3,5,8", help="OCR_TEXT_MIN_LINES values to report")
+    args = parser.parse_args()
+
+    if args.sample:
+        results = classify(args.sample)
+    else:
+        with tempfile.TemporaryDirectory() as directory:
+            generate_sample(directory, args.count)
+            results = classify(directory)
+
+    with_text = sum(1 for has_text, _, _ in results if has_text)
+    print(f"{len(results)} images, {with_text} with text, "
+          f"{sum(seconds for _, _, seconds in results) / len(results) * 1000:.1f} ms per image")
+    print(f"{'min lines':>9} {'recall':>7} {'precision':>9} {'to OCR':>7} {'skipped':>8}")
+    for threshold in (int(value) for value in args.thresholds.split(",")):
+        sent = [has_text for has_text, lines, _ in results if lines >= threshold]
+        true_positives = sum(sent)
+        recall = true_positives / with_text if with_text else 0.0
+        precision = true_positives / len(sent) if sent else 0.0
+        print(f"{threshold:>9} {recall:>7.3f} {precision:>9.3f} {len(sent):>7} {len(results) - len(sent):>8}")
+
+
+if __name__ == "__main__":
+    main()
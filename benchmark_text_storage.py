@@ -0,0 +1,128 @@
+"""Size and read benchmark for compressed text storage.
+
+Fills a temporary SQLite database with spreadsheet-like extracted text, then
+measures the file size, detail reads (like GET /api/attachments/{id}), loading
+all rows of a site and a substring search. It measures once with plain columns
+and again after compress_existing_texts() and VACUUM.
+
+    python benchmark_text_storage.py --attachments 2000 --codec zlib
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from sqlalchemy import insert, text
+from sqlalchemy.orm import sessionmaker
+
+from config import settings
+from models import Attachment, Base
+from sqlite_profile import create_sqlite_engines
+import text_store
+
+NAMES = ["张伟", "王芳", "李娜", "刘洋", "陈静", "杨磊", "赵敏", "黄强"]
+DEPARTMENTS = ["信息学院", "数学学院", "物理学院", "化学学院", "外国语学院"]
+
+
+def spreadsheet_text(rows):
+    lines = []
+    for i in range(rows):
+        lines.append("\t".join([
+            str(i + 1),
+            random.choice(NAMES),
+            random.choice(DEPARTMENTS),
+            f"1{random.randint(3000000000, 9999999999)}",
+            random.choice(["男", "女"]),
+            f"{random.randint(60, 100)}",
+        ]))
+    return "\n".join(lines)
+
+
+def measure(session_factory, db_path, attachment_ids, search):
+    session = session_factory()
+    started = time.perf_counter()
+    characters = 0
+    for attachment_id in attachment_ids:
+        attachment = text_store.load_attachment_texts(session, session.get(Attachment, attachment_id))
+        characters += len(attachment.text_content)
+        session.expunge_all()
+    read_seconds = time.perf_counter() - started
+
+    # Whole rows of one site, as loaded by site processing and downloads
+    started = time.perf_counter()
+    session.query(Attachment).filter(Attachment.site_id == "3").all()
+    site_load_seconds = time.perf_counter() - started
+    session.expunge_all()
+
+    started = time.perf_counter()
+    matches = session.query(Attachment.id).filter(text_store.text_search_filter(session, "text_content", search)).count()
+    search_seconds = time.perf_counter() - started
+    session.close()
+    return {
+        "size_mb": os.path.getsize(db_path) / 1e6,
+        "reads_per_second": len(attachment_ids) / read_seconds,
+        "mb_per_second": characters / read_seconds / 1e6,
+        "site_load_ms": site_load_seconds * 1000,
+        "search_ms": search_seconds * 1000,
+        "matches": matches,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--attachments", type=int, default=2000)
+    parser.add_argument("--rows", type=int, default=300, help="Spreadsheet rows per attachment")
+    parser.add_argument("--reads", type=int, default=500)
+    parser.add_argument("--codec", default="zlib", choices=["zlib", "zstd"])
+    parser.add_argument("--search", default="13812345678")
+    args = parser.parse_args()
+
+    random.seed(1)
+    with tempfile.TemporaryDirectory() as directory:
+        db_path = os.path.join(directory, "benchmark.db")
+        engine, _ = create_sqlite_engines(f"sqlite:///{db_path}")
+        Base.metadata.create_all(bind=engine)
+        text_store.ensure_text_search_index(engine)
+        Session = sessionmaker(bind=engine)
+
+        session = Session()
+        for start in range(0, args.attachments, 500):
+            session.execute(insert(Attachment), [
+                {
+                    "site_id": str(i % 20),
+                    "file_path": f"/upload/{i}.xlsx",
+                    "url_path": f"/files/{i}.xlsx",
+                    "file_ext": ".xlsx",
+                    # Every 100th attachment contains the searched phone number
+                    "text_content": spreadsheet_text(args.rows) + ("\n13812345678" if i % 100 == 0 else ""),
+                    "ocr_content": "",
+                    "llm_content": "",
+                }
+                for i in range(start, min(start + 500, args.attachments))
+            ])
+        session.commit()
+        session.close()
+
+        attachment_ids = random.sample(range(1, args.attachments + 1), min(args.reads, args.attachments))
+        before = measure(Session, db_path, attachment_ids, args.search)
+
+        settings.TEXT_COMPRESSION = args.codec
+        session = Session()
+        text_store.compress_existing_texts(session)
+        session.close()
+        with engine.connect() as conn:
+            conn.execution_options(isolation_level="AUTOCOMMIT").execute(text("VACUUM"))
+        after = measure(Session, db_path, attachment_ids, args.search)
+        engine.dispose()
+
+    print(f"{'storage':<10} {'size MB':>9} {'reads/s':>9} {'text MB/s':>10} {'site load ms':>13} {'search ms':>10} {'matches':>8}")
+    for label, result in (("plain", before), (args.codec, after)):
+        print(
+            f"{label:<10} {result['size_mb']:>9.1f} {result['reads_per_second']:>9.0f} "
+            f"{result['mb_per_second']:>10.1f} {result['site_load_ms']:>13.1f} {result['search_ms']:>10.1f} {result['matches']:>8}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+import hashlib
+import threading
+
+
+class ResponseCache:
+    """In-process cache of serialized API responses, invalidated by a data version.
+
+    Sync and detection call bump() after committing changes, which makes every
+    cached entry stale. Entries are rebuilt lazily on the next request.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = 0
+        self._entries = {}
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def version(self):
+        return self._version
+
+    def bump(self):
+        """Invalidate all cached responses"""
+        with self._lock:
+            self._version += 1
+            self._entries.clear()
+
+    def get_or_build(self, key, builder):
+        """Return (etag, body) for key, calling builder() to produce the body bytes when stale"""
+        with self._lock:
+            version = self._version
+            entry = self._entries.get(key)
+            if entry and entry[0] == version:
+                self.hits += 1
+                return entry[1], entry[2]
+            self.misses += 1
+
+        body = builder()
+        etag = '"%s"' % hashlib.sha1(body).hexdigest()
+
+        with self._lock:
+            # Do not store a response built from data that changed meanwhile
+            if self._version == version:
+                self._entries[key] = (version, etag, body)
+        return etag, body
+
+
+response_cache = ResponseCache()
+
+
+def bump_data_version():
+    """Mark local data as changed so cached read endpoints are recomputed"""
+    response_cache.bump()
@@ -9,6 +9,12 @@ class Settings(BaseSettings):
     REMOTE_DB_NAME: Optional[str] = None
     REMOTE_DB_USER: Optional[str] = None
     REMOTE_DB_PASSWORD: Optional[str] = None
+    REMOTE_DB_POOL_MIN: int = 1
+    REMOTE_DB_POOL_MAX: int = 8  # Also bounds SYNC_SITE_WORKERS
+    REMOTE_DB_POOL_TIMEOUT: float = 60  # Seconds to wait for a free pooled connection
+    REMOTE_DB_CONNECT_TIMEOUT: int = 10  # Seconds
+    REMOTE_DB_STATEMENT_TIMEOUT: float = 1800  # Seconds, 0 disables the server-side limit
+    REMOTE_DB_HEALTH_CHECK_INTERVAL: float = 30  # Idle seconds after which a pooled connection is pinged
     
     # Local Database Configuration
     LOCAL_DB_TYPE: str = "sqlite"  # Options: sqlite, mysql, postgresql
@@ -18,21 +24,88 @@ class Settings(BaseSettings):
     LOCAL_DB_USER: Optional[str] = None
     LOCAL_DB_PASSWORD: Optional[str] = None
     LOCAL_DB_PATH: str = "./local_attachments.db"  # For SQLite
+    LOCAL_DB_SQLITE_PROFILE: str = "default"  # Options: default, performance (WAL, single writer, read pool)
+    SQLITE_CACHE_SIZE_MB: int = 64  # Page cache per connection, performance profile only
+    SQLITE_MMAP_SIZE_MB: int = 256  # Memory-mapped I/O size, performance profile only
+    SQLITE_BUSY_TIMEOUT: float = 30  # Seconds to wait for the database or the writer
+    SQLITE_READ_POOL_SIZE: int = 8  # Read-only connections, performance profile only
+
+    # Remote Sync Configuration
+    SYNC_BATCH_SIZE: int = 5000  # Rows per bulk INSERT/UPDATE statement
+    REMOTE_FETCH_ITERSIZE: int = 2000  # Rows per round trip from the remote server-side cursor
+    SYNC_DELETION_CHECK_HOURS: float = 24  # Minimum interval between remote deletion checks on incremental syncs
+    SYNC_SITE_WORKERS: int = 4  # Parallel per-site fetches in a per-site attachments sync
     
+    # Extracted Text Storage (SQLite only, PostgreSQL already compresses large values)
+    TEXT_COMPRESSION: str = "none"  # Options: none, zlib, zstd (needs the zstandard package)
+    TEXT_COMPRESSION_LEVEL: int = 6
+
     # Cache Configuration
     ATTACHMENT_CACHE_DIR: str = "./attachments_cache"
     
+    # Fast detection (detection_type=fast): categories that end reading a file once all are found
+    FAST_DETECT_CATEGORIES: str = "id_card,phone"
+    FAST_DETECT_STORE_TEXT: bool = False  # Store the text read before detection stopped
+
+    # Streaming spreadsheet extraction
+    SPREADSHEET_MAX_ROWS: int = 500000  # Rows read per workbook, 0 for all
+    SPREADSHEET_CHUNK_CHARS: int = 262144  # Characters of rows scanned for sensitive data at a time
+    SPREADSHEET_MAX_TEXT_CHARS: int = 5000000  # Characters of text stored per workbook, 0 for all
+
+    # Memory-mapped scanning of TXT, CSV and LOG files
+    PLAIN_TEXT_CHUNK_BYTES: int = 1048576  # Bytes decoded and scanned for sensitive data at a time
+    PLAIN_TEXT_MAX_TEXT_CHARS: int = 1000000  # Characters of the excerpt stored per file, 0 for all
+
     # OCR Engine Configuration ('paddle' or 'tesseract')
     OCR_ENGINE: str = "paddle"
     
     # PaddleOCR Configuration
     PADDLE_USE_GPU: bool = False
+
+    # Skip OCR on images with fewer than OCR_TEXT_MIN_LINES text-like lines
+    OCR_TEXT_PRECHECK: bool = True
+    OCR_TEXT_MIN_LINES: int = 1
+
+    # Image normalisation before OCR
+    OCR_MAX_DIMENSION: int = 2500  # Pixels of the longer side, 0 to OCR at full size
+    OCR_MIN_DIMENSION: int = 32  # Images with a shorter side below this are not OCR'd
+    OCR_GRAYSCALE: bool = True
+    OCR_TILE_ASPECT: float = 3  # Longer images are cut into tiles before downscaling, 0 to disable
+    OCR_MAX_TILES: int = 8
+    OCR_MAX_FRAMES: int = 10  # Frames of multi-frame GIF and TIFF images
+
+    # OCR of images embedded in DOCX, PPTX and XLSX files
+    OCR_EMBEDDED_IMAGES: bool = True
+    OCR_EMBEDDED_MAX_IMAGES: int = 50
+    OCR_EMBEDDED_WORKERS: int = 4
     
     # OpenAI API Configuration
     OPENAI_API_KEY: Optional[str] = None
     OPENAI_BASE_URL: str = "https://api.openai.com/v1"
     MODEL: str = "gpt-4"
     PROMPTS: str = "Please analyze this content and identify any sensitive information like ID card numbers or phone numbers."
+    LLM_MAX_CONCURRENCY: int = 4  # In-flight LLM requests, also the number of attachments AI-detected in parallel
+    LLM_REQUESTS_PER_MINUTE: float = 60  # Token-bucket rate limit, 0 disables it
+    LLM_CONNECT_TIMEOUT: float = 10  # Seconds
+    LLM_READ_TIMEOUT: float = 120  # Seconds
+    LLM_MAX_RETRIES: int = 4  # Retries on 429, 5xx, timeouts and connection errors
+    LLM_BACKOFF_BASE: float = 1  # Seconds before the first retry, doubled on each retry
+    LLM_BACKOFF_MAX: float = 30  # Seconds
+    LLM_CACHE_ENABLED: bool = True  # Reuse analyses of unchanged content, prompt and model
+    LLM_CACHE_TTL_DAYS: float = 30  # 0 keeps entries until they are evicted for size
+    LLM_CACHE_MAX_ENTRIES: int = 10000  # Least recently used entries beyond this are evicted
+    LLM_CHUNK_TOKENS: int = 2000  # Estimated content tokens per request; longer content is reduced to candidate windows
+    LLM_WINDOW_CHARS: int = 200  # Characters kept on each side of an ID card/phone candidate or keyword
+    LLM_ATTACHMENT_TOKEN_BUDGET: int = 8000  # Estimated content tokens sent per attachment, 0 for no limit
+    LLM_JOB_TOKEN_BUDGET: int = 0  # Tokens (prompt and completion) one site detection job may spend, 0 for no limit
+    LLM_RESPONSE_FORMAT: str = "json_object"  # Options: json_schema, json_object, text (JSON requested by the prompt only)
+    LLM_FINDING_MIN_CONFIDENCE: float = 0.5  # AI findings below this confidence do not set the sensitive flags
+    LLM_VISION_ENABLED: bool = False  # Also send image attachments to the (vision capable) MODEL in AI detection
+    LLM_IMAGE_MAX_DIMENSION: int = 1568  # Pixels of the longer side of images sent to the LLM
+    LLM_IMAGE_FORMAT: str = "jpeg"  # Options: jpeg, webp
+    LLM_IMAGE_QUALITY: int = 80
+    LLM_IMAGE_MAX_ASPECT: float = 3  # Longer images are cut into tiles before downscaling
+    LLM_IMAGE_MAX_TILES: int = 4
 
     # Attachment Base URL Configuration
     ATTACHMENT_DEFAULT_BASE_URL: str = "http://www.ynu.edu.cn"
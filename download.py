@@ -4,11 +4,22 @@ import tempfile
 from urllib.parse import urlparse
 from config import settings
 import hashlib
-from models import Attachment
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from models import Attachment, SessionLocal
 from sqlalchemy.orm import Session
-from utils import extract_text_from_file, contains_id_card, contains_phone, detect_sensitive_info_ai, extract_zip_content
+from utils import extract_text_from_file, contains_id_card, contains_phone, detect_sensitive_info_ai, extract_zip_content, extract_ocr_from_embedded_images, scan_spreadsheet, scan_plain_text
 import zipfile
 import rarfile
+from stats import apply_detection_delta
+from cache import bump_data_version
+from llm_client import TokenBudget
+from ai_findings import store_attachment_findings
+from text_store import store_attachment_texts
+from embedded_media import OOXML_EXTENSIONS
+from spreadsheets import SPREADSHEET_EXTENSIONS
+from plain_text import PLAIN_TEXT_EXTENSIONS
+from text_stream import detect_file_fast, fast_detect_categories
+from file_types import REJECTED_FILE_TYPES, normalise_type, resolve_file_type
 
 
 def get_file_hash(file_path):
@@ -93,8 +104,11 @@ def update_progress(ws_id: str, current: int, total: int, message: str):
         asyncio.run(send_update())
 
 
-def process_attachment_file(attachment: Attachment, db: Session, base_url: str = "", detection_type="normal", progress_callback=None):
-    """Process an attachment: download, extract content, and update database"""
+def process_attachment_file(attachment: Attachment, db: Session, base_url: str = "", detection_type="normal", progress_callback=None, token_budget=None):
+    """Process an attachment: download, extract content, and update database.
+
+    AI detection spends tokens from token_budget, the budget of the detection job, when given.
+    """
     # Construct full URL for the attachment
     if attachment.url_path.startswith(('http://', 'https://')):
         full_url = attachment.url_path
@@ -131,14 +145,33 @@ def process_attachment_file(attachment: Attachment, db: Session, base_url: str =
             print(f"Failed to download {full_url}")
             return
 
+    # The type is sniffed from the content, as attachments are often misnamed or error pages
+    file_type = resolve_file_type(cached_path, extracted_ext)
+    if file_type != normalise_type(extracted_ext):
+        print(f"Attachment {attachment.id} declared as {extracted_ext or 'no extension'} has {file_type} content")
+    attachment.detected_file_type = file_type
+
+    if detection_type == "fast":
+        process_attachment_fast(attachment, db, cached_path, file_type, progress_callback)
+        return
+
+    # Spreadsheets and large text files are scanned while they stream, also beyond the stored text
+    streamed_id_card = False
+    streamed_phone = False
+
+    if file_type in REJECTED_FILE_TYPES:
+        # Empty files and HTML error pages are not parsed
+        print(f"Skipping content extraction for attachment {attachment.id}: {file_type} content")
+        text_content = ""
+        ocr_content = ""
     # If the file is an archive, extract it and process the contents
-    if extracted_ext in ['.zip', '.rar']:
+    elif file_type in ['.zip', '.rar']:
         # Create a temporary directory for extracted files
         extract_dir = cached_path + "_extracted"
 
         if not os.path.exists(extract_dir):
             print(f"Extracting archive {cached_path} to {extract_dir}")
-            extract_zip_content(cached_path, extract_dir)
+            extract_zip_content(cached_path, extract_dir, file_type)
 
         # Process each file in the extracted directory
         text_content = ""
@@ -150,19 +183,27 @@ def process_attachment_file(attachment: Attachment, db: Session, base_url: str =
         for root, dirs, files in os.walk(extract_dir):
             for file in files:
                 file_path = os.path.join(root, file)
-                _, file_ext = os.path.splitext(file)
-                if file_ext:
-                    file_ext = file_ext.lower()  # Convert to lowercase, keeping the dot
+                # Archive members are sniffed like the attachment itself
+                member_type = resolve_file_type(file_path)
                 # Extract content from each file in the archive
-                file_text = extract_text_from_file(file_path)
+                if member_type in SPREADSHEET_EXTENSIONS:
+                    file_text, file_id_card, file_phone = scan_spreadsheet(file_path, member_type)
+                    streamed_id_card = streamed_id_card or file_id_card
+                    streamed_phone = streamed_phone or file_phone
+                elif member_type in PLAIN_TEXT_EXTENSIONS:
+                    file_text, file_id_card, file_phone = scan_plain_text(file_path)
+                    streamed_id_card = streamed_id_card or file_id_card
+                    streamed_phone = streamed_phone or file_phone
+                else:
+                    file_text = extract_text_from_file(file_path, member_type)
                 text_content += file_text + "\n"
 
-                if file_ext in ['.jpg', '.jpeg', '.png', '.bmp', '.gif', '.tiff', '.pdf']:
-                    file_ocr = extract_text_from_file(file_path)
+                if member_type in ['.jpg', '.png', '.bmp', '.gif', '.tiff', '.pdf']:
+                    file_ocr = extract_text_from_file(file_path, member_type)
                     ocr_content += file_ocr + "\n"
 
                     # Calculate OCR confidence for this file if it's an image/PDF
-                    if file_ext == '.pdf':
+                    if member_type == '.pdf':
                         from utils import extract_ocr_from_pdf_with_confidence, calculate_ocr_confidence_score
                         ocr_results = extract_ocr_from_pdf_with_confidence(file_path)
                         file_ocr_score = calculate_ocr_confidence_score(ocr_results)
@@ -173,6 +214,12 @@ def process_attachment_file(attachment: Attachment, db: Session, base_url: str =
 
                     if file_ocr_score is not None:
                         archive_ocr_scores.append(file_ocr_score)
+                elif member_type in OOXML_EXTENSIONS:
+                    # Pictures pasted into Office documents, e.g. scanned ID cards
+                    file_ocr, file_ocr_score = extract_ocr_from_embedded_images(file_path)
+                    ocr_content += file_ocr + "\n"
+                    if file_ocr_score is not None:
+                        archive_ocr_scores.append(file_ocr_score)
 
         # If we have multiple OCR scores from archive files, compute an average
         if archive_ocr_scores:
@@ -181,18 +228,27 @@ def process_attachment_file(attachment: Attachment, db: Session, base_url: str =
             combined_ocr_score = None
     else:
         # Extract content from the file directly
-        text_content = extract_text_from_file(cached_path)
+        if file_type in SPREADSHEET_EXTENSIONS:
+            text_content, streamed_id_card, streamed_phone = scan_spreadsheet(cached_path, file_type)
+        elif file_type in PLAIN_TEXT_EXTENSIONS:
+            text_content, streamed_id_card, streamed_phone = scan_plain_text(cached_path)
+        else:
+            text_content = extract_text_from_file(cached_path, file_type)
 
         # Determine if we need OCR content (for images and image-based PDFs)
         ocr_content = ""
-        if extracted_ext in ['.jpg', '.jpeg', '.png', '.bmp', '.gif', '.tiff', '.pdf']:
-            ocr_content = extract_text_from_file(cached_path)  # This will use OCR for images
+        if file_type in ['.jpg', '.png', '.bmp', '.gif', '.tiff', '.pdf']:
+            ocr_content = extract_text_from_file(cached_path, file_type)  # This will use OCR for images
+        elif file_type in OOXML_EXTENSIONS:
+            # Pictures pasted into Office documents, e.g. scanned ID cards
+            ocr_content, embedded_ocr_score = extract_ocr_from_embedded_images(cached_path)
 
     # Calculate OCR score if not in archive case
-    if extracted_ext.lstrip('.') not in ['.zip', '.rar']:
+    ocr_score = None
+    if file_type not in ['.zip', '.rar']:
         # For non-archive files, calculate the OCR confidence score for image types
-        if extracted_ext and extracted_ext.lstrip('.') in ['jpg', 'jpeg', 'png', 'bmp', 'gif', 'tiff', 'pdf']:
-            if extracted_ext.lstrip('.') in ['pdf']:
+        if file_type in ['.jpg', '.png', '.bmp', '.gif', '.tiff', '.pdf']:
+            if file_type == '.pdf':
                 # For PDFs, we need to get confidence scores from the PDF OCR process
                 from utils import extract_ocr_from_pdf_with_confidence, calculate_ocr_confidence_score
                 # For PDF files, we need to process each page/image and get confidence scores
@@ -203,36 +259,55 @@ def process_attachment_file(attachment: Attachment, db: Session, base_url: str =
                 from utils import extract_ocr_from_image_with_confidence, calculate_ocr_confidence_score
                 ocr_results = extract_ocr_from_image_with_confidence(cached_path)
                 ocr_score = calculate_ocr_confidence_score(ocr_results)
+        elif file_type in OOXML_EXTENSIONS:
+            ocr_score = embedded_ocr_score
     else:
         # For archive files, we already calculated this above
         ocr_score = combined_ocr_score
 
     # Process based on detection type
-    if detection_type == "ai" and settings.OPENAI_API_KEY:
+    if detection_type == "ai" and settings.OPENAI_API_KEY and file_type not in REJECTED_FILE_TYPES:
         # Use AI for content analysis
-        has_id_card_normal = contains_id_card(text_content) or contains_id_card(ocr_content)
-        has_phone_normal = contains_phone(text_content) or contains_phone(ocr_content)
+        has_id_card_normal = streamed_id_card or contains_id_card(text_content) or contains_id_card(ocr_content)
+        has_phone_normal = streamed_phone or contains_phone(text_content) or contains_phone(ocr_content)
 
         # Perform AI analysis
-        ai_has_id_card, ai_has_phone, ai_analysis = detect_sensitive_info_ai(text_content + " " + ocr_content)
+        # Image attachments are also sent to the vision model when enabled
+        image_path = cached_path if file_type in ['.jpg', '.png', '.bmp', '.gif', '.tiff'] else None
+        ai_has_id_card, ai_has_phone, ai_analysis, llm_usage, findings = detect_sensitive_info_ai(
+            text_content + " " + ocr_content, token_budget, image_path
+        )
 
         # Use AI results if they detect sensitive info, otherwise use normal detection
         has_id_card = ai_has_id_card or has_id_card_normal
         has_phone = ai_has_phone or has_phone_normal
         llm_content = ai_analysis
+        if llm_usage["skipped_chunks"]:
+            print(f"Attachment {attachment.id}: {llm_usage['skipped_chunks']} of {llm_usage['chunks'] + llm_usage['skipped_chunks']} content chunks not analysed, token budget exhausted")
     else:
         # Use normal detection
-        has_id_card = contains_id_card(text_content) or contains_id_card(ocr_content)
-        has_phone = contains_phone(text_content) or contains_phone(ocr_content)
+        has_id_card = streamed_id_card or contains_id_card(text_content) or contains_id_card(ocr_content)
+        has_phone = streamed_phone or contains_phone(text_content) or contains_phone(ocr_content)
         llm_content = ""
+        llm_usage = {"prompt_tokens": 0, "completion_tokens": 0}
+        findings = []
+
+    # Keep the previous flags so the per-site counters can be adjusted
+    old_has_id_card = attachment.has_id_card
+    old_has_phone = attachment.has_phone
 
     # Update the attachment in the database
-    attachment.text_content = text_content
-    attachment.ocr_content = ocr_content
-    attachment.llm_content = llm_content
+    store_attachment_texts(db, attachment, {
+        "text_content": text_content,
+        "ocr_content": ocr_content,
+        "llm_content": llm_content,
+    })
+    store_attachment_findings(db, attachment, findings)
     attachment.has_id_card = has_id_card
     attachment.has_phone = has_phone
     attachment.ocr_score = ocr_score  # Store the calculated OCR score
+    attachment.llm_prompt_tokens = llm_usage["prompt_tokens"]
+    attachment.llm_completion_tokens = llm_usage["completion_tokens"]
     from datetime import datetime
     attachment.processed_datetime = datetime.utcnow()  # Update the processed time
 
@@ -241,22 +316,68 @@ def process_attachment_file(attachment: Attachment, db: Session, base_url: str =
         attachment.manual_verified_sensitive = True
         attachment.verification_notes = f"Auto-detected: ID card={has_id_card}, Phone={has_phone}"
 
+    apply_detection_delta(db, attachment.site_id, old_has_id_card, old_has_phone, has_id_card, has_phone)
+
     db.commit()
-    print(f"Processed attachment {attachment.id}: ID card={has_id_card}, Phone={has_phone}, Manual verification required={has_id_card or has_phone}, File extension: {extracted_ext}, OCR Score: {ocr_score}")
+    bump_data_version()
+    print(f"Processed attachment {attachment.id}: ID card={has_id_card}, Phone={has_phone}, Manual verification required={has_id_card or has_phone}, File type: {file_type}, OCR Score: {ocr_score}")
 
     # Call progress callback if provided
     if progress_callback:
         progress_callback()
 
 
+def process_attachment_fast(attachment: Attachment, db: Session, cached_path: str, file_type: str, progress_callback=None):
+    """Fast detect-only processing: read the file only until every category of FAST_DETECT_CATEGORIES is found.
+
+    Only the flags of the requested categories are updated. The text read is
+    stored when FAST_DETECT_STORE_TEXT is set; OCR scores and AI results are
+    left as they are.
+    """
+    categories = fast_detect_categories()
+    found, texts, segments_read = detect_file_fast(cached_path, categories, keep_text=settings.FAST_DETECT_STORE_TEXT, file_type=file_type)
+
+    old_has_id_card = attachment.has_id_card
+    old_has_phone = attachment.has_phone
+    has_id_card = "id_card" in found if "id_card" in categories else bool(old_has_id_card)
+    has_phone = "phone" in found if "phone" in categories else bool(old_has_phone)
+
+    if texts is not None:
+        store_attachment_texts(db, attachment, texts)
+    attachment.has_id_card = has_id_card
+    attachment.has_phone = has_phone
+    from datetime import datetime
+    attachment.processed_datetime = datetime.utcnow()
+
+    if has_id_card or has_phone:
+        attachment.manual_verified_sensitive = True
+        attachment.verification_notes = f"Auto-detected: ID card={has_id_card}, Phone={has_phone}"
+
+    apply_detection_delta(db, attachment.site_id, old_has_id_card, old_has_phone, has_id_card, has_phone)
+
+    db.commit()
+    bump_data_version()
+    print(f"Fast-detected attachment {attachment.id}: ID card={has_id_card}, Phone={has_phone}, File type: {file_type}, Segments read: {segments_read}")
+
+    if progress_callback:
+        progress_callback()
+
+
 def process_site_attachments_with_progress(site_owner: str, db: Session, detection_type: str = "normal", ws_id: str = None):
     """
-    Process all attachments for a site with progress updates
+    Process all attachments for a site with progress updates.
+
+    AI detection is bound by LLM latency, so it processes up to
+    LLM_MAX_CONCURRENCY attachments in parallel, each with its own session.
+    Normal detection runs serially.
     """
     # Get all attachments for the site
-    attachments = db.query(Attachment).filter(Attachment.site_id == site_owner).all()
+    attachment_ids = [
+        attachment_id for (attachment_id,) in
+        db.query(Attachment.id).filter(Attachment.site_id == site_owner, Attachment.is_deleted.isnot(True)).order_by(Attachment.id)
+    ]
 
-    total_attachments = len(attachments)
+    total_attachments = len(attachment_ids)
 
     # Send initial progress
     if ws_id:
@@ -264,24 +385,30 @@ def process_site_attachments_with_progress(site_owner: str, db: Session, detecti
 
     processed_count = 0
     sensitive_count = 0
+    # Shared by all attachments of the job, so LLM_JOB_TOKEN_BUDGET caps the whole site
+    token_budget = TokenBudget(settings.LLM_JOB_TOKEN_BUDGET)
 
-    for i, attachment in enumerate(attachments, 1):
-        try:
-            # Process the attachment
-            process_attachment_file(
-                attachment,
-                db,
-                base_url=settings.ATTACHMENT_DEFAULT_BASE_URL,
-                detection_type=detection_type
-            )
+    if detection_type == "ai" and settings.OPENAI_API_KEY:
+        executor = ThreadPoolExecutor(max_workers=settings.LLM_MAX_CONCURRENCY, thread_name_prefix="ai_detect")
+        futures = [
+            executor.submit(process_attachment_by_id, attachment_id, detection_type, None, token_budget)
+            for attachment_id in attachment_ids
+        ]
+        results = (future.result() for future in as_completed(futures))
+    else:
+        executor = None
+        results = (process_attachment_by_id(attachment_id, detection_type, db) for attachment_id in attachment_ids)
 
+    try:
+        for processed, sensitive in results:
+            if not processed:
+                continue
+            processed_count += 1
             # Count attachments that were marked as containing sensitive info
-            if attachment.has_id_card or attachment.has_phone:
+            if sensitive:
                 sensitive_count += 1
 
-            processed_count += 1
-
-            # Send progress update
+            # Send progress update (from this thread, which owns the WebSocket loop)
             if ws_id:
                 update_progress(
                     ws_id,
@@ -289,10 +416,9 @@ def process_site_attachments_with_progress(site_owner: str, db: Session, detecti
                     total_attachments,
                     f"Processing attachment {processed_count}/{total_attachments}..."
                 )
-
-        except Exception as e:
-            print(f"Error processing attachment {attachment.id}: {str(e)}")
-            continue
+    finally:
+        if executor:
+            executor.shutdown(wait=True)
 
     # Send final progress
     if ws_id:
@@ -306,16 +432,46 @@ def process_site_attachments_with_progress(site_owner: str, db: Session, detecti
     return {
         "message": f"Detected {processed_count} attachments for site {site_owner}, {sensitive_count} with sensitive info",
         "processed_count": processed_count,
-        "sensitive_count": sensitive_count
+        "sensitive_count": sensitive_count,
+        "llm_tokens": token_budget.used
     }
 
 
+def process_attachment_by_id(attachment_id: int, detection_type: str = "normal", db: Session = None, token_budget=None):
+    """Process one attachment and return (processed, sensitive).
+
+    Without a session one is opened for the call, so this can run in a worker thread.
+    """
+    own_session = db is None
+    if own_session:
+        db = SessionLocal()
+    try:
+        attachment = db.get(Attachment, attachment_id)
+        if attachment is None:
+            return False, False
+        process_attachment_file(
+            attachment,
+            db,
+            base_url=settings.ATTACHMENT_DEFAULT_BASE_URL,
+            detection_type=detection_type,
+            token_budget=token_budget
+        )
+        return True, bool(attachment.has_id_card or attachment.has_phone)
+    except Exception as e:
+        print(f"Error processing attachment {attachment_id}: {str(e)}")
+        db.rollback()
+        return False, False
+    finally:
+        if own_session:
+            db.close()
+
+
 def download_site_attachments_simple(site_owner: str, db: Session):
     """
     Download all attachments for a site without progress tracking
     """
     # Get all attachments for the site
-    attachments = db.query(Attachment).filter(Attachment.site_id == site_owner).all()
+    attachments = db.query(Attachment).filter(Attachment.site_id == site_owner, Attachment.is_deleted.isnot(True)).all()
 
     total_attachments = len(attachments)
     downloaded_count = 0
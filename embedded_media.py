@@ -0,0 +1,59 @@
+"""Images embedded in DOCX, PPTX and XLSX files.
+
+Office Open XML files are zip archives that keep pasted pictures as separate
+parts under word/media/, ppt/media/ and xl/media/. The raster ones are
+copied out, without converting the document, so they can go through OCR
+like image attachments. Pictures repeated in a document (a logo on every
+slide) are copied once, identified by the hash of their bytes.
+"""
+import hashlib
+import os
+import tempfile
+import zipfile
+
+from config import settings
+
+
+OOXML_EXTENSIONS = (".docx", ".pptx", ".xlsx")
+
+MEDIA_DIRECTORIES = ("word/media/", "ppt/media/", "xl/media/")
+
+# EMF and WMF drawings are skipped, Pillow cannot read them on every platform
+RASTER_EXTENSIONS = (".png", ".jpg", ".jpeg", ".gif", ".bmp", ".tif", ".tiff", ".webp")
+
+
+def _media_dir():
+    return os.path.join(settings.ATTACHMENT_CACHE_DIR, ".embedded_media")
+
+
+def extract_embedded_images(document_path):
+    """Paths of the distinct raster images embedded in an OOXML document, at most OCR_EMBEDDED_MAX_IMAGES"""
+    paths = []
+    seen = set()
+    try:
+        with zipfile.ZipFile(document_path) as archive:
+            for info in archive.infolist():
+                name = info.filename
+                _, ext = os.path.splitext(name.lower())
+                if not name.startswith(MEDIA_DIRECTORIES) or ext not in RASTER_EXTENSIONS:
+                    continue
+                if len(paths) >= settings.OCR_EMBEDDED_MAX_IMAGES:
+                    print(f"Only the first {settings.OCR_EMBEDDED_MAX_IMAGES} embedded images of {document_path} are OCR'd")
+                    break
+                data = archive.read(info)
+                digest = hashlib.sha256(data).hexdigest()
+                if digest in seen:
+                    continue
+                seen.add(digest)
+
+                path = os.path.join(_media_dir(), digest + ext)
+                if not os.path.exists(path):
+                    os.makedirs(_media_dir(), exist_ok=True)
+                    # Documents are processed concurrently, so every writer gets its own temporary file
+                    with tempfile.NamedTemporaryFile(dir=_media_dir(), suffix=".tmp", delete=False) as f:
+                        f.write(data)
+                    os.replace(f.name, path)
+                paths.append(path)
+    except (zipfile.BadZipFile, OSError) as e:
+        print(f"Error reading embedded images from {document_path}: {str(e)}")
+    return paths
@@ -0,0 +1,105 @@
+import csv
+import io
+import json
+import os
+import tempfile
+from datetime import datetime
+
+# Columns written by the attachment exports, in order
+EXPORT_COLUMNS = [
+    "id",
+    "site_id",
+    "site_name",
+    "site_domain",
+    "show_name",
+    "file_path",
+    "url_path",
+    "file_ext",
+    "create_date",
+    "has_id_card",
+    "has_phone",
+    "manual_verified_sensitive",
+    "verification_notes",
+    "processed_datetime",
+    "ocr_score",
+    "is_deleted",
+]
+
+# Number of rows buffered before a chunk is sent to the client
+EXPORT_CHUNK_ROWS = 1000
+
+EXPORT_MEDIA_TYPES = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+}
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+def iter_csv(rows):
+    """Yield CSV chunks for the given rows, starting with a header line"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    # BOM so that Excel detects UTF-8 for Chinese file names
+    buffer.write("\ufeff")
+    writer.writerow(EXPORT_COLUMNS)
+
+    for count, row in enumerate(rows, 1):
+        writer.writerow(["" if value is None else value for value in row])
+        if count % EXPORT_CHUNK_ROWS == 0:
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate(0)
+
+    yield buffer.getvalue().encode("utf-8")
+
+
+def iter_ndjson(rows):
+    """Yield newline delimited JSON chunks, one object per row"""
+    lines = []
+    for row in rows:
+        lines.append(json.dumps(dict(zip(EXPORT_COLUMNS, row)), ensure_ascii=False, default=_json_default))
+        if len(lines) >= EXPORT_CHUNK_ROWS:
+            yield ("\n".join(lines) + "\n").encode("utf-8")
+            lines = []
+
+    if lines:
+        yield ("\n".join(lines) + "\n").encode("utf-8")
+
+
+def iter_xlsx(rows, chunk_size=65536):
+    """Write rows to a workbook in openpyxl write-only mode and yield the file in chunks.
+
+    Write-only mode streams rows to disk, so memory stays constant; the file is
+    sent once the workbook is complete because XLSX is a zip archive.
+    """
+    from openpyxl import Workbook
+    from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet("attachments")
+    sheet.append(EXPORT_COLUMNS)
+    for row in rows:
+        sheet.append([ILLEGAL_CHARACTERS_RE.sub("", value) if isinstance(value, str) else value for value in row])
+
+    fd, path = tempfile.mkstemp(suffix=".xlsx")
+    os.close(fd)
+    try:
+        workbook.save(path)
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(chunk_size), b""):
+                yield chunk
+    finally:
+        os.unlink(path)
+
+
+EXPORT_WRITERS = {
+    "csv": iter_csv,
+    "ndjson": iter_ndjson,
+    "xlsx": iter_xlsx,
+}
@@ -0,0 +1,173 @@
+"""File type sniffing from magic bytes.
+
+Attachments are often misnamed: a .doc that is really a .docx, a .jpg that
+is a PNG, or an HTML error page saved under the attachment's name. The type
+is therefore taken from the file's first bytes, with the extension only as a
+fallback for content without a recognisable signature. Empty files and HTML
+pages are rejected before any parser sees them.
+
+Types are extensions (".pdf", ".docx", ...), so they key the extractor
+registry in utils directly, plus "empty" and "html" for rejected files.
+"""
+import codecs
+import os
+import zipfile
+from collections import Counter
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from models import Attachment
+
+
+SNIFF_BYTES = 8192
+
+EMPTY = "empty"
+HTML = "html"
+REJECTED_FILE_TYPES = (EMPTY, HTML)
+
+MAGIC_SIGNATURES = (
+    (b"%PDF-", ".pdf"),
+    (b"\x89PNG\r\n\x1a\n", ".png"),
+    (b"\xff\xd8\xff", ".jpg"),
+    (b"GIF87a", ".gif"),
+    (b"GIF89a", ".gif"),
+    (b"II*\x00", ".tiff"),
+    (b"MM\x00*", ".tiff"),
+    (b"BM", ".bmp"),
+    (b"Rar!\x1a\x07", ".rar"),
+)
+
+# Types that are the same format under another name
+EQUIVALENT_TYPES = {".jpeg": ".jpg", ".tif": ".tiff"}
+
+OLE2_SIGNATURE = b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1"
+
+# Stream names (UTF-16) identifying the application of an OLE2 compound file
+OLE2_STREAMS = (
+    ("WordDocument".encode("utf-16-le"), ".doc"),
+    ("Workbook".encode("utf-16-le"), ".xls"),
+    ("Book".encode("utf-16-le"), ".xls"),
+    ("PowerPoint Document".encode("utf-16-le"), ".ppt"),
+)
+
+# Bytes of an OLE2 file searched for stream names; directory sectors usually come early
+OLE2_SEARCH_BYTES = 1048576
+
+# Zip parts identifying Office Open XML documents
+OOXML_PARTS = (
+    ("word/document.xml", ".docx"),
+    ("xl/workbook.xml", ".xlsx"),
+    ("ppt/presentation.xml", ".pptx"),
+)
+
+HTML_MARKERS = (b"<!doctype html", b"<html", b"<head", b"<body", b"<title")
+
+TEXT_TYPES = (".txt", ".csv", ".log")
+
+
+def normalise_type(file_type):
+    file_type = (file_type or "").lower()
+    return EQUIVALENT_TYPES.get(file_type, file_type)
+
+
+def _sniff_zip(path):
+    try:
+        with zipfile.ZipFile(path) as archive:
+            names = set(archive.namelist())
+    except (zipfile.BadZipFile, OSError):
+        return None
+    for part, file_type in OOXML_PARTS:
+        if part in names:
+            return file_type
+    return ".zip"
+
+
+def _sniff_ole2(path, declared_type):
+    # A declared Office type is trusted, as finding the directory sector needs a full parser
+    if declared_type in (".doc", ".xls", ".ppt"):
+        return declared_type
+    with open(path, "rb") as f:
+        data = f.read(OLE2_SEARCH_BYTES)
+    for stream_name, file_type in OLE2_STREAMS:
+        if stream_name in data:
+            return file_type
+    return None
+
+
+def _looks_like_text(head):
+    if b"\x00" in head:
+        return False
+    for encoding in ("utf-8", "gb18030"):
+        try:
+            # Not final: the sample may end inside a multi-byte character
+            codecs.getincrementaldecoder(encoding)().decode(head, final=False)
+            return True
+        except UnicodeDecodeError:
+            continue
+    return False
+
+
+def sniff_file_type(path, declared_type=None):
+    """The type of a file from its content, or None when the content has no known signature"""
+    declared_type = normalise_type(declared_type)
+    if os.path.getsize(path) == 0:
+        return EMPTY
+    with open(path, "rb") as f:
+        head = f.read(SNIFF_BYTES)
+
+    for signature, file_type in MAGIC_SIGNATURES:
+        if head.startswith(signature):
+            return file_type
+    if head.startswith(b"RIFF") and head[8:12] == b"WEBP":
+        return ".webp"
+    if head.startswith(b"PK\x03\x04") or head.startswith(b"PK\x05\x06"):
+        return _sniff_zip(path)
+    if head.startswith(OLE2_SIGNATURE):
+        return _sniff_ole2(path, declared_type)
+    # Some PDF writers put junk before the header
+    if b"%PDF-" in head[:1024]:
+        return ".pdf"
+
+    start = head.lstrip(b"\xef\xbb\xbf \t\r\n").lower()
+    if start.startswith(b"<?xml"):
+        start = start[start.find(b"?>") + 2:].lstrip()
+    if start.startswith(HTML_MARKERS):
+        return HTML
+    if _looks_like_text(head):
+        return declared_type if declared_type in TEXT_TYPES else ".txt"
+    return None
+
+
+def resolve_file_type(path, declared_type=None):
+    """The sniffed type of a file, else its declared type, else the extension of its path"""
+    if not declared_type:
+        _, declared_type = os.path.splitext(path)
+    try:
+        sniffed = sniff_file_type(path, declared_type)
+    except OSError as e:
+        print(f"Could not sniff the type of {path}: {str(e)}")
+        sniffed = None
+    return sniffed or normalise_type(declared_type)
+
+
+def file_type_mismatches(db: Session, site_owner=None):
+    """Counts of processed attachments whose sniffed type differs from their extension, per pair of types"""
+    query = db.query(
+        Attachment.file_ext,
+        Attachment.detected_file_type,
+        func.count(Attachment.id),
+    ).filter(Attachment.detected_file_type.isnot(None), Attachment.is_deleted.isnot(True))
+    if site_owner is not None:
+        query = query.filter(Attachment.site_id == str(site_owner))
+
+    # Extensions differ in case and spelling (.JPG, .jpeg), so they are compared normalised
+    counts = Counter()
+    for file_ext, detected_file_type, count in query.group_by(Attachment.file_ext, Attachment.detected_file_type):
+        declared_type = normalise_type(file_ext)
+        if declared_type != detected_file_type:
+            counts[declared_type, detected_file_type] += count
+    return [
+        {"declared_type": declared_type, "detected_type": detected_type, "attachments": count}
+        for (declared_type, detected_type), count in counts.most_common()
+    ]
@@ -0,0 +1,155 @@
+"""Image preparation for vision LLM requests.
+
+Scans and photos are sent to the vision model downscaled so their longer
+side is at most LLM_IMAGE_MAX_DIMENSION and re-encoded as JPEG or WebP at
+LLM_IMAGE_QUALITY. Images taller (or wider) than LLM_IMAGE_MAX_ASPECT times
+their other side, such as long screenshots, are cut into overlapping tiles
+first, so downscaling does not make their text unreadable.
+
+Prepared tiles are cached on disk under the attachment cache, keyed by a
+hash of the image bytes and the preparation settings.
+"""
+import base64
+import hashlib
+import json
+import os
+import tempfile
+from io import BytesIO
+
+from PIL import Image, ImageOps
+
+from config import settings
+
+
+MIME_TYPES = {"jpeg": "image/jpeg", "webp": "image/webp"}
+
+# Fraction of a tile repeated at the start of the next one, so text cut at a boundary appears whole once
+TILE_OVERLAP = 0.05
+
+
+class PreparedImage:
+    """Encoded tiles of one image, top to bottom (or left to right)"""
+
+    def __init__(self, digest, mime_type, tiles):
+        self.digest = digest  # Identifies the image and the preparation settings
+        self.mime_type = mime_type
+        self.tiles = tiles  # List of (width, height, encoded bytes)
+
+    @property
+    def size(self):
+        return sum(len(data) for _, _, data in self.tiles)
+
+    def data_urls(self):
+        return [
+            f"data:{self.mime_type};base64,{base64.b64encode(data).decode('ascii')}"
+            for _, _, data in self.tiles
+        ]
+
+    def estimated_tokens(self):
+        """Vision token estimate: 85 per tile plus 170 per 512px square"""
+        return sum(85 + 170 * -(-width // 512) * -(-height // 512) for width, height, _ in self.tiles)
+
+
+def _image_format():
+    image_format = settings.LLM_IMAGE_FORMAT.lower()
+    return image_format if image_format in MIME_TYPES else "jpeg"
+
+
+def _cache_key(image_bytes):
+    options = f"{settings.LLM_IMAGE_MAX_DIMENSION}:{_image_format()}:{settings.LLM_IMAGE_QUALITY}:{settings.LLM_IMAGE_MAX_ASPECT}:{settings.LLM_IMAGE_MAX_TILES}"
+    return hashlib.sha256(image_bytes + options.encode()).hexdigest()
+
+
+def _cache_dir():
+    return os.path.join(settings.ATTACHMENT_CACHE_DIR, ".llm_images")
+
+
+def _load_cached(digest, mime_type):
+    manifest_path = os.path.join(_cache_dir(), f"{digest}.json")
+    if not os.path.exists(manifest_path):
+        return None
+    try:
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        tiles = []
+        for tile in manifest["tiles"]:
+            with open(os.path.join(_cache_dir(), tile["file"]), "rb") as f:
+                tiles.append((tile["width"], tile["height"], f.read()))
+    except (OSError, ValueError, KeyError):
+        return None
+    return PreparedImage(digest, mime_type, tiles)
+
+
+def _store_cached(prepared, extension):
+    os.makedirs(_cache_dir(), exist_ok=True)
+    manifest = {"tiles": []}
+    # Files are written under temporary names and renamed, as the same image can be prepared concurrently
+    for i, (width, height, data) in enumerate(prepared.tiles):
+        name = f"{prepared.digest}_{i}.{extension}"
+        with tempfile.NamedTemporaryFile(dir=_cache_dir(), suffix=".tmp", delete=False) as f:
+            f.write(data)
+        os.replace(f.name, os.path.join(_cache_dir(), name))
+        manifest["tiles"].append({"file": name, "width": width, "height": height})
+    # The manifest is written last, so a partly written entry is never read
+    with tempfile.NamedTemporaryFile("w", dir=_cache_dir(), suffix=".tmp", delete=False) as f:
+        json.dump(manifest, f)
+    os.replace(f.name, os.path.join(_cache_dir(), f"{prepared.digest}.json"))
+
+
+def split_tiles(image, max_aspect, max_tiles):
+    """Cut an image much longer than wide (or wider than long) into overlapping tiles"""
+    width, height = image.size
+    vertical = height >= width
+    long_side, short_side = (height, width) if vertical else (width, height)
+    if long_side <= short_side * max_aspect or max_tiles <= 1:
+        return [image]
+
+    count = min(max_tiles, -(-long_side // int(short_side * max_aspect)))
+    tile_length = -(-long_side // count)
+    overlap = int(tile_length * TILE_OVERLAP)
+    tiles = []
+    for i in range(count):
+        start = max(0, i * tile_length - overlap)
+        end = min(long_side, (i + 1) * tile_length)
+        box = (0, start, width, end) if vertical else (start, 0, end, height)
+        tiles.append(image.crop(box))
+    return tiles
+
+
+def to_rgb(image):
+    image = ImageOps.exif_transpose(image)
+    if image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info):
+        # Transparent areas become white instead of black
+        image = image.convert("RGBA")
+        background = Image.new("RGB", image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel("A"))
+        return background
+    return image.convert("RGB")
+
+
+def prepare_image(image_path):
+    """Return the PreparedImage of an image file, from the cache when it was prepared before"""
+    with open(image_path, "rb") as f:
+        image_bytes = f.read()
+    image_format = _image_format()
+    digest = _cache_key(image_bytes)
+    cached = _load_cached(digest, MIME_TYPES[image_format])
+    if cached is not None:
+        return cached
+
+    with Image.open(image_path) as image:
+        # Only the first frame of animated or multi-page images
+        image = to_rgb(image)
+    tiles = []
+    for tile in split_tiles(image, settings.LLM_IMAGE_MAX_ASPECT, settings.LLM_IMAGE_MAX_TILES):
+        tile.thumbnail((settings.LLM_IMAGE_MAX_DIMENSION, settings.LLM_IMAGE_MAX_DIMENSION), Image.LANCZOS)
+        buffer = BytesIO()
+        tile.save(buffer, format=image_format.upper(), quality=settings.LLM_IMAGE_QUALITY)
+        tiles.append((tile.width, tile.height, buffer.getvalue()))
+
+    prepared = PreparedImage(digest, MIME_TYPES[image_format], tiles)
+    try:
+        _store_cached(prepared, image_format)
+    except OSError as e:
+        print(f"Could not cache prepared image for {image_path}: {str(e)}")
+    return prepared
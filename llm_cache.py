@@ -0,0 +1,192 @@
+"""Persistent cache of LLM responses.
+
+Reprocessing an attachment whose content did not change would send the same
+request to the LLM again. Responses are stored in the llm_cache table, keyed
+by a hash of the normalised content, the prompt, the model and max_tokens, so
+changing PROMPTS or MODEL naturally misses. Entries expire after
+LLM_CACHE_TTL_DAYS and the least recently used entries beyond
+LLM_CACHE_MAX_ENTRIES are evicted.
+
+The cache uses its own short sessions, so it can be called from detection
+worker threads without touching the caller's transaction.
+"""
+import hashlib
+import json
+import logging
+import threading
+import unicodedata
+from datetime import datetime, timedelta
+
+from config import settings
+from models import LLMCacheEntry, SessionLocal
+
+logger = logging.getLogger(__name__)
+
+
+# Size eviction runs once per this many stored entries
+EVICTION_INTERVAL = 100
+
+
+def normalize_content(content):
+    """Content with insignificant differences removed: Unicode form, line endings, surrounding and blank lines"""
+    content = unicodedata.normalize("NFC", content or "")
+    lines = (line.strip() for line in content.splitlines())
+    return "\n".join(line for line in lines if line)
+
+
+def cache_key(content, prompt, model, max_tokens):
+    payload = json.dumps([normalize_content(content), prompt, model, max_tokens], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class LLMResultCache:
+    def __init__(self, session_factory=SessionLocal):
+        self.session_factory = session_factory
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evicted = 0
+        self.stores = 0
+
+    def get(self, key):
+        """Return the cached response for key, or None"""
+        db = self.session_factory()
+        try:
+            entry = db.get(LLMCacheEntry, key)
+            now = datetime.utcnow()
+            if entry is not None and self._is_expired(entry, now):
+                db.delete(entry)
+                db.commit()
+                with self.lock:
+                    self.expired += 1
+                entry = None
+            if entry is None:
+                with self.lock:
+                    self.misses += 1
+                return None
+
+            response = entry.response
+            entry.hits += 1
+            entry.last_used_datetime = now
+            db.commit()
+            with self.lock:
+                self.hits += 1
+            return response
+        finally:
+            db.close()
+
+    def put(self, key, model, response):
+        db = self.session_factory()
+        try:
+            now = datetime.utcnow()
+            entry = db.get(LLMCacheEntry, key)
+            if entry is None:
+                entry = LLMCacheEntry(key=key, hits=0)
+                db.add(entry)
+            entry.model = model
+            entry.response = response
+            entry.created_datetime = now
+            entry.last_used_datetime = now
+            db.commit()
+        finally:
+            db.close()
+
+        with self.lock:
+            self.stores += 1
+            evict = self.stores % EVICTION_INTERVAL == 1
+        if evict:
+            self.evict()
+
+    def get_or_compute(self, content, prompt, model, max_tokens, compute):
+        """Return the cached response, or compute() and cache it when non-empty"""
+        if not settings.LLM_CACHE_ENABLED:
+            return compute()
+        key = cache_key(content, prompt, model, max_tokens)
+        try:
+            response = self.get(key)
+        except Exception as e:
+            logger.warning(f"LLM cache lookup failed: {str(e)}")
+            response = None
+        if response is not None:
+            return response
+
+        response = compute()
+        # Empty responses are failures, they should be retried next time
+        if response:
+            try:
+                self.put(key, model, response)
+            except Exception as e:
+                logger.warning(f"LLM cache store failed: {str(e)}")
+        return response
+
+    def evict(self):
+        """Delete expired entries and the least recently used beyond LLM_CACHE_MAX_ENTRIES"""
+        db = self.session_factory()
+        try:
+            removed = 0
+            if settings.LLM_CACHE_TTL_DAYS > 0:
+                cutoff = datetime.utcnow() - timedelta(days=settings.LLM_CACHE_TTL_DAYS)
+                removed += db.query(LLMCacheEntry).filter(
+                    LLMCacheEntry.created_datetime < cutoff
+                ).delete(synchronize_session=False)
+
+            excess = db.query(LLMCacheEntry).count() - settings.LLM_CACHE_MAX_ENTRIES
+            if excess > 0:
+                oldest = [
+                    key for (key,) in
+                    db.query(LLMCacheEntry.key).order_by(LLMCacheEntry.last_used_datetime).limit(excess)
+                ]
+                for start in range(0, len(oldest), 500):
+                    removed += db.query(LLMCacheEntry).filter(
+                        LLMCacheEntry.key.in_(oldest[start:start + 500])
+                    ).delete(synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+
+        if removed:
+            logger.info(f"Evicted {removed} LLM cache entries")
+            with self.lock:
+                self.evicted += removed
+        return removed
+
+    def clear(self):
+        db = self.session_factory()
+        try:
+            removed = db.query(LLMCacheEntry).delete(synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+        with self.lock:
+            self.evicted += removed
+        return removed
+
+    def stats(self):
+        """Hit-rate counters since startup plus the size of the persistent cache"""
+        db = self.session_factory()
+        try:
+            entries = db.query(LLMCacheEntry).count()
+        finally:
+            db.close()
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": settings.LLM_CACHE_ENABLED,
+                "entries": entries,
+                "max_entries": settings.LLM_CACHE_MAX_ENTRIES,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "expired": self.expired,
+                "evicted": self.evicted,
+            }
+
+    @staticmethod
+    def _is_expired(entry, now):
+        if settings.LLM_CACHE_TTL_DAYS <= 0 or entry.created_datetime is None:
+            return False
+        return entry.created_datetime < now - timedelta(days=settings.LLM_CACHE_TTL_DAYS)
+
+
+llm_cache = LLMResultCache()
@@ -0,0 +1,158 @@
+"""Pooled client for the OpenAI-compatible chat completions API.
+
+A single requests.Session keeps connections to the API alive. Every request
+has connect/read timeouts, is retried with exponential backoff and jitter on
+429, 5xx and connection errors (honouring Retry-After), waits for a slot among
+LLM_MAX_CONCURRENCY in-flight requests and for a token of a token-bucket rate
+limit of LLM_REQUESTS_PER_MINUTE.
+"""
+import logging
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class LLMError(Exception):
+    """A chat completion failed after all retries"""
+
+
+class TokenBucket:
+    """Allow rate requests per second on average, with bursts of up to capacity"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class TokenBudget:
+    """Tokens a detection job may spend on LLM requests, with no limit when limit is 0"""
+
+    def __init__(self, limit=0):
+        self.limit = limit
+        self.used = 0
+        self.lock = threading.Lock()
+
+    def reserve(self, tokens):
+        """Count tokens against the budget, or return False when they do not fit"""
+        with self.lock:
+            if self.limit and self.used + tokens > self.limit:
+                return False
+            self.used += tokens
+            return True
+
+    def adjust(self, tokens):
+        """Correct a reservation by the difference to the actual usage"""
+        with self.lock:
+            self.used += tokens
+
+
+class LLMClient:
+    def __init__(self, base_url=None, api_key=None, max_concurrency=None, requests_per_minute=None):
+        self.base_url = (base_url or settings.OPENAI_BASE_URL).rstrip("/")
+        self.api_key = api_key if api_key is not None else settings.OPENAI_API_KEY
+        max_concurrency = max_concurrency or settings.LLM_MAX_CONCURRENCY
+        requests_per_minute = settings.LLM_REQUESTS_PER_MINUTE if requests_per_minute is None else requests_per_minute
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_concurrency)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.slots = threading.BoundedSemaphore(max_concurrency)
+        # Bursts of up to one request per concurrent slot
+        self.bucket = TokenBucket(requests_per_minute / 60, max_concurrency) if requests_per_minute > 0 else None
+
+    def chat_completion(self, messages, max_tokens=500, **options):
+        """Return the JSON response of a chat completion, raising LLMError on failure"""
+        payload = {"model": settings.MODEL, "messages": messages, "max_tokens": max_tokens, **options}
+        headers = {"Content-Type": "application/json", "Authorization": f"Bearer {self.api_key}"}
+        timeout = (settings.LLM_CONNECT_TIMEOUT, settings.LLM_READ_TIMEOUT)
+
+        last_error = None
+        for attempt in range(settings.LLM_MAX_RETRIES + 1):
+            if attempt:
+                self._backoff(attempt, last_error)
+            if self.bucket:
+                self.bucket.acquire()
+            try:
+                with self.slots:
+                    response = self.session.post(
+                        self.base_url + "/chat/completions", headers=headers, json=payload, timeout=timeout
+                    )
+            except (requests.ConnectionError, requests.Timeout) as e:
+                last_error = e
+                logger.warning(f"LLM request failed (attempt {attempt + 1}): {str(e)}")
+                continue
+
+            if response.status_code in RETRY_STATUS_CODES:
+                last_error = response
+                logger.warning(f"LLM request returned {response.status_code} (attempt {attempt + 1})")
+                continue
+            if response.status_code >= 400:
+                raise LLMError(f"LLM request returned {response.status_code}: {response.text[:200]}")
+            return response.json()
+
+        if isinstance(last_error, requests.Response):
+            raise LLMError(f"LLM request returned {last_error.status_code} after {settings.LLM_MAX_RETRIES + 1} attempts")
+        raise LLMError(f"LLM request failed after {settings.LLM_MAX_RETRIES + 1} attempts: {str(last_error)}")
+
+    @staticmethod
+    def _backoff(attempt, last_error):
+        delay = min(settings.LLM_BACKOFF_MAX, settings.LLM_BACKOFF_BASE * 2 ** (attempt - 1))
+        delay *= random.uniform(0.5, 1.0)
+        if isinstance(last_error, requests.Response):
+            retry_after = last_error.headers.get("Retry-After")
+            if retry_after:
+                try:
+                    delay = min(settings.LLM_BACKOFF_MAX, max(delay, float(retry_after)))
+                except ValueError:
+                    pass
+        time.sleep(delay)
+
+    def close(self):
+        self.session.close()
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_llm_client():
+    """Return the shared client, created on first use"""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = LLMClient()
+        return _client
+
+
+def close_llm_client():
+    global _client
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+            _client = None
@@ -0,0 +1,126 @@
+"""Candidate windows and token-budgeted chunks for LLM content analysis.
+
+Long documents are not sent to the LLM whole. Only windows of text around
+regex candidates (ID card and phone number patterns) and suspicious keywords
+are kept, overlapping windows are merged, and the windows are packed into
+chunks of at most LLM_CHUNK_TOKENS estimated tokens. Chunks beyond
+LLM_ATTACHMENT_TOKEN_BUDGET are dropped.
+"""
+import re
+
+from config import settings
+
+
+# Lowercase keywords that point at personal data next to them
+CANDIDATE_KEYWORDS = (
+    "身份证", "证件号", "护照", "电话", "手机", "联系方式", "住址", "银行卡",
+    "id card", "identity", "passport", "phone", "mobile", "tel:", "address",
+)
+
+WINDOW_SEPARATOR = "\n...\n"
+
+CJK_PATTERN = re.compile(r"[\u3000-\u303f\u3400-\u9fff\uff00-\uffef]")
+
+
+def estimate_tokens(text):
+    """Rough token count: one per CJK character, one per four other characters"""
+    if not text:
+        return 0
+    cjk = len(CJK_PATTERN.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def candidate_windows(text, patterns, keywords=CANDIDATE_KEYWORDS, window_chars=None):
+    """Merged windows of text around pattern matches and keywords, in document order"""
+    window_chars = settings.LLM_WINDOW_CHARS if window_chars is None else window_chars
+    spans = []
+    for pattern in patterns:
+        spans.extend(match.span() for match in re.finditer(pattern, text))
+    lowered = text.lower()
+    for keyword in keywords:
+        start = lowered.find(keyword)
+        while start != -1:
+            spans.append((start, start + len(keyword)))
+            start = lowered.find(keyword, start + len(keyword))
+    if not spans:
+        return []
+
+    windows = []
+    for start, end in sorted(spans):
+        start = max(0, start - window_chars)
+        end = min(len(text), end + window_chars)
+        if windows and start <= windows[-1][1]:
+            windows[-1][1] = max(windows[-1][1], end)
+        else:
+            windows.append([start, end])
+    return [text[start:end].strip() for start, end in windows]
+
+
+def _split_piece(piece, max_tokens):
+    """Split a piece longer than max_tokens at line breaks, or hard at the character limit"""
+    parts = []
+    current = ""
+    for line in piece.splitlines(keepends=True):
+        # A single overlong line is cut hard; CJK text can be one token per character
+        while estimate_tokens(line) > max_tokens:
+            if current:
+                parts.append(current)
+                current = ""
+            parts.append(line[:max_tokens])
+            line = line[max_tokens:]
+        if current and estimate_tokens(current + line) > max_tokens:
+            parts.append(current)
+            current = ""
+        current += line
+    if current:
+        parts.append(current)
+    return parts
+
+
+def pack_chunks(pieces, max_tokens):
+    """Pack pieces of text into chunks of at most max_tokens estimated tokens"""
+    chunks = []
+    current = []
+    current_tokens = 0
+    separator_tokens = estimate_tokens(WINDOW_SEPARATOR)
+    for piece in pieces:
+        for part in _split_piece(piece, max_tokens) if estimate_tokens(piece) > max_tokens else [piece]:
+            tokens = estimate_tokens(part)
+            if current and current_tokens + separator_tokens + tokens > max_tokens:
+                chunks.append(WINDOW_SEPARATOR.join(current))
+                current = []
+                current_tokens = 0
+            current.append(part)
+            current_tokens += tokens + (separator_tokens if len(current) > 1 else 0)
+    if current:
+        chunks.append(WINDOW_SEPARATOR.join(current))
+    return chunks
+
+
+def build_prompt_chunks(content, patterns):
+    """Return (chunks to analyse, number of chunks dropped by the per-attachment budget).
+
+    Content that fits into one chunk is sent whole. Longer content is reduced
+    to candidate windows; without any candidate there is nothing to send. The
+    first chunk is always kept, even when it alone exceeds the budget.
+    """
+    content = (content or "").strip()
+    if not content:
+        return [], 0
+    if estimate_tokens(content) <= settings.LLM_CHUNK_TOKENS:
+        chunks = [content]
+    else:
+        chunks = pack_chunks(candidate_windows(content, patterns), settings.LLM_CHUNK_TOKENS)
+
+    budget = settings.LLM_ATTACHMENT_TOKEN_BUDGET
+    if budget <= 0:
+        return chunks, 0
+    kept = []
+    spent = 0
+    for chunk in chunks:
+        tokens = estimate_tokens(chunk)
+        if kept and spent + tokens > budget:
+            break
+        kept.append(chunk)
+        spent += tokens
+    return kept, len(chunks) - len(kept)
@@ -1,19 +1,22 @@
 from fastapi import FastAPI, Depends, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, Response
 from fastapi.staticfiles import StaticFiles
 from sqlalchemy.orm import Session
-from pydantic import BaseModel
+from pydantic import BaseModel, TypeAdapter
 from typing import List, Optional
 import os
 import json
 from fastapi import WebSocket, WebSocketDisconnect
 
-from models import SessionLocal, Site, Attachment, create_tables
+from models import SessionLocal, ReadSessionLocal, Site, Attachment, SiteStatistic, SyncRun, create_tables
 from config import settings
-from sync import RemoteDBSync
+from sync import RemoteDBSync, sync_attachments_for_sites
 from download import process_attachment_file
 from utils import contains_id_card, contains_phone
+from stats import ensure_site_statistics
+from cache import response_cache
+from text_store import load_attachment_texts, stored_text_column, text_search_filter
 
 
 # WebSocket manager
@@ -38,9 +41,25 @@ manager = ConnectionManager()
 # Create tables on startup
 create_tables()
 
+# Populate per-site statistics for databases created before the table existed
+_startup_db = SessionLocal()
+try:
+    ensure_site_statistics(_startup_db)
+finally:
+    _startup_db.close()
+
 # Create FastAPI app
 app = FastAPI(title="Attachment Detection System", version="1.0.0")
 
+
+@app.on_event("shutdown")
+def close_remote_connections():
+    from remote_db import close_remote_pool
+    from llm_client import close_llm_client
+    close_remote_pool()
+    close_llm_client()
+
+
 # Add CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -114,8 +133,19 @@ class SiteResponse(SiteBase):
     id: int
 
 
+class SiteWithStatsResponse(SiteResponse):
+    total_attachments: int = 0
+    attachments_with_id_card: int = 0
+    attachments_with_phone: int = 0
+
+
+class PaginatedSitesResponse(BaseModel):
+    items: List[SiteWithStatsResponse]
+    total: int
+
+
 class AttachmentBase(BaseModel):
-    site_id: int
+    site_id: str
     show_name: str
     file_path: str
     url_path: str
@@ -136,12 +166,99 @@ class AttachmentResponse(AttachmentBase):
     create_date: Optional[datetime] = None
     processed_datetime: Optional[datetime] = None
     ocr_score: Optional[float] = None
+    llm_prompt_tokens: Optional[int] = 0
+    llm_completion_tokens: Optional[int] = 0
+    detected_file_type: Optional[str] = None
+    is_deleted: Optional[bool] = False
+
+    model_config = {"from_attributes": True}
+
+
+class AttachmentListItem(AttachmentBase):
+    """Slim attachment row for list pages: metadata plus a short text preview"""
+    id: int
+    has_id_card: bool
+    has_phone: bool
+    manual_verified_sensitive: bool
+    processed_datetime: Optional[datetime] = None
+    ocr_score: Optional[float] = None
+    is_deleted: Optional[bool] = False
+    snippet: Optional[str] = None
 
     model_config = {"from_attributes": True}
 
 
+class AttachmentTextResponse(BaseModel):
+    attachment_id: int
+    field: str
+    offset: int
+    length: int
+    total_length: int
+    content: str
+
+
 class SyncRequest(BaseModel):
     site_owner: Optional[str] = None
+    site_owners: Optional[List[str]] = None  # Fetched in parallel, written by a single batched writer
+    per_site: bool = False  # Sync all local sites with the per-site orchestrator instead of one big query
+    full: bool = False  # Ignore the high-water mark and check for remote deletions
+
+
+class SyncRunResponse(BaseModel):
+    id: int
+    kind: str
+    site_owner: Optional[str] = None
+    mode: str
+    status: str
+    error: Optional[str] = None
+    started_datetime: datetime
+    finished_datetime: Optional[datetime] = None
+    duration_seconds: Optional[float] = None
+    rows_fetched: int = 0
+    inserted: int = 0
+    updated: int = 0
+    unchanged: int = 0
+    deleted: int = 0
+    restored: int = 0
+
+    model_config = {"from_attributes": True}
+
+
+class LLMCacheStatsResponse(BaseModel):
+    enabled: bool
+    entries: int
+    max_entries: int
+    hits: int  # Counters since startup
+    misses: int
+    hit_rate: float
+    expired: int
+    evicted: int
+
+
+class AttachmentFindingResponse(BaseModel):
+    id: int
+    attachment_id: int
+    site_id: Optional[str] = None
+    finding_type: str
+    masked_value: Optional[str] = None
+    confidence: Optional[float] = None
+    created_datetime: Optional[datetime] = None
+
+    model_config = {"from_attributes": True}
+
+
+class FindingTypeStats(BaseModel):
+    type: str
+    findings: int
+    attachments: int
+    average_confidence: float
+    confident_findings: int  # At or above LLM_FINDING_MIN_CONFIDENCE
+
+
+class FileTypeMismatchStats(BaseModel):
+    declared_type: str  # Extension of the attachment, "" when it has none
+    detected_type: str  # Type sniffed from the content, see file_types
+    attachments: int
 
 
 class SiteStats(BaseModel):
@@ -176,6 +293,7 @@ class AttachmentQuery(BaseModel):
     ocr_content_search: Optional[str] = None
     has_id_card: Optional[bool] = None
     has_phone: Optional[bool] = None
+    include_deleted: bool = False
 
 
 # Dependency to get database session
@@ -187,6 +305,16 @@ def get_db():
         db.close()
 
 
+# Dependency to get a session for read-only endpoints (read-only connection pool
+# under the SQLite performance profile)
+def get_read_db():
+    db = ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
 # Frontend endpoints
 @app.get("/", response_class=HTMLResponse)
 def read_root():
@@ -194,17 +322,107 @@ def read_root():
     return FileResponse("static/index.html")
 
 
+def cached_json_response(request: Request, key: str, builder):
+    """Serve a JSON body from the response cache with ETag revalidation.
+
+    builder() returns the serialized body and is only called when the data
+    version changed since the body was cached.
+    """
+    etag, body = response_cache.get_or_build(key, builder)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and etag in [tag.strip() for tag in if_none_match.split(",")]:
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
 # API endpoints
 
 
 @app.get("/api/sites", response_model=List[SiteResponse])
-def get_sites(db: Session = Depends(get_db)):
-    sites = db.query(Site).all()
-    return sites
+def get_sites(request: Request, db: Session = Depends(get_read_db)):
+    def build():
+        adapter = TypeAdapter(List[SiteResponse])
+        sites = db.query(Site).all()
+        return adapter.dump_json(adapter.validate_python(sites, from_attributes=True))
+
+    return cached_json_response(request, "sites", build)
+
+
+@app.get("/api/sites/search", response_model=PaginatedSitesResponse)
+def search_sites(
+    search: Optional[str] = Query(None),  # Matches name, domain or owner
+    state: Optional[int] = Query(None),
+    has_sensitive: Optional[bool] = Query(None),  # Sites with any ID card or phone finding
+    has_id_card: Optional[bool] = Query(None),
+    has_phone: Optional[bool] = Query(None),
+    skip: int = Query(0, ge=0),
+    limit: int = Query(50, ge=1, le=1000),
+    sort_by: Optional[str] = Query("total_attachments"),
+    sort_order: Optional[str] = Query("desc", pattern="^(asc|desc)$"),
+    db: Session = Depends(get_read_db)
+):
+    from sqlalchemy import asc, desc, func, or_
+
+    total_attachments = func.coalesce(SiteStatistic.total_attachments, 0)
+    attachments_with_id_card = func.coalesce(SiteStatistic.attachments_with_id_card, 0)
+    attachments_with_phone = func.coalesce(SiteStatistic.attachments_with_phone, 0)
+
+    query = db.query(Site).outerjoin(SiteStatistic, SiteStatistic.site_owner == Site.owner)
+
+    if search:
+        pattern = f"%{search}%"
+        query = query.filter(or_(Site.name.like(pattern), Site.domain.like(pattern), Site.owner.like(pattern)))
+
+    if state is not None:
+        query = query.filter(Site.state == state)
+
+    if has_sensitive is not None:
+        sensitive = or_(attachments_with_id_card > 0, attachments_with_phone > 0)
+        query = query.filter(sensitive if has_sensitive else ~sensitive)
+
+    if has_id_card is not None:
+        query = query.filter(attachments_with_id_card > 0 if has_id_card else attachments_with_id_card == 0)
+
+    if has_phone is not None:
+        query = query.filter(attachments_with_phone > 0 if has_phone else attachments_with_phone == 0)
+
+    # Get total count
+    total = query.count()
+
+    column_map = {
+        'id': Site.id,
+        'name': Site.name,
+        'domain': Site.domain,
+        'owner': Site.owner,
+        'state': Site.state,
+        'create_date': Site.create_date,
+        'total_attachments': total_attachments,
+        'attachments_with_id_card': attachments_with_id_card,
+        'attachments_with_phone': attachments_with_phone,
+    }
+    sort_column = column_map.get(sort_by, total_attachments)
+    direction = desc if sort_order == "desc" else asc
+    # Site id as tie breaker keeps pages stable
+    query = query.order_by(direction(sort_column), Site.id)
+
+    rows = query.add_columns(
+        total_attachments, attachments_with_id_card, attachments_with_phone
+    ).offset(skip).limit(limit).all()
+
+    items = []
+    for site, site_total, site_with_id, site_with_phone in rows:
+        item = SiteWithStatsResponse.model_validate(site)
+        item.total_attachments = site_total
+        item.attachments_with_id_card = site_with_id
+        item.attachments_with_phone = site_with_phone
+        items.append(item)
+
+    return PaginatedSitesResponse(items=items, total=total)
 
 
 @app.get("/api/sites/{site_id}", response_model=SiteResponse)
-def get_site(site_id: int, db: Session = Depends(get_db)):
+def get_site(site_id: int, db: Session = Depends(get_read_db)):
     site = db.query(Site).filter(Site.id == site_id).first()
     if not site:
         raise HTTPException(status_code=404, detail="Site not found")
@@ -212,9 +430,103 @@ def get_site(site_id: int, db: Session = Depends(get_db)):
 
 
 class PaginatedAttachmentsResponse(BaseModel):
-    items: List[AttachmentResponse]
+    items: List[AttachmentListItem]
     total: int
 
+
+# Number of characters returned as preview in attachment list rows
+SNIPPET_LENGTH = 160
+
+
+def build_snippet_column(db: Session, column, search: Optional[str] = None):
+    """Build a SQL expression returning a short preview of a text column.
+
+    When a search term is given the preview is centered on the first match,
+    otherwise it is the beginning of the text. The substring is computed in
+    the database so the full text never leaves it.
+    """
+    from sqlalchemy import case, func
+
+    if not search:
+        return func.substr(column, 1, SNIPPET_LENGTH)
+
+    if db.bind.dialect.name == "postgresql":
+        position = func.strpos(column, search)
+    else:
+        position = func.instr(column, search)
+    context = SNIPPET_LENGTH // 4
+    start = case((position > context, position - context), else_=1)
+    return func.substr(column, start, SNIPPET_LENGTH)
+
+# Map sort field to column (handle potential invalid field names)
+ATTACHMENT_SORT_COLUMNS = {
+    'id': Attachment.id,
+    'site_id': Attachment.site_id,
+    'show_name': Attachment.show_name,
+    'file_ext': Attachment.file_ext,
+    'create_date': Attachment.create_date,
+    'has_id_card': Attachment.has_id_card,
+    'has_phone': Attachment.has_phone,
+    'manual_verified_sensitive': Attachment.manual_verified_sensitive,
+    'processed_datetime': Attachment.processed_datetime,
+    'ocr_score': Attachment.ocr_score
+}
+
+# Text columns sort on their full text, which may be stored compressed (see text_store)
+STORED_TEXT_SORT_FIELDS = ('text_content', 'ocr_content')
+
+
+def filter_attachments_query(db: Session, query, filters: AttachmentQuery):
+    """Apply the attachment search filters shared by the list and export endpoints"""
+    # Filter by site - Attachment.site_id corresponds to Site.owner field
+    # If both site_id and site_owner are provided, prioritize site_owner
+    if filters.site_owner is not None:
+        query = query.filter(Attachment.site_id == filters.site_owner)
+    elif filters.site_id is not None:
+        # If only site_id is provided, we need to find the corresponding owner
+        # Find the site by its database ID and get its owner
+        site = db.query(Site).filter(Site.id == filters.site_id).first()
+        if site:
+            query = query.filter(Attachment.site_id == site.owner)
+
+    if filters.text_content_search:
+        query = query.filter(text_search_filter(db, "text_content", filters.text_content_search))
+
+    if filters.ocr_content_search:
+        query = query.filter(text_search_filter(db, "ocr_content", filters.ocr_content_search))
+
+    if filters.has_id_card is not None:
+        query = query.filter(Attachment.has_id_card == filters.has_id_card)
+
+    if filters.has_phone is not None:
+        query = query.filter(Attachment.has_phone == filters.has_phone)
+
+    # Attachments removed on the remote side are hidden unless requested
+    if not filters.include_deleted:
+        query = query.filter(Attachment.is_deleted.isnot(True))
+
+    # Join with Site table to filter by site state
+    if filters.site_state is not None:
+        query = query.join(Site, Attachment.site_id == Site.owner).filter(Site.state == filters.site_state)
+
+    return query
+
+
+def sort_attachments_query(db: Session, query, sort_by: Optional[str], sort_order: Optional[str]):
+    """Apply sorting if specified"""
+    from sqlalchemy import asc, desc
+
+    if sort_by in STORED_TEXT_SORT_FIELDS:
+        column = stored_text_column(db, sort_by)
+    elif sort_by in ATTACHMENT_SORT_COLUMNS:
+        column = ATTACHMENT_SORT_COLUMNS[sort_by]
+    else:
+        return query
+    if sort_order == "desc":
+        return query.order_by(desc(column))
+    return query.order_by(asc(column))
+
+
 @app.get("/api/attachments", response_model=PaginatedAttachmentsResponse)
 def get_attachments(
     site_id: Optional[int] = Query(None),
@@ -224,90 +536,169 @@ def get_attachments(
     ocr_content_search: Optional[str] = Query(None),
     has_id_card: Optional[bool] = Query(None),
     has_phone: Optional[bool] = Query(None),
+    include_deleted: bool = Query(False),
     skip: int = 0,
     limit: int = 100,
     sort_by: Optional[str] = Query(None),  # Field to sort by
     sort_order: Optional[str] = Query("asc", pattern="^(asc|desc)$"),  # Sort direction
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
-    query = db.query(Attachment)
-
-    # Filter by site - Attachment.site_id corresponds to Site.owner field
-    # If both site_id and site_owner are provided, prioritize site_owner
-    if site_owner is not None:
-        query = query.filter(Attachment.site_id == site_owner)
-    elif site_id is not None:
-        # If only site_id is provided, we need to find the corresponding owner
-        # Find the site by its database ID and get its owner
-        site = db.query(Site).filter(Site.id == site_id).first()
-        if site:
-            query = query.filter(Attachment.site_id == site.owner)
+    from sqlalchemy.orm import defer
+
+    # Only metadata columns are loaded for list pages, full text comes from the detail endpoint
+    query = db.query(Attachment).options(
+        defer(Attachment.text_content),
+        defer(Attachment.ocr_content),
+        defer(Attachment.llm_content),
+        defer(Attachment.verification_notes),
+    )
 
-    if text_content_search:
-        query = query.filter(Attachment.text_content.contains(text_content_search))
+    filters = AttachmentQuery(
+        site_id=site_id,
+        site_owner=site_owner,
+        site_state=site_state,
+        text_content_search=text_content_search,
+        ocr_content_search=ocr_content_search,
+        has_id_card=has_id_card,
+        has_phone=has_phone,
+        include_deleted=include_deleted
+    )
+    query = sort_attachments_query(db, filter_attachments_query(db, query, filters), sort_by, sort_order)
 
-    if ocr_content_search:
-        query = query.filter(Attachment.ocr_content.contains(ocr_content_search))
+    # Get total count
+    total = query.count()
 
-    if has_id_card is not None:
-        query = query.filter(Attachment.has_id_card == has_id_card)
+    # Preview the column being searched, defaulting to the extracted text
+    if ocr_content_search and not text_content_search:
+        snippet = build_snippet_column(db, stored_text_column(db, "ocr_content"), ocr_content_search)
+    else:
+        snippet = build_snippet_column(db, stored_text_column(db, "text_content"), text_content_search)
 
-    if has_phone is not None:
-        query = query.filter(Attachment.has_phone == has_phone)
+    # Get paginated results
+    rows = query.add_columns(snippet.label("snippet")).offset(skip).limit(limit).all()
 
-    # Join with Site table to filter by site state
-    if site_state is not None:
-        from sqlalchemy import and_
-        query = query.join(Site, Attachment.site_id == Site.owner).filter(Site.state == site_state)
+    items = []
+    for attachment, attachment_snippet in rows:
+        item = AttachmentListItem.model_validate(attachment)
+        item.snippet = attachment_snippet
+        items.append(item)
 
-    # Apply sorting if specified
-    from sqlalchemy import asc, desc
-    if sort_by:
-        # Map sort field to column (handle potential invalid field names)
-        column_map = {
-            'id': Attachment.id,
-            'site_id': Attachment.site_id,
-            'show_name': Attachment.show_name,
-            'file_ext': Attachment.file_ext,
-            'create_date': Attachment.create_date,
-            'text_content': Attachment.text_content,
-            'ocr_content': Attachment.ocr_content,
-            'has_id_card': Attachment.has_id_card,
-            'has_phone': Attachment.has_phone,
-            'manual_verified_sensitive': Attachment.manual_verified_sensitive,
-            'processed_datetime': Attachment.processed_datetime,
-            'ocr_score': Attachment.ocr_score
-        }
-
-        if sort_by in column_map:
-            if sort_order == "desc":
-                query = query.order_by(desc(column_map[sort_by]))
-            else:
-                query = query.order_by(asc(column_map[sort_by]))
+    return PaginatedAttachmentsResponse(items=items, total=total)
 
-    # Get total count
-    total = query.count()
 
-    # Get paginated results
-    attachments = query.offset(skip).limit(limit).all()
+@app.get("/api/attachments/export")
+def export_attachments(
+    format: str = Query("csv", pattern="^(csv|ndjson|xlsx)$"),
+    site_id: Optional[int] = Query(None),
+    site_owner: Optional[str] = Query(None),
+    site_state: Optional[int] = Query(None),
+    text_content_search: Optional[str] = Query(None),
+    ocr_content_search: Optional[str] = Query(None),
+    has_id_card: Optional[bool] = Query(None),
+    has_phone: Optional[bool] = Query(None),
+    include_deleted: bool = Query(False),
+    sort_by: Optional[str] = Query(None),
+    sort_order: Optional[str] = Query("asc", pattern="^(asc|desc)$"),
+):
+    """Stream attachment metadata matching the /api/attachments filters as CSV, NDJSON or XLSX"""
+    from fastapi.responses import StreamingResponse
+    from sqlalchemy.orm import aliased
+    from export import EXPORT_MEDIA_TYPES, EXPORT_WRITERS
+
+    filters = AttachmentQuery(
+        site_id=site_id,
+        site_owner=site_owner,
+        site_state=site_state,
+        text_content_search=text_content_search,
+        ocr_content_search=ocr_content_search,
+        has_id_card=has_id_card,
+        has_phone=has_phone,
+        include_deleted=include_deleted
+    )
 
-    return PaginatedAttachmentsResponse(items=attachments, total=total)
+    def iter_rows():
+        # The export owns its session because it outlives the request handler
+        db = ReadSessionLocal()
+        try:
+            site = aliased(Site)
+            query = db.query(
+                Attachment.id,
+                Attachment.site_id,
+                site.name,
+                site.domain,
+                Attachment.show_name,
+                Attachment.file_path,
+                Attachment.url_path,
+                Attachment.file_ext,
+                Attachment.create_date,
+                Attachment.has_id_card,
+                Attachment.has_phone,
+                Attachment.manual_verified_sensitive,
+                Attachment.verification_notes,
+                Attachment.processed_datetime,
+                Attachment.ocr_score,
+                Attachment.is_deleted,
+            ).select_from(Attachment).outerjoin(site, site.owner == Attachment.site_id)
+            query = sort_attachments_query(db, filter_attachments_query(db, query, filters), sort_by, sort_order)
+
+            # yield_per streams rows through a server-side cursor where the driver supports it
+            for row in query.yield_per(1000):
+                yield tuple(row)
+        finally:
+            db.close()
+
+    filename = f"attachments_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{format}"
+    return StreamingResponse(
+        EXPORT_WRITERS[format](iter_rows()),
+        media_type=EXPORT_MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
 
 
 @app.get("/api/attachments/{attachment_id}", response_model=AttachmentResponse)
-def get_attachment(attachment_id: int, db: Session = Depends(get_db)):
+def get_attachment(attachment_id: int, db: Session = Depends(get_read_db)):
     attachment = db.query(Attachment).filter(Attachment.id == attachment_id).first()
     if not attachment:
         raise HTTPException(status_code=404, detail="Attachment not found")
-    return attachment
+    return load_attachment_texts(db, attachment)
+
+
+@app.get("/api/attachments/{attachment_id}/text", response_model=AttachmentTextResponse)
+def get_attachment_text(
+    attachment_id: int,
+    field: str = Query("text_content", pattern="^(text_content|ocr_content|llm_content)$"),
+    offset: int = Query(0, ge=0),
+    length: int = Query(65536, ge=1, le=1048576),
+    db: Session = Depends(get_read_db)
+):
+    """Return a character range of one of the attachment text columns"""
+    from sqlalchemy import func
+
+    column = stored_text_column(db, field)
+    row = db.query(
+        func.coalesce(func.char_length(column), 0),
+        func.coalesce(func.substr(column, offset + 1, length), ""),
+    ).filter(Attachment.id == attachment_id).first()
+    if not row:
+        raise HTTPException(status_code=404, detail="Attachment not found")
+
+    total_length, content = row
+    return AttachmentTextResponse(
+        attachment_id=attachment_id,
+        field=field,
+        offset=offset,
+        length=len(content),
+        total_length=total_length,
+        content=content
+    )
 
 
 @app.post("/api/sync-sites")
 def sync_sites(db: Session = Depends(get_db)):
     syncer = RemoteDBSync(db)
     try:
-        syncer.sync_all_sites()
-        return {"message": "Sites sync completed successfully"}
+        sites_result = syncer.sync_all_sites()
+        return {"message": "Sites sync completed successfully", "sites": sites_result}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Sites sync failed: {str(e)}")
     finally:
@@ -317,13 +708,16 @@ def sync_sites(db: Session = Depends(get_db)):
 def sync_attachments(request: SyncRequest = None, db: Session = Depends(get_db)):
     syncer = RemoteDBSync(db)
     try:
-        if request and request.site_owner:
+        if request and (request.site_owners or request.per_site):
+            # Sync attachments site by site, fetching in parallel
+            attachments_result = sync_attachments_for_sites(request.site_owners, full=request.full)
+        elif request and request.site_owner:
             # Sync attachments for specific site
-            syncer.sync_attachments_for_site(request.site_owner)
+            attachments_result = syncer.sync_attachments_for_site(request.site_owner, full=request.full)
         else:
             # Sync all attachments
-            syncer.sync_all_attachments()
-        return {"message": "Attachments sync completed successfully"}
+            attachments_result = syncer.sync_all_attachments(full=bool(request and request.full))
+        return {"message": "Attachments sync completed successfully", "attachments": attachments_result}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Attachments sync failed: {str(e)}")
     finally:
@@ -334,21 +728,29 @@ def sync_remote_data(request: SyncRequest = None, db: Session = Depends(get_db))
     syncer = RemoteDBSync(db)
     try:
         # First sync all sites (always sync sites completely)
-        syncer.sync_all_sites()
+        sites_result = syncer.sync_all_sites()
 
         # Then sync attachments (all or for specific site)
-        if request and request.site_owner:
-            syncer.sync_attachments_for_site(request.site_owner)
+        if request and (request.site_owners or request.per_site):
+            attachments_result = sync_attachments_for_sites(request.site_owners, full=request.full)
+        elif request and request.site_owner:
+            attachments_result = syncer.sync_attachments_for_site(request.site_owner, full=request.full)
         else:
-            syncer.sync_all_attachments()
+            attachments_result = syncer.sync_all_attachments(full=bool(request and request.full))
 
-        return {"message": "Full sync completed successfully"}
+        return {"message": "Full sync completed successfully", "sites": sites_result, "attachments": attachments_result}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Sync failed: {str(e)}")
     finally:
         syncer.close()
 
 
+@app.get("/api/sync-runs", response_model=List[SyncRunResponse])
+def get_sync_runs(limit: int = Query(20, ge=1, le=500), db: Session = Depends(get_read_db)):
+    """Most recent sync runs with their duration and row counts"""
+    return db.query(SyncRun).order_by(SyncRun.id.desc()).limit(limit).all()
+
+
 @app.post("/api/process-attachment/{attachment_id}")
 def process_attachment(attachment_id: int, db: Session = Depends(get_db)):
     attachment = db.query(Attachment).filter(Attachment.id == attachment_id).first()
@@ -382,22 +784,14 @@ def process_attachment_ai(attachment_id: int, db: Session = Depends(get_db)):
 
 @app.post("/api/process-site/{site_owner}")
 def process_site_attachments(site_owner: str, detection_type: str = "normal", db: Session = Depends(get_db)):
-    attachments = db.query(Attachment).filter(Attachment.site_id == site_owner).all()
+    from download import process_site_attachments_with_progress
 
-    processed_count = 0
-    for attachment in attachments:
-        try:
-            if detection_type == "ai" and not settings.OPENAI_API_KEY:
-                # Skip AI processing if API key is not configured
-                process_attachment_file(attachment, db, base_url=settings.ATTACHMENT_DEFAULT_BASE_URL, detection_type="normal")
-            else:
-                process_attachment_file(attachment, db, base_url=settings.ATTACHMENT_DEFAULT_BASE_URL, detection_type=detection_type)
-            processed_count += 1
-        except Exception as e:
-            print(f"Error processing attachment {attachment.id}: {str(e)}")
-            continue
+    if detection_type == "ai" and not settings.OPENAI_API_KEY:
+        # Skip AI processing if API key is not configured
+        detection_type = "normal"
+    result = process_site_attachments_with_progress(site_owner, db, detection_type)
 
-    return {"message": f"Processed {processed_count} attachments for site {site_owner}"}
+    return {"message": f"Processed {result['processed_count']} attachments for site {site_owner}"}
 
 
 @app.post("/api/detect-site/{site_owner}")
@@ -419,33 +813,9 @@ def detect_site_attachments(site_owner: str, detection_type: str = "normal", ws_
         # Return to allow client to establish WebSocket connection
         return {"message": "Detection will start when WebSocket connection is established", "site_owner": site_owner, "ws_id": ws_id}
     else:
-        # Use the original detection without progress tracking
-        attachments = db.query(Attachment).filter(Attachment.site_id == site_owner).all()
-
-        processed_count = 0
-        sensitive_count = 0
-
-        for attachment in attachments:
-            try:
-                if detection_type == "ai":
-                    process_attachment_file(attachment, db, base_url=settings.ATTACHMENT_DEFAULT_BASE_URL, detection_type="ai")
-                else:
-                    process_attachment_file(attachment, db, base_url=settings.ATTACHMENT_DEFAULT_BASE_URL, detection_type="normal")
-
-                # Count attachments that were marked as containing sensitive info
-                if attachment.has_id_card or attachment.has_phone:
-                    sensitive_count += 1
-
-                processed_count += 1
-            except Exception as e:
-                print(f"Error processing attachment {attachment.id}: {str(e)}")
-                continue
-
-        return {
-            "message": f"Detected {processed_count} attachments for site {site_owner}, {sensitive_count} with sensitive info",
-            "processed_count": processed_count,
-            "sensitive_count": sensitive_count
-        }
+        # Detect without progress tracking, AI detection runs concurrently
+        from download import process_site_attachments_with_progress
+        return process_site_attachments_with_progress(site_owner, db, detection_type)
 
 
 @app.post("/api/download-site/{site_owner}")
@@ -461,44 +831,90 @@ def download_site_attachments(site_owner: str, db: Session = Depends(get_db)):
 
 
 
-@app.get("/api/stats", response_model=StatsResponse)
-def get_statistics(db: Session = Depends(get_db)):
-    total_sites = db.query(Site).count()
-    total_attachments = db.query(Attachment).count()
-    attachments_with_id_card = db.query(Attachment).filter(Attachment.has_id_card == True).count()
-    attachments_with_phone = db.query(Attachment).filter(Attachment.has_phone == True).count()
+@app.get("/api/attachments/{attachment_id}/findings", response_model=List[AttachmentFindingResponse])
+def get_attachment_findings(attachment_id: int, db: Session = Depends(get_read_db)):
+    """Structured findings of the last AI detection of an attachment"""
+    from models import AttachmentFinding
+    return db.query(AttachmentFinding).filter(
+        AttachmentFinding.attachment_id == attachment_id
+    ).order_by(AttachmentFinding.confidence.desc()).all()
 
-    # Count sync sites (sites that have at least one attachment)
-    sync_sites = db.query(Site.owner).join(Attachment, Site.owner == Attachment.site_id).distinct().count()
 
-    # Get stats per site
-    sites = db.query(Site).all()
-    sites_stats = []
-    for site in sites:
-        site_attachments = db.query(Attachment).filter(Attachment.site_id == site.owner).count()
-        site_attachments_with_id = db.query(Attachment).filter(
-            Attachment.site_id == site.owner,
-            Attachment.has_id_card == True
-        ).count()
-        site_attachments_with_phone = db.query(Attachment).filter(
-            Attachment.site_id == site.owner,
-            Attachment.has_phone == True
-        ).count()
+@app.get("/api/ai-findings/stats", response_model=List[FindingTypeStats])
+def get_ai_findings_statistics(site_owner: Optional[str] = None, db: Session = Depends(get_read_db)):
+    """AI findings per type, over all sites or one site"""
+    from ai_findings import findings_statistics
+    return findings_statistics(db, site_owner)
+
+
+@app.get("/api/file-types/mismatches", response_model=List[FileTypeMismatchStats])
+def get_file_type_mismatches(site_owner: Optional[str] = None, db: Session = Depends(get_read_db)):
+    """Attachments whose content is of another type than their extension, per pair of types"""
+    from file_types import file_type_mismatches
+    return file_type_mismatches(db, site_owner)
 
+
+@app.get("/api/llm-cache/stats", response_model=LLMCacheStatsResponse)
+def get_llm_cache_stats():
+    """Hit rate of the LLM response cache and its size"""
+    from llm_cache import llm_cache
+    return llm_cache.stats()
+
+
+@app.delete("/api/llm-cache")
+def clear_llm_cache():
+    """Drop all cached LLM responses, e.g. after changing how content is analysed"""
+    from llm_cache import llm_cache
+    return {"message": f"Removed {llm_cache.clear()} cached LLM responses"}
+
+
+@app.get("/api/stats", response_model=StatsResponse)
+def get_statistics(request: Request, db: Session = Depends(get_read_db)):
+    return cached_json_response(request, "stats", lambda: build_statistics(db).model_dump_json().encode())
+
+
+def build_statistics(db: Session) -> StatsResponse:
+    from sqlalchemy import func
+
+    total_sites = db.query(func.count(Site.id)).scalar()
+
+    # Global counters are the sum of the maintained per-site counters
+    total_attachments, attachments_with_id_card, attachments_with_phone = db.query(
+        func.coalesce(func.sum(SiteStatistic.total_attachments), 0),
+        func.coalesce(func.sum(SiteStatistic.attachments_with_id_card), 0),
+        func.coalesce(func.sum(SiteStatistic.attachments_with_phone), 0),
+    ).one()
+
+    # Get stats per site, sorted by total attachments in descending order
+    total_column = func.coalesce(SiteStatistic.total_attachments, 0)
+    rows = db.query(
+        Site.id,
+        Site.name,
+        Site.account,
+        Site.domain,
+        Site.create_date,
+        total_column,
+        func.coalesce(SiteStatistic.attachments_with_id_card, 0),
+        func.coalesce(SiteStatistic.attachments_with_phone, 0),
+    ).outerjoin(SiteStatistic, SiteStatistic.site_owner == Site.owner).order_by(total_column.desc()).all()
+
+    sites_stats = []
+    sync_sites = 0
+    for site_id, name, account, domain, create_date, site_total, site_with_id, site_with_phone in rows:
+        # Count sync sites (sites that have at least one attachment)
+        if site_total > 0:
+            sync_sites += 1
         sites_stats.append({
-            "site_id": site.id,
-            "site_name": site.name,
-            "site_account": site.account,
-            "site_domain": site.domain,
-            "site_create_date": site.create_date,
-            "total_attachments": site_attachments,
-            "attachments_with_id_card": site_attachments_with_id,
-            "attachments_with_phone": site_attachments_with_phone
+            "site_id": site_id,
+            "site_name": name,
+            "site_account": account,
+            "site_domain": domain,
+            "site_create_date": create_date,
+            "total_attachments": site_total,
+            "attachments_with_id_card": site_with_id,
+            "attachments_with_phone": site_with_phone
         })
 
-    # Sort sites by total attachments in descending order
-    sites_stats.sort(key=lambda x: x["total_attachments"], reverse=True)
-
     return StatsResponse(
         total_sites=total_sites,
         total_attachments=total_attachments,
@@ -0,0 +1,166 @@
+"""Versioned schema migrations for the local database.
+
+Migrations run in order, each in its own transaction, and are recorded in the
+schema_migrations table. A database created from scratch already matches the
+models, so it is only stamped with the latest version.
+"""
+from datetime import datetime
+import logging
+
+from sqlalchemy import Integer, MetaData, bindparam, inspect, text
+from sqlalchemy.schema import CreateTable
+
+from models import Attachment, SchemaMigration, Site
+
+logger = logging.getLogger(__name__)
+
+
+# Indexes declared by older versions that duplicate column indexes or are
+# covered by the composite (site_id, ...) indexes
+LEGACY_INDEXES = {
+    "sites": ["idx_site_owner", "idx_site_domain"],
+    "attachments": [
+        "idx_attachment_site_id",
+        "idx_attachment_file_ext",
+        "idx_attachment_has_id_card",
+        "idx_attachment_has_phone",
+        "ix_attachments_site_id",
+    ],
+}
+
+
+def _add_attachment_columns(conn, names):
+    existing_columns = {column["name"] for column in inspect(conn).get_columns("attachments")}
+    for name in names:
+        if name not in existing_columns:
+            column_type = Attachment.__table__.c[name].type.compile(dialect=conn.dialect)
+            conn.execute(text(f"ALTER TABLE attachments ADD COLUMN {name} {column_type}"))
+
+
+def add_deletion_columns(conn):
+    """Add the remote deletion tracking columns to attachments"""
+    _add_attachment_columns(conn, ("is_deleted", "deleted_datetime"))
+
+
+def attachment_site_id_to_string(conn):
+    """Store attachments.site_id as a string, like the sites.owner it refers to"""
+    columns = inspect(conn).get_columns("attachments")
+    site_id_type = next(column["type"] for column in columns if column["name"] == "site_id")
+    if not isinstance(site_id_type, Integer):
+        return
+
+    dialect = conn.dialect.name
+    if dialect == "postgresql":
+        conn.execute(text("ALTER TABLE attachments ALTER COLUMN site_id TYPE VARCHAR USING site_id::varchar"))
+    elif dialect == "mysql":
+        conn.execute(text("ALTER TABLE attachments MODIFY site_id VARCHAR(255)"))
+    else:
+        # SQLite cannot change a column type: copy the rows into a table with the
+        # current definition. Indexes are dropped with the old table and recreated
+        # by the next migration.
+        new_table = Attachment.__table__.to_metadata(MetaData(), name="attachments_new")
+        new_table.indexes.clear()
+        conn.execute(CreateTable(new_table))
+        existing_columns = {column["name"] for column in columns}
+        names = [column.name for column in new_table.columns if column.name in existing_columns]
+        selected = ["CAST(site_id AS TEXT)" if name == "site_id" else name for name in names]
+        conn.execute(text(
+            f"INSERT INTO attachments_new ({', '.join(names)}) SELECT {', '.join(selected)} FROM attachments"
+        ))
+        conn.execute(text("DROP TABLE attachments"))
+        conn.execute(text("ALTER TABLE attachments_new RENAME TO attachments"))
+
+
+def _remove_duplicate_attachments(conn):
+    """Delete all but the most advanced row of each duplicate (file_path, url_path) key"""
+    rows = conn.execute(text("""
+        SELECT a.id, a.file_path, a.url_path, a.manual_verified_sensitive, a.processed_datetime
+        FROM attachments a
+        JOIN (
+            SELECT file_path, url_path FROM attachments
+            GROUP BY file_path, url_path HAVING COUNT(*) > 1
+        ) AS duplicate ON duplicate.file_path = a.file_path AND duplicate.url_path = a.url_path
+    """)).all()
+
+    groups = {}
+    for row in rows:
+        groups.setdefault((row.file_path, row.url_path), []).append(row)
+    removed_ids = []
+    for group in groups.values():
+        group.sort(key=lambda row: (not row.manual_verified_sensitive, row.processed_datetime is None, row.id))
+        removed_ids.extend(row.id for row in group[1:])
+
+    for start in range(0, len(removed_ids), 500):
+        conn.execute(
+            text("DELETE FROM attachments WHERE id IN :ids").bindparams(bindparam("ids", expanding=True)),
+            {"ids": removed_ids[start:start + 500]},
+        )
+    return len(removed_ids)
+
+
+def rebuild_indexes(conn):
+    """Drop legacy duplicate indexes and create the declared ones.
+
+    Duplicate (file_path, url_path) rows are removed first, so that the
+    unique index can be created. Of each key the most advanced row is kept:
+    manually verified, else processed, else the oldest.
+    """
+    inspector = inspect(conn)
+    for table_name, index_names in LEGACY_INDEXES.items():
+        existing = {index["name"] for index in inspector.get_indexes(table_name)}
+        for index_name in index_names:
+            if index_name in existing:
+                if conn.dialect.name == "mysql":
+                    conn.execute(text(f"DROP INDEX {index_name} ON {table_name}"))
+                else:
+                    conn.execute(text(f"DROP INDEX {index_name}"))
+
+    duplicates = _remove_duplicate_attachments(conn)
+    if duplicates:
+        logger.warning(f"Removed {duplicates} duplicate attachments before adding the unique (file_path, url_path) index")
+        # Per-site counters are rebuilt from scratch on the next startup
+        conn.execute(text("DELETE FROM site_statistics"))
+
+    for table in (Site.__table__, Attachment.__table__):
+        existing = {index["name"] for index in inspect(conn).get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing:
+                index.create(conn)
+
+
+def add_llm_token_columns(conn):
+    """Add the LLM token usage columns to attachments"""
+    _add_attachment_columns(conn, ("llm_prompt_tokens", "llm_completion_tokens"))
+
+
+def add_detected_file_type_column(conn):
+    """Add the sniffed file type column to attachments"""
+    _add_attachment_columns(conn, ("detected_file_type",))
+
+
+MIGRATIONS = [
+    (1, add_deletion_columns),
+    (2, attachment_site_id_to_string),
+    (3, rebuild_indexes),
+    (4, add_llm_token_columns),
+    (5, add_detected_file_type_column),
+]
+
+
+def run_migrations(engine, fresh=False):
+    """Apply pending migrations, or stamp a freshly created database as up to date"""
+    with engine.connect() as conn:
+        applied = {version for (version,) in conn.execute(text("SELECT version FROM schema_migrations"))}
+
+    for version, migration in MIGRATIONS:
+        if version in applied:
+            continue
+        with engine.begin() as conn:
+            if not fresh:
+                logger.info(f"Applying schema migration {version}: {migration.__name__}")
+                migration(conn)
+            conn.execute(SchemaMigration.__table__.insert().values(
+                version=version,
+                name=migration.__name__,
+                applied_datetime=datetime.utcnow(),
+            ))
@@ -0,0 +1,123 @@
+"""Mock OpenAI-compatible chat completions server for load tests.
+
+Serves POST /v1/chat/completions with a fixed latency, and optionally fails a
+share of requests with 503 or 429 (with Retry-After), so the LLM client's
+concurrency, rate limiting and retries can be exercised without an API key.
+
+    python mock_llm_server.py --port 8765 --latency 0.5 --error-rate 0.1
+    OPENAI_BASE_URL=http://127.0.0.1:8765/v1 OPENAI_API_KEY=test ...
+"""
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class MockLLMHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        server = self.server
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if self.path.rstrip("/") != "/v1/chat/completions":
+            self._reply(404, {"error": {"message": "Not found"}})
+            return
+
+        with server.lock:
+            server.requests += 1
+            server.in_flight += 1
+            server.max_in_flight = max(server.max_in_flight, server.in_flight)
+        try:
+            time.sleep(server.latency)
+            roll = random.random()
+            if roll < server.rate_limit_rate:
+                self._reply(429, {"error": {"message": "Rate limit reached"}}, {"Retry-After": "1"})
+                return
+            if roll < server.rate_limit_rate + server.error_rate:
+                self._reply(503, {"error": {"message": "Service unavailable"}})
+                return
+
+            request = json.loads(body or b"{}")
+            prompt = request.get("messages", [{}])[-1].get("content", "")
+            if not isinstance(prompt, str):
+                prompt = json.dumps(prompt)
+            if request.get("response_format") or "findings" in json.dumps(request.get("messages", [])):
+                # Structured answer: every mobile number in the prompt is a finding
+                content = json.dumps({"findings": [
+                    {"type": "phone", "value": number[:3] + "******" + number[-2:], "confidence": 0.9}
+                    for number in dict.fromkeys(re.findall(r"1[3-9]\d{9}", prompt))
+                ]})
+            else:
+                content = "CLEAN: No sensitive data found."
+            self._reply(200, {
+                "id": f"chatcmpl-mock-{server.requests}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": request.get("model", "mock"),
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": content},
+                    "finish_reason": "stop",
+                }],
+                "usage": {
+                    "prompt_tokens": len(prompt) // 4,
+                    "completion_tokens": 8,
+                    "total_tokens": len(prompt) // 4 + 8,
+                },
+            })
+        finally:
+            with server.lock:
+                server.in_flight -= 1
+
+    def _reply(self, status, payload, headers=None):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def create_server(host="127.0.0.1", port=0, latency=0.5, error_rate=0.0, rate_limit_rate=0.0):
+    """Return a server that is not started yet; port 0 picks a free port"""
+    server = ThreadingHTTPServer((host, port), MockLLMHandler)
+    server.daemon_threads = True
+    server.latency = latency
+    server.error_rate = error_rate
+    server.rate_limit_rate = rate_limit_rate
+    server.lock = threading.Lock()
+    server.requests = 0
+    server.in_flight = 0
+    server.max_in_flight = 0
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.5, help="Seconds per request")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of requests answered with 503")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Share of requests answered with 429")
+    args = parser.parse_args()
+
+    server = create_server(args.host, args.port, args.latency, args.error_rate, args.rate_limit_rate)
+    print(f"Mock LLM server on http://{args.host}:{server.server_port}/v1")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,11 @@
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, Text, Boolean, Float
+from sqlalchemy import create_engine, Column, Integer, String, DateTime, Text, Boolean, Float, LargeBinary, Index, inspect
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from datetime import datetime
 import os
-from sqlalchemy import Index
 
 from config import settings
+from sqlite_profile import create_sqlite_engines
 
 
 Base = declarative_base()
@@ -28,19 +28,19 @@ class Attachment(Base):
     __tablename__ = "attachments"
     
     id = Column(Integer, primary_key=True, index=True)
-    site_id = Column(Integer, index=True)  # owner from remote
+    site_id = Column(String)  # owner from remote, same type as Site.owner
     show_name = Column(String)  # wbshowname
     file_path = Column(String)  # wbfilepath
     url_path = Column(String)  # wburlpath
-    file_ext = Column(String)  # wbext
+    file_ext = Column(String, index=True)  # wbext
     create_date = Column(DateTime)  # wbcreatedate
     
     # Additional fields for content extraction
     text_content = Column(Text, default="")  # Extracted text from documents
     ocr_content = Column(Text, default="")  # OCR extracted text from images
     llm_content = Column(Text, default="")  # LLM extracted content from complex images
-    has_id_card = Column(Boolean, default=False)  # Whether contains ID card numbers
-    has_phone = Column(Boolean, default=False)  # Whether contains phone numbers
+    has_id_card = Column(Boolean, default=False, index=True)  # Whether contains ID card numbers
+    has_phone = Column(Boolean, default=False, index=True)  # Whether contains phone numbers
     
     # Manual verification fields
     manual_verified_sensitive = Column(Boolean, default=False)  # Whether manually verified to contain sensitive info
@@ -49,6 +49,117 @@ class Attachment(Base):
     # Additional attachment metadata
     processed_datetime = Column(DateTime, default=None)  # When attachment was processed
     ocr_score = Column(Float, default=None)  # Confidence score for OCR quality (null means not processed)
+    llm_prompt_tokens = Column(Integer, default=0)  # Tokens sent to the LLM by the last AI detection
+    llm_completion_tokens = Column(Integer, default=0)  # Tokens generated by the LLM in the last AI detection
+    detected_file_type = Column(String, default=None)  # Type sniffed from the downloaded content, e.g. .docx or html (see file_types)
+
+    # Remote deletion tracking
+    is_deleted = Column(Boolean, default=False)  # Whether the attachment was removed on the remote side
+    deleted_datetime = Column(DateTime, default=None)  # When the removal was detected
+
+    __table_args__ = (
+        # Site filters, per-site sensitive counts and "unprocessed in site" lookups;
+        # both also serve plain site_id lookups
+        Index("ix_attachments_site_id_has_id_card", "site_id", "has_id_card"),
+        Index("ix_attachments_site_id_processed_datetime", "site_id", "processed_datetime"),
+        # Sync matches remote rows by file path and URL path
+        Index("ux_attachments_file_path_url_path", "file_path", "url_path", unique=True),
+    )
+
+
+class AttachmentText(Base):
+    """Compressed extracted text of an attachment, one row per text column (see text_store.py)"""
+    __tablename__ = "attachment_texts"
+
+    id = Column(Integer, primary_key=True)  # Also the rowid in the trigram search index
+    attachment_id = Column(Integer, nullable=False)
+    field = Column(String, nullable=False)  # text_content, ocr_content or llm_content
+    codec = Column(String, nullable=False)  # zlib or zstd
+    data = Column(LargeBinary)
+    length = Column(Integer, default=0)  # Uncompressed length in characters
+
+    __table_args__ = (
+        Index("ux_attachment_texts_attachment_id_field", "attachment_id", "field", unique=True),
+    )
+
+
+class AttachmentFinding(Base):
+    """Structured finding of AI detection, one row per finding (see ai_findings.py)"""
+    __tablename__ = "attachment_findings"
+
+    id = Column(Integer, primary_key=True)
+    attachment_id = Column(Integer, nullable=False, index=True)
+    site_id = Column(String)  # Attachment.site_id, for per-site statistics
+    finding_type = Column(String, nullable=False)  # id_card, phone, bank_card, passport, address, email or other
+    masked_value = Column(String)
+    confidence = Column(Float)
+    created_datetime = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index("ix_attachment_findings_site_id_finding_type", "site_id", "finding_type"),
+    )
+
+
+class SiteStatistic(Base):
+    """Per-site attachment counters, maintained by sync and detection"""
+    __tablename__ = "site_statistics"
+
+    site_owner = Column(String, primary_key=True)  # Attachment.site_id / Site.owner
+    total_attachments = Column(Integer, default=0, nullable=False)
+    attachments_with_id_card = Column(Integer, default=0, nullable=False)
+    attachments_with_phone = Column(Integer, default=0, nullable=False)
+    updated_datetime = Column(DateTime, default=datetime.utcnow)
+
+
+class SyncState(Base):
+    """Incremental sync bookkeeping per remote table (optionally scoped to one site)"""
+    __tablename__ = "sync_states"
+
+    name = Column(String, primary_key=True)  # e.g. "attachments" or "attachments:<owner>"
+    high_water_mark = Column(DateTime, default=None)  # Newest remote wbcreatedate seen
+    last_deletion_check = Column(DateTime, default=None)  # Last remote key-set diff
+
+
+class SyncRun(Base):
+    """History of sync runs with their duration and row counts"""
+    __tablename__ = "sync_runs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    kind = Column(String)  # sites or attachments
+    site_owner = Column(String, default=None)  # Set for site-scoped attachment syncs
+    mode = Column(String)  # full or incremental
+    status = Column(String)  # success or failed
+    error = Column(Text, default=None)
+    started_datetime = Column(DateTime)
+    finished_datetime = Column(DateTime)
+    duration_seconds = Column(Float)
+    rows_fetched = Column(Integer, default=0)
+    inserted = Column(Integer, default=0)
+    updated = Column(Integer, default=0)
+    unchanged = Column(Integer, default=0)
+    deleted = Column(Integer, default=0)
+    restored = Column(Integer, default=0)
+
+
+class LLMCacheEntry(Base):
+    """Cached LLM responses keyed by a hash of content, prompt, model and max_tokens (see llm_cache.py)"""
+    __tablename__ = "llm_cache"
+
+    key = Column(String, primary_key=True)  # sha256 hex digest
+    model = Column(String)
+    response = Column(Text)
+    created_datetime = Column(DateTime, default=datetime.utcnow)  # TTL is counted from here
+    last_used_datetime = Column(DateTime, default=datetime.utcnow, index=True)  # Least recently used are evicted first
+    hits = Column(Integer, default=0, nullable=False)
+
+
+class SchemaMigration(Base):
+    """Versioned schema migrations applied to the local database (see migrations.py)"""
+    __tablename__ = "schema_migrations"
+
+    version = Column(Integer, primary_key=True)
+    name = Column(String)
+    applied_datetime = Column(DateTime, default=datetime.utcnow)
 
 
 def get_database_url():
@@ -63,14 +174,25 @@ def get_database_url():
         raise ValueError(f"Unsupported database type: {settings.LOCAL_DB_TYPE}")
 
 
-# Create local database engine
-engine = create_engine(get_database_url())
+# Create local database engine, plus a read engine (the same one unless the
+# SQLite performance profile is enabled)
+if settings.LOCAL_DB_TYPE == "sqlite":
+    engine, read_engine = create_sqlite_engines(get_database_url(), settings.LOCAL_DB_SQLITE_PROFILE)
+else:
+    engine = read_engine = create_engine(get_database_url())
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
 
 
 def create_tables():
-    """Create all tables in the database"""
+    """Create missing tables and bring tables of older versions up to date"""
+    from migrations import run_migrations
+    from text_store import ensure_text_search_index
+
+    fresh = not inspect(engine).has_table(Attachment.__tablename__)
     Base.metadata.create_all(bind=engine)
+    run_migrations(engine, fresh=fresh)
+    ensure_text_search_index(engine)
 
 
 def get_db():
@@ -81,11 +203,3 @@ def get_db():
     finally:
         db.close()
 
-
-# Create indices for better performance
-Index('idx_site_owner', Site.owner)
-Index('idx_site_domain', Site.domain)
-Index('idx_attachment_site_id', Attachment.site_id)
-Index('idx_attachment_file_ext', Attachment.file_ext)
-Index('idx_attachment_has_id_card', Attachment.has_id_card)
-Index('idx_attachment_has_phone', Attachment.has_phone)
\ No newline at end of file
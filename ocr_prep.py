@@ -0,0 +1,140 @@
+"""Image normalisation before OCR.
+
+OCR time grows with the pixel count, and very large scans can exhaust memory
+in the OCR engine, so images are normalised before OCR:
+
+- images whose shorter side is below OCR_MIN_DIMENSION (icons, thumbnails)
+  are not OCR'd at all
+- every frame of multi-frame GIF and TIFF files up to OCR_MAX_FRAMES is
+  OCR'd, identical frames of animations only once
+- frames longer than OCR_TILE_ASPECT times their width (or wider than long)
+  are cut into overlapping tiles, so capping the size keeps the text readable
+- frames (or tiles) are converted to grayscale and downscaled so their longer
+  side is at most OCR_MAX_DIMENSION
+
+The normalised pages are cached on disk under the attachment cache, keyed by
+a hash of the image bytes and the settings, so the text and the confidence
+pass over the same image prepare it once. Images OCR'd only once, such as
+the page renders of scanned PDFs, go through transient_ocr_pages() instead,
+so the cache does not grow with every scanned page.
+"""
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+
+from PIL import Image, ImageSequence
+
+from config import settings
+from image_prep import split_tiles, to_rgb
+
+
+def _cache_dir():
+    return os.path.join(settings.ATTACHMENT_CACHE_DIR, ".ocr_images")
+
+
+def _cache_key(image_bytes):
+    options = (
+        f"{settings.OCR_MAX_DIMENSION}:{settings.OCR_MIN_DIMENSION}:{settings.OCR_GRAYSCALE}:"
+        f"{settings.OCR_TILE_ASPECT}:{settings.OCR_MAX_TILES}:{settings.OCR_MAX_FRAMES}"
+    )
+    return hashlib.sha256(image_bytes + options.encode()).hexdigest()
+
+
+def _load_cached(digest):
+    manifest_path = os.path.join(_cache_dir(), f"{digest}.json")
+    if not os.path.exists(manifest_path):
+        return None
+    try:
+        with open(manifest_path) as f:
+            pages = [os.path.join(_cache_dir(), name) for name in json.load(f)["pages"]]
+    except (OSError, ValueError, KeyError):
+        return None
+    return pages if all(os.path.exists(page) for page in pages) else None
+
+
+def normalise_frame(frame):
+    """Pages of one frame: tiled when very long, grayscale and at most OCR_MAX_DIMENSION"""
+    image = to_rgb(frame)
+    if settings.OCR_GRAYSCALE:
+        image = image.convert("L")
+    tiles = split_tiles(image, settings.OCR_TILE_ASPECT, settings.OCR_MAX_TILES) if settings.OCR_TILE_ASPECT > 0 else [image]
+    if settings.OCR_MAX_DIMENSION > 0:
+        for tile in tiles:
+            tile.thumbnail((settings.OCR_MAX_DIMENSION, settings.OCR_MAX_DIMENSION), Image.LANCZOS)
+    return tiles
+
+
+def _normalised_pages(image_path):
+    """Normalised page images of an image file; empty when it is too small"""
+    pages = []
+    with Image.open(image_path) as image:
+        if min(image.size) < settings.OCR_MIN_DIMENSION:
+            print(f"Skipping OCR for {image_path}: {image.width}x{image.height} is below the minimum size")
+        else:
+            if settings.OCR_MAX_DIMENSION > 0:
+                # JPEG decodes directly at a reduced scale, no smaller than the cap on either side
+                image.draft(image.mode, (settings.OCR_MAX_DIMENSION, settings.OCR_MAX_DIMENSION))
+            multi_frame = getattr(image, "n_frames", 1) > 1
+            seen_frames = set()
+            for index, frame in enumerate(ImageSequence.Iterator(image)):
+                if index >= max(1, settings.OCR_MAX_FRAMES):
+                    break
+                if multi_frame:
+                    frame_digest = hashlib.md5(frame.tobytes()).digest()
+                    if frame_digest in seen_frames:
+                        continue
+                    seen_frames.add(frame_digest)
+                pages.extend(normalise_frame(frame))
+
+    return pages
+
+
+def _save_pages(pages, directory, prefix):
+    """Save page images as PNG files in directory and return their names"""
+    names = []
+    # Files are written under temporary names and renamed, as the same image can be prepared concurrently
+    for i, page in enumerate(pages):
+        name = f"{prefix}_{i}.png"
+        with tempfile.NamedTemporaryFile(dir=directory, suffix=".tmp", delete=False) as f:
+            # Fast compression: the pages are read once or twice and then only take disk space
+            page.save(f, format="PNG", compress_level=1)
+        os.replace(f.name, os.path.join(directory, name))
+        names.append(name)
+    return names
+
+
+def ocr_pages(image_path):
+    """Paths of the normalised images to OCR for an image file; empty when it is too small"""
+    with open(image_path, "rb") as f:
+        image_bytes = f.read()
+    digest = _cache_key(image_bytes)
+    cached = _load_cached(digest)
+    if cached is not None:
+        return cached
+
+    pages = _normalised_pages(image_path)
+    os.makedirs(_cache_dir(), exist_ok=True)
+    names = _save_pages(pages, _cache_dir(), digest)
+    # The manifest is written last, so a partly written entry is never read
+    with tempfile.NamedTemporaryFile("w", dir=_cache_dir(), suffix=".tmp", delete=False) as f:
+        json.dump({"pages": names}, f)
+    os.replace(f.name, os.path.join(_cache_dir(), f"{digest}.json"))
+    return [os.path.join(_cache_dir(), name) for name in names]
+
+
+@contextmanager
+def transient_ocr_pages(image_path):
+    """Like ocr_pages, for images OCR'd once such as rendered PDF pages.
+
+    The pages are not cached: they are written to a temporary directory that
+    is removed on exit.
+    """
+    directory = tempfile.mkdtemp(prefix="ocr_pages_")
+    try:
+        names = _save_pages(_normalised_pages(image_path), directory, "page")
+        yield [os.path.join(directory, name) for name in names]
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
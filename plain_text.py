@@ -0,0 +1,65 @@
+"""Memory-mapped reading of large plain-text files (.txt, .csv, .log).
+
+Files are memory-mapped and decoded chunk by chunk instead of being read
+into one string, so memory use does not depend on the file size: pages of a
+chunk are released from the process once the chunk is decoded. The encoding
+is sniffed from the start of the file: a BOM, otherwise UTF-8, GBK or
+GB18030, whichever decodes it. Undecodable bytes later in the file are
+replaced rather than failing the whole file.
+"""
+import codecs
+import mmap
+import os
+
+from config import settings
+
+
+PLAIN_TEXT_EXTENSIONS = (".txt", ".csv", ".log")
+
+# Bytes at the start of a file used to detect its encoding
+SNIFF_BYTES = 65536
+
+BOM_ENCODINGS = (
+    (codecs.BOM_UTF8, "utf-8-sig"),
+    (codecs.BOM_UTF16_LE, "utf-16"),
+    (codecs.BOM_UTF16_BE, "utf-16"),
+)
+
+
+def sniff_encoding(sample):
+    """The encoding of a file from its first bytes: BOM, else UTF-8, GBK or GB18030"""
+    for bom, encoding in BOM_ENCODINGS:
+        if sample.startswith(bom):
+            return encoding
+    for encoding in ("utf-8", "gbk", "gb18030"):
+        try:
+            # Not final: the sample may end inside a multi-byte character
+            codecs.getincrementaldecoder(encoding)().decode(sample, final=False)
+            return encoding
+        except UnicodeDecodeError:
+            continue
+    return "utf-8"
+
+
+def iter_decoded_chunks(path, chunk_bytes=None):
+    """Decoded text of a file in chunks of about chunk_bytes bytes"""
+    chunk_bytes = settings.PLAIN_TEXT_CHUNK_BYTES if chunk_bytes is None else chunk_bytes
+    # Whole pages, so the pages of each finished chunk can be released
+    chunk_bytes = max(mmap.PAGESIZE, chunk_bytes - chunk_bytes % mmap.PAGESIZE)
+    if os.path.getsize(path) == 0:
+        return
+
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        if hasattr(mapped, "madvise"):
+            mapped.madvise(mmap.MADV_SEQUENTIAL)
+        encoding = sniff_encoding(mapped[:SNIFF_BYTES])
+        # The incremental decoder carries characters split between chunks over to the next one
+        decoder = codecs.getincrementaldecoder(encoding)(errors="replace")
+        size = len(mapped)
+        for start in range(0, size, chunk_bytes):
+            end = min(size, start + chunk_bytes)
+            text = decoder.decode(mapped[start:end], final=end == size)
+            if hasattr(mmap, "MADV_DONTNEED"):
+                mapped.madvise(mmap.MADV_DONTNEED, start, end - start)
+            if text:
+                yield text
@@ -0,0 +1,113 @@
+import logging
+import threading
+import time
+
+import psycopg2
+import psycopg2.extensions
+from psycopg2.pool import ThreadedConnectionPool
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class RemoteConnection(psycopg2.extensions.connection):
+    """psycopg2 connection that remembers its prepared statements and last use"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared_statements = set()
+        self.last_used = time.monotonic()
+
+
+_pool = None
+_pool_slots = None
+_pool_lock = threading.Lock()
+
+
+def get_remote_pool():
+    """Create the shared remote connection pool on first use"""
+    global _pool, _pool_slots
+    with _pool_lock:
+        if _pool is None:
+            options = ""
+            if settings.REMOTE_DB_STATEMENT_TIMEOUT:
+                options = f"-c statement_timeout={int(settings.REMOTE_DB_STATEMENT_TIMEOUT * 1000)}"
+            _pool = ThreadedConnectionPool(
+                settings.REMOTE_DB_POOL_MIN,
+                settings.REMOTE_DB_POOL_MAX,
+                host=settings.REMOTE_DB_HOST,
+                port=settings.REMOTE_DB_PORT,
+                database=settings.REMOTE_DB_NAME,
+                user=settings.REMOTE_DB_USER,
+                password=settings.REMOTE_DB_PASSWORD,
+                connect_timeout=settings.REMOTE_DB_CONNECT_TIMEOUT,
+                options=options,
+                connection_factory=RemoteConnection,
+            )
+            # ThreadedConnectionPool raises when exhausted, the semaphore makes callers wait instead
+            _pool_slots = threading.BoundedSemaphore(settings.REMOTE_DB_POOL_MAX)
+            logger.info("Created remote database connection pool")
+        return _pool
+
+
+def _is_healthy(conn):
+    """Check a pooled connection before handing it out"""
+    if conn.closed:
+        return False
+    if time.monotonic() - conn.last_used < settings.REMOTE_DB_HEALTH_CHECK_INTERVAL:
+        return True
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT 1")
+        conn.rollback()
+        return True
+    except psycopg2.Error:
+        return False
+
+
+def acquire_remote_connection():
+    """Borrow a healthy connection from the pool, waiting up to REMOTE_DB_POOL_TIMEOUT seconds"""
+    pool = get_remote_pool()
+    if not _pool_slots.acquire(timeout=settings.REMOTE_DB_POOL_TIMEOUT):
+        raise TimeoutError("Timed out waiting for a remote database connection")
+
+    try:
+        # Each broken connection is discarded, the pool opens a replacement
+        for _ in range(settings.REMOTE_DB_POOL_MAX + 1):
+            conn = pool.getconn()
+            if _is_healthy(conn):
+                conn.last_used = time.monotonic()
+                return conn
+            logger.warning("Discarding broken remote database connection")
+            pool.putconn(conn, close=True)
+        raise psycopg2.OperationalError("Could not obtain a healthy remote database connection")
+    except Exception:
+        _pool_slots.release()
+        raise
+
+
+def release_remote_connection(conn):
+    """Return a connection to the pool, ending any open transaction"""
+    pool = get_remote_pool()
+    discard = conn.closed
+    if not discard:
+        try:
+            conn.rollback()
+            conn.last_used = time.monotonic()
+        except psycopg2.Error:
+            discard = True
+    try:
+        pool.putconn(conn, close=discard)
+    finally:
+        _pool_slots.release()
+
+
+def close_remote_pool():
+    """Close all pooled connections"""
+    global _pool, _pool_slots
+    with _pool_lock:
+        if _pool is not None:
+            _pool.closeall()
+            _pool = None
+            _pool_slots = None
@@ -0,0 +1,77 @@
+"""Streaming text extraction from XLSX and XLS workbooks.
+
+Workbooks are read row by row instead of being loaded whole: openpyxl in
+read-only mode with values only, xlrd on demand with each sheet released
+after it is read. Rows are joined into text chunks of about
+SPREADSHEET_CHUNK_CHARS characters, so detection can run on each chunk while
+the rest of the workbook is still being read. At most SPREADSHEET_MAX_ROWS
+rows are read per workbook.
+"""
+import os
+
+import openpyxl
+import xlrd
+
+from config import settings
+
+
+SPREADSHEET_EXTENSIONS = (".xlsx", ".xls")
+
+
+def iter_xlsx_rows(xlsx_path):
+    """Text of every row of an XLSX workbook, sheet by sheet"""
+    # Opened as a file object, so openpyxl does not reject a misnamed workbook by its extension
+    with open(xlsx_path, "rb") as f:
+        workbook = openpyxl.load_workbook(f, read_only=True, data_only=True)
+        try:
+            for sheet in workbook.worksheets:
+                for row in sheet.iter_rows(values_only=True):
+                    yield " ".join([str(cell) if cell else "" for cell in row])
+        finally:
+            # Read-only workbooks keep the file open until closed
+            workbook.close()
+
+
+def iter_xls_rows(xls_path):
+    """Text of every row of an XLS workbook, loading one sheet at a time"""
+    workbook = xlrd.open_workbook(xls_path, on_demand=True)
+    try:
+        for sheet_index in range(workbook.nsheets):
+            sheet = workbook.sheet_by_index(sheet_index)
+            for row_idx in range(sheet.nrows):
+                yield " ".join([str(value) for value in sheet.row_values(row_idx) if value is not None])
+            workbook.unload_sheet(sheet_index)
+    finally:
+        workbook.release_resources()
+
+
+def iter_spreadsheet_rows(path, file_type=None):
+    """Rows of an XLSX or XLS workbook, at most SPREADSHEET_MAX_ROWS"""
+    if file_type is None:
+        _, file_type = os.path.splitext(path.lower())
+    rows = iter_xls_rows(path) if file_type == ".xls" else iter_xlsx_rows(path)
+    try:
+        for count, row in enumerate(rows):
+            if settings.SPREADSHEET_MAX_ROWS > 0 and count >= settings.SPREADSHEET_MAX_ROWS:
+                print(f"Only the first {settings.SPREADSHEET_MAX_ROWS} rows of {path} are read")
+                break
+            yield row
+    finally:
+        # Closes the workbook when reading stops early
+        rows.close()
+
+
+def iter_text_chunks(rows, chunk_chars=None):
+    """Join rows into newline-terminated chunks of about chunk_chars characters"""
+    chunk_chars = settings.SPREADSHEET_CHUNK_CHARS if chunk_chars is None else chunk_chars
+    lines = []
+    size = 0
+    for row in rows:
+        lines.append(row)
+        size += len(row) + 1
+        if size >= chunk_chars:
+            yield "\n".join(lines) + "\n"
+            lines = []
+            size = 0
+    if lines:
+        yield "\n".join(lines) + "\n"
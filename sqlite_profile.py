@@ -0,0 +1,105 @@
+"""SQLite engine profiles for the local database.
+
+The "performance" profile switches SQLite to WAL with synchronous=NORMAL, a
+larger page cache, memory-mapped reads and a busy timeout. Writes go through a
+single process-wide writer gate: the first write statement of a transaction
+waits for the gate and opens it with BEGIN IMMEDIATE, and the gate is released
+on commit or rollback. Reads outside a write transaction run in autocommit
+mode, so a long-lived session never holds a stale read snapshot that would
+fail when it later upgrades to a writer. API reads use a separate read-only
+connection pool.
+"""
+import threading
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.exc import OperationalError
+
+from config import settings
+from text_codec import register_sqlite_functions
+
+
+WRITE_STATEMENTS = ("INSERT", "UPDATE", "DELETE", "REPLACE", "CREATE", "DROP", "ALTER")
+
+
+class SQLiteWriteGate:
+    """Serialise write transactions of all connections of an engine"""
+
+    def __init__(self, timeout):
+        self.timeout = timeout
+        self.lock = threading.Lock()
+
+    def install(self, engine):
+        event.listen(engine, "before_cursor_execute", self.before_cursor_execute)
+        event.listen(engine, "commit", self.release)
+        event.listen(engine, "rollback", self.release)
+        # Connections returned to the pool mid-transaction are rolled back by the pool
+        event.listen(engine.pool, "checkin", lambda dbapi_connection, record: self._release(record.info))
+
+    def before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if "write_gate" in conn.info or not statement.lstrip()[:7].upper().startswith(WRITE_STATEMENTS):
+            return
+        if not self.lock.acquire(timeout=self.timeout):
+            raise OperationalError(statement, parameters, TimeoutError("Timed out waiting for the SQLite writer"))
+        conn.info["write_gate"] = True
+        try:
+            cursor.execute("BEGIN IMMEDIATE")
+        except Exception:
+            self._release(conn.info)
+            raise
+
+    def release(self, conn):
+        self._release(conn.info)
+
+    def _release(self, info):
+        if info.pop("write_gate", None):
+            self.lock.release()
+
+
+def _set_pragmas(dbapi_connection, read_only):
+    register_sqlite_functions(dbapi_connection)
+    cursor = dbapi_connection.cursor()
+    try:
+        if not read_only:
+            cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        # A negative cache_size is in KiB
+        cursor.execute(f"PRAGMA cache_size=-{settings.SQLITE_CACHE_SIZE_MB * 1024}")
+        cursor.execute(f"PRAGMA mmap_size={settings.SQLITE_MMAP_SIZE_MB * 1024 * 1024}")
+        cursor.execute(f"PRAGMA busy_timeout={int(settings.SQLITE_BUSY_TIMEOUT * 1000)}")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+        if read_only:
+            cursor.execute("PRAGMA query_only=ON")
+    finally:
+        cursor.close()
+
+
+def create_sqlite_engines(database_url, profile="default"):
+    """Return the (write engine, read engine) pair for a SQLite database URL.
+
+    The default profile keeps a single engine with the driver defaults. All
+    connections get the decompress_text() SQL function.
+    """
+    if profile != "performance":
+        engine = create_engine(database_url)
+        event.listen(engine, "connect", lambda dbapi_connection, record: register_sqlite_functions(dbapi_connection))
+        return engine, engine
+
+    # The driver must not open transactions on its own, the writer gate does
+    connect_args = {"timeout": settings.SQLITE_BUSY_TIMEOUT, "check_same_thread": False, "isolation_level": None}
+    write_engine = create_engine(database_url, connect_args=connect_args)
+    event.listen(write_engine, "connect", lambda dbapi_connection, record: _set_pragmas(dbapi_connection, False))
+    SQLiteWriteGate(settings.SQLITE_BUSY_TIMEOUT).install(write_engine)
+
+    # Make sure the database is in WAL mode before readers connect
+    with write_engine.connect():
+        pass
+
+    read_engine = create_engine(
+        database_url,
+        connect_args=connect_args,
+        pool_size=settings.SQLITE_READ_POOL_SIZE,
+        max_overflow=0,
+        pool_timeout=settings.SQLITE_BUSY_TIMEOUT,
+    )
+    event.listen(read_engine, "connect", lambda dbapi_connection, record: _set_pragmas(dbapi_connection, True))
+    return write_engine, read_engine
@@ -0,0 +1,74 @@
+from datetime import datetime
+
+from sqlalchemy import case, func, insert, select
+from sqlalchemy.orm import Session
+
+from models import Attachment, SiteStatistic
+
+
+def rebuild_site_statistics(db: Session, site_owners=None):
+    """Recompute per-site counters with a single GROUP BY over attachments.
+
+    When site_owners is given only those sites are refreshed, otherwise the
+    whole table is rebuilt. The caller is responsible for committing.
+    """
+    site_owner = Attachment.site_id
+    aggregate = select(
+        site_owner,
+        func.count(Attachment.id),
+        func.coalesce(func.sum(case((Attachment.has_id_card == True, 1), else_=0)), 0),
+        func.coalesce(func.sum(case((Attachment.has_phone == True, 1), else_=0)), 0),
+        func.now(),
+    ).where(
+        Attachment.site_id.isnot(None),
+        Attachment.is_deleted.isnot(True)
+    ).group_by(Attachment.site_id)
+
+    delete_query = db.query(SiteStatistic)
+    if site_owners is not None:
+        site_owners = [str(owner) for owner in site_owners]
+        if not site_owners:
+            return
+        aggregate = aggregate.where(site_owner.in_(site_owners))
+        delete_query = delete_query.filter(SiteStatistic.site_owner.in_(site_owners))
+
+    delete_query.delete(synchronize_session=False)
+    db.execute(insert(SiteStatistic).from_select(
+        [
+            SiteStatistic.site_owner,
+            SiteStatistic.total_attachments,
+            SiteStatistic.attachments_with_id_card,
+            SiteStatistic.attachments_with_phone,
+            SiteStatistic.updated_datetime,
+        ],
+        aggregate,
+    ))
+
+
+def ensure_site_statistics(db: Session):
+    """Build the statistics table on first start for databases created before it existed"""
+    if db.query(SiteStatistic.site_owner).first() is None and db.query(Attachment.id).first() is not None:
+        rebuild_site_statistics(db)
+        db.commit()
+
+
+def apply_detection_delta(db: Session, site_owner, old_has_id_card, old_has_phone, new_has_id_card, new_has_phone):
+    """Adjust the counters of one site after an attachment's detection flags changed.
+
+    The caller is responsible for committing.
+    """
+    id_card_delta = int(bool(new_has_id_card)) - int(bool(old_has_id_card))
+    phone_delta = int(bool(new_has_phone)) - int(bool(old_has_phone))
+    if site_owner is None or (id_card_delta == 0 and phone_delta == 0):
+        return
+
+    updated = db.query(SiteStatistic).filter(SiteStatistic.site_owner == str(site_owner)).update({
+        SiteStatistic.attachments_with_id_card: SiteStatistic.attachments_with_id_card + id_card_delta,
+        SiteStatistic.attachments_with_phone: SiteStatistic.attachments_with_phone + phone_delta,
+        SiteStatistic.updated_datetime: datetime.utcnow(),
+    }, synchronize_session=False)
+
+    if not updated:
+        # Site has no counters yet, build them from the attachments table
+        db.flush()
+        rebuild_site_statistics(db, [site_owner])
@@ -1,33 +1,65 @@
-import psycopg2
 from sqlalchemy.orm import Session
-from models import Site, Attachment
+from models import Site, Attachment, SyncState, SyncRun
 from config import settings
-from datetime import datetime
+from datetime import datetime, timedelta
 import requests
 import os
 from utils import extract_text_from_file, contains_id_card, contains_phone
+from stats import rebuild_site_statistics
+from cache import bump_data_version
+from remote_db import acquire_remote_connection, release_remote_connection
 import logging
+import queue
+import threading
+import time
+from collections import namedtuple
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
+# Remote attachments joined to their storage file. '%%' is a literal '%' because
+# the queries are always executed with a parameter list.
+ATTACHMENT_FROM_CLAUSE = """
+            FROM wbnewsfile AS f
+            LEFT JOIN wbstoragefile s ON s.wbshorturl =
+                CASE
+                    WHEN f.wbfilepath LIKE '%%?%%' THEN SUBSTRING(f.wbfilepath, 1, POSITION('?' IN f.wbfilepath) - 1)
+                    ELSE f.wbfilepath
+                END
+            WHERE s.wburlpath is not null
+            """
+
+
+# Key map entry for a row already written by a flush of this sync. Pending
+# writes are dicts that later duplicates update in place, which would no
+# longer reach the database once the dict is written. id is None for rows
+# inserted by this sync; it is looked up if a later duplicate needs it.
+WrittenRow = namedtuple("WrittenRow", ["id", "create_date"])
+
+
+ATTACHMENT_COLUMNS = "SELECT f.owner, f.wbshowname, f.wbfilepath, s.wburlpath, f.wbext, f.wbcreatedate"
+ATTACHMENT_KEY_COLUMNS = "SELECT f.wbfilepath, s.wburlpath"
+
+# Per-site statements, prepared once per pooled connection. Site result sets are
+# small, so they are executed on a regular cursor rather than a server-side one.
+PREPARED_STATEMENTS = {
+    "sync_site_attachments": ATTACHMENT_COLUMNS + ATTACHMENT_FROM_CLAUSE + " AND f.owner = $1",
+    "sync_site_attachments_since": ATTACHMENT_COLUMNS + ATTACHMENT_FROM_CLAUSE + " AND f.owner = $1 AND f.wbcreatedate >= $2",
+    "sync_site_attachment_keys": ATTACHMENT_KEY_COLUMNS + ATTACHMENT_FROM_CLAUSE + " AND f.owner = $1",
+}
+
+
 class RemoteDBSync:
     def __init__(self, db_session: Session):
         self.db = db_session
         self.remote_conn = None
         
     def connect_remote_db(self):
-        """Connect to remote PostgreSQL database"""
+        """Borrow a connection to the remote PostgreSQL database from the shared pool"""
         try:
-            self.remote_conn = psycopg2.connect(
-                host=settings.REMOTE_DB_HOST,
-                port=settings.REMOTE_DB_PORT,
-                database=settings.REMOTE_DB_NAME,
-                user=settings.REMOTE_DB_USER,
-                password=settings.REMOTE_DB_PASSWORD
-            )
+            self.remote_conn = acquire_remote_connection()
             logger.info("Connected to remote database successfully")
         except Exception as e:
             logger.error(f"Failed to connect to remote database: {str(e)}")
@@ -38,9 +70,11 @@ class RemoteDBSync:
         if not self.remote_conn:
             self.connect_remote_db()
 
-        try:
-            cursor = self.remote_conn.cursor()
+        started = datetime.utcnow()
+        counts = {"inserted": 0, "updated": 0, "unchanged": 0}
+        total_rows = 0
 
+        try:
             # Query to get site information - sync ALL sites
             query = """
             SELECT
@@ -55,140 +89,660 @@ class RemoteDBSync:
             LEFT JOIN wbvirhost h ON h.owner = f.wbfirmid
             """
 
-            cursor.execute(query)
-            results = cursor.fetchall()
+            # Preload existing sites so each remote row is matched in memory
+            existing_sites = {
+                row.owner: row
+                for row in self.db.query(
+                    Site.id, Site.owner, Site.account, Site.name, Site.domain,
+                    Site.state, Site.alias_domains, Site.create_date
+                )
+            }
 
-            # Update local database
-            for row in results:
+            inserts = []
+            updates = []
+            # Owners whose existing_sites entry is a pending write
+            pending_owners = []
+            for row in self._iter_remote_rows("sync_sites", query):
+                total_rows += 1
                 owner, account, name, create_date, domain, state, aliasdomains = row
 
                 # Handle NULL values
-                domain = domain or ""
-                state = state or 0
-                aliasdomains = aliasdomains or ""
-                create_date = create_date or None
-
-                # Check if site already exists, update if it does, otherwise create new
-                existing_site = self.db.query(Site).filter(Site.owner == owner).first()
-
-                if existing_site:
-                    existing_site.account = account
-                    existing_site.name = name
-                    existing_site.domain = domain
-                    existing_site.state = state
-                    existing_site.alias_domains = aliasdomains
-                    existing_site.create_date = create_date
+                values = {
+                    "owner": owner,
+                    "account": account,
+                    "name": name,
+                    "domain": domain or "",
+                    "state": state or 0,
+                    "alias_domains": aliasdomains or "",
+                    "create_date": create_date or None,
+                }
+
+                # Later duplicates of the same owner (one row per virtual host)
+                # update the pending write, or write the site again once flushed
+                existing_site = existing_sites.get(owner)
+                if existing_site is None:
+                    inserts.append(values)
+                    existing_sites[owner] = values
+                    pending_owners.append(owner)
+                    counts["inserted"] += 1
+                elif isinstance(existing_site, dict):
+                    existing_site.update(values)
+                elif isinstance(existing_site, WrittenRow):
+                    site_id = existing_site.id or self.db.query(Site.id).filter(Site.owner == owner).scalar()
+                    existing_sites[owner] = {"id": site_id, **values}
+                    updates.append(existing_sites[owner])
+                    pending_owners.append(owner)
+                elif any(getattr(existing_site, key) != value for key, value in values.items()):
+                    existing_sites[owner] = {"id": existing_site.id, **values}
+                    updates.append(existing_sites[owner])
+                    pending_owners.append(owner)
+                    counts["updated"] += 1
                 else:
-                    site = Site(
-                        owner=owner,
-                        account=account,
-                        name=name,
-                        domain=domain,
-                        state=state,
-                        alias_domains=aliasdomains,
-                        create_date=create_date
-                    )
-                    self.db.add(site)
+                    counts["unchanged"] += 1
 
+                # Write while the next chunk is being fetched
+                if len(inserts) + len(updates) >= settings.SYNC_BATCH_SIZE:
+                    self._flush_pending(Site, inserts, updates, existing_sites, pending_owners)
+
+            self._flush_pending(Site, inserts, updates, existing_sites, pending_owners)
             self.db.commit()
-            logger.info(f"Synced {len(results)} sites from remote database")
+            bump_data_version()
+            logger.info(f"Synced {total_rows} sites from remote database: {counts}")
+            record_sync_run(self.db, "sites", "full", started, total_rows, counts)
+            return counts
 
         except Exception as e:
             logger.error(f"Error syncing sites: {str(e)}")
             self.db.rollback()
+            record_sync_run(self.db, "sites", "full", started, total_rows, counts, error=e)
             raise
-        finally:
-            cursor.close()
 
-    def sync_attachments(self, site_owner_filter=None):
-        """Sync attachment information from remote database"""
+    def sync_attachments(self, site_owner_filter=None, full=False):
+        """Sync attachment information from remote database.
+
+        Unless full is set, only remote rows created at or after the stored
+        high-water mark are fetched. A key-set diff against the remote side
+        marks removed attachments as deleted; it runs on full syncs and at
+        most every SYNC_DELETION_CHECK_HOURS otherwise.
+        """
         if not self.remote_conn:
             self.connect_remote_db()
 
-        try:
-            cursor = self.remote_conn.cursor()
+        started = datetime.utcnow()
+        state_name = sync_state_name(site_owner_filter)
+        state = self.db.get(SyncState, state_name) or SyncState(name=state_name)
+        incremental = not full and state.high_water_mark is not None
+        mode = "incremental" if incremental else "full"
+        upserter = AttachmentUpserter(self.db)
+        total_rows = 0
 
+        try:
             # Query to get attachment information
-            query = """
-            SELECT f.owner, f.wbshowname, f.wbfilepath, s.wburlpath, f.wbext, f.wbcreatedate
-            FROM wbnewsfile AS f
-            LEFT JOIN wbstoragefile s ON s.wbshorturl =
-                CASE
-                    WHEN f.wbfilepath LIKE '%?%' THEN SUBSTRING(f.wbfilepath, 1, POSITION('?' IN f.wbfilepath) - 1)
-                    ELSE f.wbfilepath
-                END
-            WHERE s.wburlpath is not null
-            """
-
             if site_owner_filter:
-                query += f" AND f.owner = '{site_owner_filter}'"
-
-            cursor.execute(query)
-            results = cursor.fetchall()
-
-            # Update local database
-            for row in results:
-                owner, wbshowname, wbfilepath, wburlpath, wbext, wbcreatedate = row
-
-                # Check if attachment already exists
-                # Normalize the URL path by adding the base URL prefix if not already present
-                full_url_path = wburlpath
-                if wburlpath and not wburlpath.startswith(('http://', 'https://')):
-                    if settings.ATTACHMENT_DEFAULT_BASE_URL:
-                        full_url_path = f"{settings.ATTACHMENT_DEFAULT_BASE_URL}{wburlpath}"
-                    else:
-                        full_url_path = wburlpath
-
-                existing_attachment = self.db.query(Attachment).filter(
-                    Attachment.file_path == wbfilepath,
-                    Attachment.url_path == wburlpath  # Use original path for lookup to maintain consistency
-                ).first()
-
-                # Only update if there's no existing record or the new record has a newer create_date
-                if existing_attachment:
-                    # If we have an existing record, only update if the new one is newer
-                    if wbcreatedate and (not existing_attachment.create_date or wbcreatedate > existing_attachment.create_date):
-                        existing_attachment.show_name = wbshowname
-                        existing_attachment.site_id = owner
-                        existing_attachment.file_ext = wbext
-                        existing_attachment.create_date = wbcreatedate
-                        # Update the URL path with the base URL prefix
-                        existing_attachment.url_path = full_url_path
+                remote_rows = self.iter_site_attachment_rows(site_owner_filter, state.high_water_mark if incremental else None)
+            else:
+                query = ATTACHMENT_COLUMNS + ATTACHMENT_FROM_CLAUSE
+                params = []
+                # Rows with the same timestamp as the mark may have been committed after the last run
+                if incremental:
+                    query += " AND f.wbcreatedate >= %s"
+                    params.append(state.high_water_mark)
+                remote_rows = self._iter_remote_rows("sync_attachments", query, params)
+
+            upserter.load_existing(site_owner_filter)
+            high_water_mark = state.high_water_mark
+            for row in remote_rows:
+                total_rows += 1
+                upserter.add(row)
+                high_water_mark = max_create_date(high_water_mark, row[5])
+
+            upserter.flush()
+            upserter.clear_existing()
+            state.high_water_mark = high_water_mark
+
+            if full or deletion_check_due(state):
+                if site_owner_filter:
+                    key_rows = self._iter_prepared_rows("sync_site_attachment_keys", [site_owner_filter])
                 else:
-                    # Create new attachment
-                    attachment = Attachment(
-                        site_id=owner,
-                        show_name=wbshowname,
-                        file_path=wbfilepath,
-                        url_path=full_url_path,  # Use the full URL path with base prefix
-                        file_ext=wbext,
-                        create_date=wbcreatedate
-                    )
-                    self.db.add(attachment)
+                    key_rows = self._iter_remote_rows("sync_attachment_keys", ATTACHMENT_KEY_COLUMNS + ATTACHMENT_FROM_CLAUSE, [])
+                deleted, restored = mark_deleted_attachments(self.db, remote_key_hashes(key_rows), site_owner_filter)
+                upserter.counts["deleted"] = deleted
+                upserter.counts["restored"] = restored
+                state.last_deletion_check = started
+
+            self.db.merge(state)
+
+            # Refresh the per-site counters for the synced sites
+            self.db.flush()
+            rebuild_site_statistics(self.db, [site_owner_filter] if site_owner_filter else None)
 
             self.db.commit()
-            logger.info(f"Synced {len(results)} attachments from remote database")
+            bump_data_version()
+            logger.info(f"Synced {total_rows} attachments from remote database ({mode}): {upserter.counts}")
+            record_sync_run(self.db, "attachments", mode, started, total_rows, upserter.counts, site_owner=site_owner_filter)
+            return upserter.counts
 
         except Exception as e:
             logger.error(f"Error syncing attachments: {str(e)}")
             self.db.rollback()
+            record_sync_run(self.db, "attachments", mode, started, total_rows, upserter.counts, site_owner=site_owner_filter, error=e)
             raise
+
+    def iter_site_attachment_rows(self, site_owner, since=None):
+        """Yield the remote attachment rows of one site, optionally only those created since a date"""
+        if since is not None:
+            return self._iter_prepared_rows("sync_site_attachments_since", [site_owner, since])
+        return self._iter_prepared_rows("sync_site_attachments", [site_owner])
+
+    def iter_site_attachment_keys(self, site_owner):
+        """Yield the remote (file path, URL path) keys of one site"""
+        return self._iter_prepared_rows("sync_site_attachment_keys", [site_owner])
+
+    def _iter_remote_rows(self, cursor_name, query, params=None):
+        """Yield rows from a named server-side cursor on the remote database.
+
+        Chunks of REMOTE_FETCH_ITERSIZE rows are fetched by a background thread
+        into a small bounded queue, so the next chunk is transferred while the
+        caller writes the current one and at most a few chunks are in memory.
+        """
+        chunks = queue.Queue(maxsize=2)
+        stop = threading.Event()
+        finished = object()
+
+        def put(item):
+            while not stop.is_set():
+                try:
+                    chunks.put(item, timeout=0.5)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def fetch():
+            cursor = self.remote_conn.cursor(name=cursor_name)
+            cursor.itersize = settings.REMOTE_FETCH_ITERSIZE
+            try:
+                cursor.execute(query, params)
+                while True:
+                    rows = cursor.fetchmany(settings.REMOTE_FETCH_ITERSIZE)
+                    if not rows or not put(rows):
+                        break
+                put(finished)
+            except Exception as e:
+                put(e)
+            finally:
+                cursor.close()
+
+        fetcher = threading.Thread(target=fetch, name=f"{cursor_name}_fetch", daemon=True)
+        fetcher.start()
+        try:
+            while True:
+                item = chunks.get()
+                if item is finished:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                yield from item
         finally:
-            cursor.close()
+            stop.set()
+            fetcher.join()
+
+    def _iter_prepared_rows(self, statement_name, params):
+        """Yield rows of one of PREPARED_STATEMENTS, preparing it on first use on this connection"""
+        if statement_name not in self.remote_conn.prepared_statements:
+            with self.remote_conn.cursor() as cursor:
+                # An empty parameter tuple still unescapes '%%'
+                cursor.execute(f"PREPARE {statement_name} AS {PREPARED_STATEMENTS[statement_name]}", ())
+            self.remote_conn.prepared_statements.add(statement_name)
+
+        placeholders = ", ".join(["%s"] * len(params))
+        with self.remote_conn.cursor() as cursor:
+            cursor.execute(f"EXECUTE {statement_name} ({placeholders})", params)
+            while True:
+                rows = cursor.fetchmany(settings.REMOTE_FETCH_ITERSIZE)
+                if not rows:
+                    break
+                yield from rows
+
+    def _flush_pending(self, model, inserts, updates, existing, pending_keys):
+        """Write pending rows, clear the pending lists and mark the rows as written in the key map"""
+        bulk_write(self.db, model, inserts, updates)
+        inserts.clear()
+        updates.clear()
+        mark_written(existing, pending_keys)
 
     def sync_all_sites(self):
         """Sync all sites (this is always done as one batch)"""
-        self.sync_sites()
+        return self.sync_sites()
 
-    def sync_all_attachments(self):
+    def sync_all_attachments(self, full=False):
         """Sync all attachments"""
-        self.sync_attachments()
+        return self.sync_attachments(full=full)
 
-    def sync_attachments_for_site(self, site_owner):
+    def sync_attachments_for_site(self, site_owner, full=False):
         """Sync attachments for a specific site"""
-        self.sync_attachments(site_owner_filter=site_owner)
+        return self.sync_attachments(site_owner_filter=site_owner, full=full)
 
     def close(self):
-        """Close connections"""
+        """Return the remote connection to the pool"""
         if self.remote_conn:
-            self.remote_conn.close()
\ No newline at end of file
+            release_remote_connection(self.remote_conn)
+            self.remote_conn = None
+
+
+class AttachmentUpserter:
+    """Match remote attachment rows against local ones and write them in batches.
+
+    Existing keys are preloaded into a dict, rows are classified as inserted,
+    updated (remote row is newer) or unchanged, and pending writes are flushed
+    every SYNC_BATCH_SIZE rows. The caller is responsible for committing.
+    """
+
+    def __init__(self, db: Session):
+        self.db = db
+        self.existing = {}
+        self.inserts = []
+        self.updates = []
+        # Keys whose entry in existing is a pending write
+        self.pending_keys = []
+        self.counts = {"inserted": 0, "updated": 0, "unchanged": 0, "deleted": 0, "restored": 0}
+
+    def load_existing(self, site_owner=None):
+        """Preload the existing attachment keys, for one site or for all of them"""
+        query = self.db.query(Attachment.id, Attachment.file_path, Attachment.url_path, Attachment.create_date)
+        if site_owner:
+            query = query.filter(Attachment.site_id == site_owner)
+        self.existing = {(row.file_path, row.url_path): row for row in query}
+
+    def clear_existing(self):
+        self.existing = {}
+
+    def add(self, row):
+        """Queue one remote row and return "inserted", "updated", "unchanged" or None for a merged duplicate"""
+        existing = self.existing
+        owner, wbshowname, wbfilepath, wburlpath, wbext, wbcreatedate = row
+
+        # Normalize the URL path by adding the base URL prefix if not already present
+        full_url_path = full_attachment_url_path(wburlpath)
+
+        values = {
+            "site_id": owner,
+            "show_name": wbshowname,
+            "file_path": wbfilepath,
+            "url_path": full_url_path,  # Use the full URL path with base prefix
+            "file_ext": wbext,
+            "create_date": wbcreatedate,
+        }
+
+        # Attachments are stored with the full URL path, older rows may still have the remote path
+        key = (wbfilepath, full_url_path)
+        existing_attachment = existing.get(key)
+        if existing_attachment is None:
+            existing_attachment = existing.get((wbfilepath, wburlpath))
+
+        if existing_attachment is None:
+            self.inserts.append(values)
+            # Later duplicates of the same key update the pending insert
+            existing[key] = values
+            self.pending_keys.append(key)
+            outcome = "inserted"
+        elif self._is_newer(existing_attachment, wbcreatedate):
+            # If we have an existing record, only update if the new one is newer
+            if isinstance(existing_attachment, dict):
+                existing_attachment.update(values)
+                outcome = None
+            else:
+                if isinstance(existing_attachment, WrittenRow):
+                    # A duplicate of a row written by an earlier flush: write it again, counted once
+                    attachment_id = existing_attachment.id or self._written_id(key)
+                    outcome = None
+                else:
+                    attachment_id = existing_attachment.id
+                    outcome = "updated"
+                pending_update = {"id": attachment_id, **values}
+                self.updates.append(pending_update)
+                existing[key] = pending_update
+                self.pending_keys.append(key)
+        else:
+            outcome = "unchanged"
+
+        if outcome:
+            self.counts[outcome] += 1
+        if len(self.inserts) + len(self.updates) >= settings.SYNC_BATCH_SIZE:
+            self.flush()
+        return outcome
+
+    def flush(self):
+        """Write pending inserts and updates"""
+        bulk_write(self.db, Attachment, self.inserts, self.updates)
+        self.inserts = []
+        self.updates = []
+        mark_written(self.existing, self.pending_keys)
+
+    def _written_id(self, key):
+        """Id of an attachment inserted by an earlier flush"""
+        file_path, url_path = key
+        return self.db.query(Attachment.id).filter(
+            Attachment.file_path == file_path, Attachment.url_path == url_path
+        ).scalar()
+
+    @staticmethod
+    def _is_newer(existing_attachment, wbcreatedate):
+        """Whether a remote row is newer than the local (or pending) attachment"""
+        if isinstance(existing_attachment, dict):
+            existing_create_date = existing_attachment["create_date"]
+        else:
+            existing_create_date = existing_attachment.create_date
+        return bool(wbcreatedate) and (not existing_create_date or wbcreatedate > existing_create_date)
+
+
+def bulk_write(db: Session, model, inserts, updates):
+    """Write pending inserts and primary-key updates in batches of SYNC_BATCH_SIZE"""
+    from sqlalchemy import insert, update
+
+    batch_size = settings.SYNC_BATCH_SIZE
+    for start in range(0, len(inserts), batch_size):
+        db.execute(insert(model), inserts[start:start + batch_size])
+    for start in range(0, len(updates), batch_size):
+        db.execute(update(model), updates[start:start + batch_size])
+
+
+def mark_written(existing, pending_keys):
+    """Replace the pending writes of a key map by WrittenRow markers once flushed, and clear pending_keys"""
+    for key in pending_keys:
+        values = existing.get(key)
+        if isinstance(values, dict):
+            existing[key] = WrittenRow(values.get("id"), values.get("create_date"))
+    pending_keys.clear()
+
+
+def full_attachment_url_path(wburlpath):
+    """Prefix a remote URL path with the attachment base URL if it is relative"""
+    if wburlpath and not wburlpath.startswith(('http://', 'https://')) and settings.ATTACHMENT_DEFAULT_BASE_URL:
+        return f"{settings.ATTACHMENT_DEFAULT_BASE_URL}{wburlpath}"
+    return wburlpath
+
+
+def max_create_date(current, candidate):
+    """Return the newer of two optional create dates"""
+    if candidate and (current is None or candidate > current):
+        return candidate
+    return current
+
+
+def sync_state_name(site_owner=None):
+    """Name of the sync_states row for all attachments or for one site"""
+    return f"attachments:{site_owner}" if site_owner else "attachments"
+
+
+def deletion_check_due(state: SyncState):
+    """Whether the remote key-set diff should run on an incremental sync"""
+    return (
+        state.last_deletion_check is None
+        or datetime.utcnow() - state.last_deletion_check >= timedelta(hours=settings.SYNC_DELETION_CHECK_HOURS)
+    )
+
+
+def remote_key_hashes(key_rows):
+    """Hash remote (file path, URL path) keys in both raw and full URL form.
+
+    Only the hashes are kept in memory, so the key set stays small.
+    """
+    remote_keys = set()
+    for wbfilepath, wburlpath in key_rows:
+        remote_keys.add(hash((wbfilepath, wburlpath)))
+        remote_keys.add(hash((wbfilepath, full_attachment_url_path(wburlpath))))
+    return remote_keys
+
+
+def mark_deleted_attachments(db: Session, remote_keys, site_owner=None):
+    """Mark local attachments missing from remote_keys as deleted, and restore reappeared ones"""
+    from sqlalchemy import update
+
+    local_query = db.query(Attachment.id, Attachment.file_path, Attachment.url_path, Attachment.is_deleted)
+    if site_owner:
+        local_query = local_query.filter(Attachment.site_id == site_owner)
+
+    deleted_ids = []
+    restored_ids = []
+    for attachment_id, file_path, url_path, is_deleted in local_query.yield_per(settings.SYNC_BATCH_SIZE):
+        present = hash((file_path, url_path)) in remote_keys
+        if not present and not is_deleted:
+            deleted_ids.append(attachment_id)
+        elif present and is_deleted:
+            restored_ids.append(attachment_id)
+
+    now = datetime.utcnow()
+    batch_size = settings.SYNC_BATCH_SIZE
+    for start in range(0, len(deleted_ids), batch_size):
+        db.execute(
+            update(Attachment)
+            .where(Attachment.id.in_(deleted_ids[start:start + batch_size]))
+            .values(is_deleted=True, deleted_datetime=now)
+        )
+    for start in range(0, len(restored_ids), batch_size):
+        db.execute(
+            update(Attachment)
+            .where(Attachment.id.in_(restored_ids[start:start + batch_size]))
+            .values(is_deleted=False, deleted_datetime=None)
+        )
+
+    logger.info(f"Deletion check: {len(deleted_ids)} attachments deleted, {len(restored_ids)} restored")
+    return len(deleted_ids), len(restored_ids)
+
+
+def record_sync_run(db: Session, kind, mode, started, total_rows, counts, site_owner=None, error=None, finished=None):
+    """Store a sync run with its duration and row counts"""
+    finished = finished or datetime.utcnow()
+    try:
+        db.add(SyncRun(
+            kind=kind,
+            site_owner=site_owner,
+            mode=mode,
+            status="failed" if error else "success",
+            error=str(error) if error else None,
+            started_datetime=started,
+            finished_datetime=finished,
+            duration_seconds=(finished - started).total_seconds(),
+            rows_fetched=total_rows,
+            inserted=counts.get("inserted", 0),
+            updated=counts.get("updated", 0),
+            unchanged=counts.get("unchanged", 0),
+            deleted=counts.get("deleted", 0),
+            restored=counts.get("restored", 0),
+        ))
+        db.commit()
+    except Exception as e:
+        logger.error(f"Failed to record sync run: {str(e)}")
+        db.rollback()
+
+
+class SiteSyncOrchestrator:
+    """Sync attachments site by site with parallel fetches and a single writer.
+
+    Up to SYNC_SITE_WORKERS fetch workers (bounded by the remote pool size)
+    each borrow a pooled connection and run the prepared per-site queries. They
+    hand row chunks to the calling thread through a bounded queue, which is the
+    only thread writing to the local database: rows of all sites share one
+    AttachmentUpserter and are flushed every SYNC_BATCH_SIZE rows. Rows are
+    matched against the keys of all local attachments, as the (file_path,
+    url_path) key is unique across sites. A site's high-water mark is
+    committed once all of its rows are written.
+    """
+
+    def __init__(self, db: Session, site_owners=None, full=False):
+        self.db = db
+        self.site_owners = site_owners
+        self.full = full
+        self.workers = max(1, min(settings.SYNC_SITE_WORKERS, settings.REMOTE_DB_POOL_MAX))
+        self.messages = queue.Queue(maxsize=self.workers * 2)
+        self.stop = threading.Event()
+
+    def run(self):
+        """Sync every site and return the counts and timings per site owner"""
+        from concurrent.futures import ThreadPoolExecutor
+
+        site_owners = self.site_owners
+        if site_owners is None:
+            site_owners = [owner for (owner,) in self.db.query(Site.owner).order_by(Site.owner)]
+
+        states = {}
+        for site_owner in site_owners:
+            name = sync_state_name(site_owner)
+            states[site_owner] = self.db.get(SyncState, name) or SyncState(name=name)
+
+        results = {}
+        executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="site_fetch")
+        try:
+            for site_owner in site_owners:
+                state = states[site_owner]
+                since = None if self.full else state.high_water_mark
+                check_deletions = self.full or deletion_check_due(state)
+                executor.submit(self._fetch_site, site_owner, since, check_deletions)
+            self._write(site_owners, states, results)
+        finally:
+            self.stop.set()
+            executor.shutdown(wait=True)
+
+        if results:
+            rebuild_site_statistics(self.db, list(results))
+            self.db.commit()
+            bump_data_version()
+
+        slowest = sorted(results.items(), key=lambda item: item[1]["fetch_seconds"] + item[1]["write_seconds"], reverse=True)
+        for site_owner, result in slowest[:5]:
+            logger.info(
+                f"Site {site_owner}: {result['rows']} rows, fetch {result['fetch_seconds']:.2f}s, "
+                f"write {result['write_seconds']:.2f}s"
+            )
+        return dict(slowest)
+
+    def _put(self, message):
+        """Queue a message for the writer, giving up once the run is stopped"""
+        while not self.stop.is_set():
+            try:
+                self.messages.put(message, timeout=1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _fetch_site(self, site_owner, since, check_deletions):
+        """Fetch worker: stream one site's rows (and keys when due) to the writer"""
+        fetcher = RemoteDBSync(None)
+        fetch_seconds = 0.0
+        try:
+            fetcher.connect_remote_db()
+            rows = fetcher.iter_site_attachment_rows(site_owner, since)
+            chunk = []
+            fetch_started = time.monotonic()
+            for row in rows:
+                chunk.append(row)
+                if len(chunk) >= settings.REMOTE_FETCH_ITERSIZE:
+                    fetch_seconds += time.monotonic() - fetch_started
+                    if not self._put(("rows", site_owner, chunk)):
+                        return
+                    chunk = []
+                    fetch_started = time.monotonic()
+            fetch_seconds += time.monotonic() - fetch_started
+            if chunk and not self._put(("rows", site_owner, chunk)):
+                return
+
+            remote_keys = None
+            if check_deletions:
+                fetch_started = time.monotonic()
+                remote_keys = remote_key_hashes(fetcher.iter_site_attachment_keys(site_owner))
+                fetch_seconds += time.monotonic() - fetch_started
+            self._put(("done", site_owner, (fetch_seconds, remote_keys)))
+        except Exception as e:
+            logger.error(f"Error fetching attachments for site {site_owner}: {str(e)}")
+            self._put(("error", site_owner, (fetch_seconds, e)))
+        finally:
+            fetcher.close()
+
+    def _write(self, site_owners, states, results):
+        """Writer loop: upsert fetched rows until every site has finished"""
+        upserter = AttachmentUpserter(self.db)
+        # All sites: a row may move to another site, keeping its key
+        upserter.load_existing()
+        pending = set(site_owners)
+        progress = {}
+
+        try:
+            while pending:
+                kind, site_owner, payload = self.messages.get()
+                site = progress.get(site_owner)
+                if site is None:
+                    site = progress[site_owner] = {
+                        "started": datetime.utcnow(),
+                        "mode": "incremental" if not self.full and states[site_owner].high_water_mark is not None else "full",
+                        "rows": 0,
+                        "high_water_mark": states[site_owner].high_water_mark,
+                        "counts": {"inserted": 0, "updated": 0, "unchanged": 0, "deleted": 0, "restored": 0},
+                        "write_seconds": 0.0,
+                    }
+                write_started = time.monotonic()
+
+                if kind == "rows":
+                    for row in payload:
+                        outcome = upserter.add(row)
+                        if outcome:
+                            site["counts"][outcome] += 1
+                        site["high_water_mark"] = max_create_date(site["high_water_mark"], row[5])
+                    site["rows"] += len(payload)
+                    site["write_seconds"] += time.monotonic() - write_started
+                    continue
+
+                pending.discard(site_owner)
+                fetch_seconds, detail = payload
+                state = states[site_owner]
+                error = None
+
+                if kind == "done":
+                    # The mark may only move once the site's rows are written
+                    upserter.flush()
+                    state.high_water_mark = site["high_water_mark"]
+                    if detail is not None:
+                        deleted, restored = mark_deleted_attachments(self.db, detail, site_owner)
+                        site["counts"]["deleted"] = deleted
+                        site["counts"]["restored"] = restored
+                        state.last_deletion_check = site["started"]
+                    self.db.merge(state)
+                    self.db.commit()
+                else:
+                    error = detail
+
+                site["write_seconds"] += time.monotonic() - write_started
+                results[site_owner] = {
+                    **site["counts"],
+                    "rows": site["rows"],
+                    "fetch_seconds": round(fetch_seconds, 3),
+                    "write_seconds": round(site["write_seconds"], 3),
+                }
+                if error is not None:
+                    results[site_owner]["error"] = str(error)
+                record_sync_run(
+                    self.db, "attachments", site["mode"], site["started"],
+                    site["rows"], site["counts"], site_owner=site_owner, error=error,
+                )
+
+            upserter.flush()
+            self.db.commit()
+        except Exception:
+            self.db.rollback()
+            raise
+
+
+def sync_attachments_for_sites(site_owners=None, full=False):
+    """Sync attachments per site with parallel fetches, for the given or all local sites.
+
+    Returns the counts, row totals and fetch/write seconds per site owner,
+    slowest sites first; failed sites carry an error message.
+    """
+    from models import SessionLocal
+
+    db = SessionLocal()
+    try:
+        return SiteSyncOrchestrator(db, site_owners, full=full).run()
+    finally:
+        db.close()
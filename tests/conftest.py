@@ -0,0 +1,36 @@
+"""Shared fixtures for the test suite: a fresh local SQLite database per test."""
+import os
+import sys
+import tempfile
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Modules create their engines on import, so point them away from the real database first
+os.environ["LOCAL_DB_PATH"] = os.path.join(tempfile.mkdtemp(prefix="attachments_test_"), "import.db")
+
+from sqlalchemy.orm import sessionmaker
+
+from models import Base
+from migrations import run_migrations
+from sqlite_profile import create_sqlite_engines
+from text_store import ensure_text_search_index
+
+
+@pytest.fixture
+def engine(tmp_path):
+    """Engine of a database created from the current models, set up as on startup"""
+    engine, _ = create_sqlite_engines(f"sqlite:///{tmp_path / 'local.db'}")
+    Base.metadata.create_all(bind=engine)
+    run_migrations(engine, fresh=True)
+    ensure_text_search_index(engine)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def db(engine):
+    session = sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+    yield session
+    session.close()
@@ -0,0 +1,45 @@
+import json
+
+import utils
+from config import settings
+
+
+def answer(*findings):
+    return json.dumps({"findings": [
+        {"type": finding_type, "value": value, "confidence": confidence}
+        for finding_type, value, confidence in findings
+    ]})
+
+
+def detect(monkeypatch, chunk_answers, image_answer=""):
+    usage = {"prompt_tokens": 0, "completion_tokens": 0, "chunks": len(chunk_answers), "skipped_chunks": 0}
+    monkeypatch.setattr(utils, "analyse_content_in_chunks", lambda content, token_budget=None: (list(chunk_answers), usage))
+    monkeypatch.setattr(utils, "analyse_image", lambda image_path, usage, token_budget=None: image_answer)
+    monkeypatch.setattr(settings, "LLM_VISION_ENABLED", True)
+    return utils.detect_sensitive_info_ai("", image_path="scan.png" if image_answer else None)
+
+
+def test_findings_of_separate_chunks_are_kept(monkeypatch):
+    # 13800000012 and 13899999912 mask alike
+    _, has_phone, llm_content, _, findings = detect(monkeypatch, [
+        answer(("phone", "13800000012", 0.9)),
+        answer(("phone", "13899999912", 0.8)),
+    ])
+
+    assert has_phone
+    assert [(f.type, f.value) for f in findings] == [("phone", "138******12")] * 2
+    assert len(json.loads(llm_content)["findings"]) == 2
+
+
+def test_image_findings_of_the_ocr_text_are_kept_once(monkeypatch):
+    _, _, _, _, findings = detect(
+        monkeypatch,
+        [answer(("phone", "13800000012", 0.6), ("phone", "13899999912", 0.9))],
+        answer(("phone", "138******12", 0.95), ("id_card", "110101199003077777", 0.8)),
+    )
+
+    assert [(f.type, f.value, f.confidence) for f in findings] == [
+        ("phone", "138******12", 0.95),
+        ("id_card", "110*************77", 0.8),
+        ("phone", "138******12", 0.6),
+    ]
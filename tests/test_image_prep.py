@@ -0,0 +1,36 @@
+"""Image preparation for vision requests and its on-disk cache."""
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from PIL import Image
+
+import image_prep
+from config import settings
+
+
+@pytest.fixture
+def cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "ATTACHMENT_CACHE_DIR", str(tmp_path))
+    return tmp_path / ".llm_images"
+
+
+def test_long_image_is_split_into_tiles(tmp_path, cache_dir):
+    path = tmp_path / "screenshot.png"
+    Image.new("RGB", (400, 4000), "white").save(path)
+    prepared = image_prep.prepare_image(str(path))
+
+    assert len(prepared.tiles) > 1
+    assert image_prep.prepare_image(str(path)).tiles == prepared.tiles
+
+
+def test_concurrent_preparation_of_one_image(tmp_path, cache_dir):
+    path = tmp_path / "logo.png"
+    Image.effect_noise((600, 3000), 64).convert("RGB").save(path)
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(executor.map(lambda _: image_prep.prepare_image(str(path)), range(16)))
+
+    assert all(result.tiles == results[0].tiles for result in results)
+    # No temporary files are left behind
+    assert not [name for name in os.listdir(cache_dir) if name.endswith(".tmp")]
+    assert image_prep.prepare_image(str(path)).tiles == results[0].tiles
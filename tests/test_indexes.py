@@ -0,0 +1,110 @@
+"""The hot attachment queries use the declared indexes, on new and on migrated databases."""
+import sqlite3
+
+import pytest
+from sqlalchemy import create_engine, func, select, text
+
+from migrations import run_migrations
+from models import Attachment, Base
+
+# Schema of a database created before versioned migrations
+LEGACY_SCHEMA = """
+CREATE TABLE sites (id INTEGER PRIMARY KEY, owner VARCHAR, account VARCHAR, name VARCHAR, domain VARCHAR,
+    state INTEGER, alias_domains TEXT, create_date DATETIME);
+CREATE INDEX ix_sites_id ON sites(id);
+CREATE INDEX ix_sites_owner ON sites(owner);
+CREATE INDEX ix_sites_domain ON sites(domain);
+CREATE INDEX idx_site_owner ON sites(owner);
+CREATE INDEX idx_site_domain ON sites(domain);
+CREATE TABLE attachments (id INTEGER PRIMARY KEY, site_id INTEGER, show_name VARCHAR, file_path VARCHAR,
+    url_path VARCHAR, file_ext VARCHAR, create_date DATETIME, text_content TEXT, ocr_content TEXT,
+    llm_content TEXT, has_id_card BOOLEAN, has_phone BOOLEAN, manual_verified_sensitive BOOLEAN,
+    verification_notes TEXT, processed_datetime DATETIME, ocr_score FLOAT);
+CREATE INDEX ix_attachments_id ON attachments(id);
+CREATE INDEX ix_attachments_site_id ON attachments(site_id);
+CREATE INDEX idx_attachment_site_id ON attachments(site_id);
+CREATE INDEX idx_attachment_file_ext ON attachments(file_ext);
+CREATE INDEX idx_attachment_has_id_card ON attachments(has_id_card);
+CREATE INDEX idx_attachment_has_phone ON attachments(has_phone);
+INSERT INTO sites (owner, name) VALUES ('12', 'a'), ('13', 'b');
+INSERT INTO attachments (site_id, file_path, url_path, has_id_card) VALUES
+    (12, '/a', '/files/a', 1), (12, '/a', '/files/a', 0), (13, '/b', '/files/b', 0);
+-- Duplicates whose newer row was reviewed or processed
+INSERT INTO attachments (site_id, file_path, url_path, has_id_card, manual_verified_sensitive,
+    verification_notes, processed_datetime) VALUES
+    (13, '/c', '/files/c', 0, 0, '', NULL),
+    (13, '/c', '/files/c', 1, 1, 'Confirmed by reviewer', '2024-05-01 10:00:00'),
+    (13, '/d', '/files/d', 0, 0, '', NULL),
+    (13, '/d', '/files/d', 1, 0, '', '2024-05-01 10:00:00');
+"""
+
+# The query each index exists for, and the index it must use
+INDEXED_QUERIES = [
+    # Per-site sensitive counts and site filters
+    (
+        select(func.count(Attachment.id)).where(Attachment.site_id == "12", Attachment.has_id_card == True),
+        "ix_attachments_site_id_has_id_card",
+    ),
+    # Unprocessed attachments of a site
+    (
+        select(Attachment.id).where(Attachment.site_id == "12", Attachment.processed_datetime.is_(None)),
+        "ix_attachments_site_id_processed_datetime",
+    ),
+    # Sync key lookup
+    (
+        select(Attachment.id, Attachment.create_date).where(
+            Attachment.file_path == "/a", Attachment.url_path == "/files/a"
+        ),
+        "ux_attachments_file_path_url_path",
+    ),
+]
+
+
+@pytest.fixture
+def legacy_engine(tmp_path):
+    """Engine of a legacy database brought up to date as on startup"""
+    path = tmp_path / "legacy.db"
+    connection = sqlite3.connect(path)
+    connection.executescript(LEGACY_SCHEMA)
+    connection.commit()
+    connection.close()
+
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(bind=engine)
+    run_migrations(engine)
+    yield engine
+    engine.dispose()
+
+
+def query_plan(engine, query):
+    sql = str(query.compile(engine, compile_kwargs={"literal_binds": True}))
+    with engine.connect() as conn:
+        return " ".join(row[-1] for row in conn.execute(text("EXPLAIN QUERY PLAN " + sql)))
+
+
+@pytest.mark.parametrize("query, index_name", INDEXED_QUERIES)
+def test_new_database_uses_index(engine, query, index_name):
+    assert index_name in query_plan(engine, query)
+
+
+@pytest.mark.parametrize("query, index_name", INDEXED_QUERIES)
+def test_migrated_database_uses_index(legacy_engine, query, index_name):
+    assert index_name in query_plan(legacy_engine, query)
+
+
+def test_migration_removes_duplicate_keys(legacy_engine):
+    with legacy_engine.connect() as conn:
+        rows = conn.execute(text("SELECT site_id, file_path, has_id_card FROM attachments ORDER BY id")).all()
+    assert rows == [("12", "/a", 1), ("13", "/b", 0), ("13", "/c", 1), ("13", "/d", 1)]
+
+
+def test_migration_keeps_verified_and_processed_duplicates(legacy_engine):
+    with legacy_engine.connect() as conn:
+        rows = conn.execute(text(
+            "SELECT file_path, manual_verified_sensitive, verification_notes, processed_datetime "
+            "FROM attachments WHERE file_path IN ('/c', '/d') ORDER BY file_path"
+        )).all()
+    assert rows == [
+        ("/c", 1, "Confirmed by reviewer", "2024-05-01 10:00:00"),
+        ("/d", 0, "", "2024-05-01 10:00:00"),
+    ]
@@ -0,0 +1,39 @@
+"""Image normalisation before OCR and the OCR image cache."""
+import os
+
+import pytest
+from PIL import Image
+
+import ocr_prep
+from config import settings
+
+
+@pytest.fixture
+def scan(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "ATTACHMENT_CACHE_DIR", str(tmp_path / "cache"))
+    path = tmp_path / "scan.png"
+    Image.new("RGB", (1200, 1600), "white").save(path)
+    return str(path)
+
+
+def cache_entries():
+    directory = os.path.join(settings.ATTACHMENT_CACHE_DIR, ".ocr_images")
+    return os.listdir(directory) if os.path.isdir(directory) else []
+
+
+def test_pages_are_cached(scan):
+    pages = ocr_prep.ocr_pages(scan)
+
+    assert len(pages) == 1 and os.path.exists(pages[0])
+    assert ocr_prep.ocr_pages(scan) == pages
+    assert len(cache_entries()) == 2  # The page and its manifest
+
+
+def test_transient_pages_are_removed_and_not_cached(scan):
+    with ocr_prep.transient_ocr_pages(scan) as pages:
+        assert len(pages) == 1 and os.path.exists(pages[0])
+        with Image.open(pages[0]) as page:
+            assert page.mode == "L"
+
+    assert not os.path.exists(os.path.dirname(pages[0]))
+    assert cache_entries() == []
@@ -0,0 +1,154 @@
+"""Sync of remote sites and attachments into the local database, with a fake remote connection."""
+from datetime import datetime
+
+import pytest
+
+import sync
+from config import settings
+from models import Attachment, Site
+
+
+class FakeCursor:
+    def __init__(self, remote):
+        self.remote = remote
+        self.rows = []
+
+    def execute(self, query, params=None):
+        if "wbfirm" in query:
+            self.rows = list(self.remote.sites)
+        elif query.startswith("PREPARE"):
+            name, statement = query[len("PREPARE "):].split(" AS ", 1)
+            self.remote.statements[name] = statement
+        else:
+            if query.startswith("EXECUTE"):
+                query = self.remote.statements[query.split()[1]]
+            rows = [row for row in self.remote.attachments if "$1" not in query or row[0] == params[0]]
+            if query.startswith(sync.ATTACHMENT_KEY_COLUMNS):
+                rows = [(row[2], row[3]) for row in rows]
+            self.rows = rows
+
+    def fetchmany(self, size):
+        rows, self.rows = self.rows[:size], self.rows[size:]
+        return rows
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class FakeRemote:
+    """Remote connection serving fixed site and attachment rows"""
+
+    def __init__(self, sites=(), attachments=()):
+        self.sites = list(sites)
+        self.attachments = list(attachments)
+        self.prepared_statements = set()
+        self.statements = {}
+
+    def cursor(self, name=None):
+        return FakeCursor(self)
+
+
+def attachment_row(owner, path, show_name, create_date):
+    return (owner, show_name, path, "/files" + path, ".pdf", create_date)
+
+
+def site_row(owner, domain):
+    return (owner, "account", "name", None, domain, 1, None)
+
+
+@pytest.fixture(autouse=True)
+def small_batches(monkeypatch):
+    monkeypatch.setattr(settings, "SYNC_BATCH_SIZE", 2)
+    monkeypatch.setattr(settings, "REMOTE_FETCH_ITERSIZE", 2)
+    monkeypatch.setattr(settings, "ATTACHMENT_DEFAULT_BASE_URL", "")
+
+
+def run_attachment_sync(db, remote):
+    syncer = sync.RemoteDBSync(db)
+    syncer.remote_conn = remote
+    return syncer.sync_all_attachments()
+
+
+def test_duplicate_after_flush_is_written(db):
+    remote = FakeRemote(attachments=[
+        attachment_row("1", "/a", "old", datetime(2024, 1, 1)),
+        attachment_row("1", "/b", "b", datetime(2024, 1, 1)),
+        # Arrives after the first batch of two rows has been flushed
+        attachment_row("1", "/a", "new", datetime(2024, 6, 1)),
+    ])
+    counts = run_attachment_sync(db, remote)
+
+    assert db.query(Attachment).filter(Attachment.file_path == "/a").one().show_name == "new"
+    assert db.query(Attachment).count() == 2
+    # The same counts as when all rows fit in one batch
+    assert (counts["inserted"], counts["updated"]) == (2, 0)
+
+
+def test_duplicate_of_updated_row_after_flush_is_written(db):
+    run_attachment_sync(db, FakeRemote(attachments=[attachment_row("1", "/a", "v1", datetime(2024, 1, 1))]))
+    remote = FakeRemote(attachments=[
+        attachment_row("1", "/a", "v2", datetime(2024, 2, 1)),
+        attachment_row("1", "/b", "b", datetime(2024, 2, 1)),
+        attachment_row("1", "/a", "v3", datetime(2024, 3, 1)),
+        attachment_row("1", "/a", "stale", datetime(2023, 1, 1)),
+    ])
+    counts = run_attachment_sync(db, remote)
+
+    assert db.query(Attachment).filter(Attachment.file_path == "/a").one().show_name == "v3"
+    assert (counts["inserted"], counts["updated"]) == (1, 1)
+
+
+def test_site_with_several_virtual_hosts_keeps_last_row(db):
+    syncer = sync.RemoteDBSync(db)
+    syncer.remote_conn = FakeRemote(sites=[
+        site_row("1", "first.example"),
+        site_row("2", "other.example"),
+        site_row("1", "second.example"),
+        site_row("1", "third.example"),
+    ])
+    counts = syncer.sync_all_sites()
+
+    assert db.query(Site).filter(Site.owner == "1").one().domain == "third.example"
+    assert db.query(Site).count() == 2
+    assert (counts["inserted"], counts["updated"]) == (2, 0)
+
+
+def run_site_sync(db, remote, site_owners, monkeypatch):
+    monkeypatch.setattr(sync, "acquire_remote_connection", lambda: remote)
+    monkeypatch.setattr(sync, "release_remote_connection", lambda connection: None)
+    return sync.SiteSyncOrchestrator(db, site_owners).run()
+
+
+def test_site_sync_keeps_duplicates_flushed_by_other_sites(db, monkeypatch):
+    monkeypatch.setattr(settings, "SYNC_SITE_WORKERS", 3)
+    remote = FakeRemote(attachments=[
+        attachment_row("1", "/a", "old", datetime(2024, 1, 1)),
+        attachment_row("2", "/b", "b", datetime(2024, 1, 1)),
+        attachment_row("3", "/c", "c", datetime(2024, 1, 1)),
+        attachment_row("1", "/d", "d", datetime(2024, 1, 1)),
+        attachment_row("1", "/e", "e", datetime(2024, 1, 1)),
+        attachment_row("1", "/a", "new", datetime(2024, 6, 1)),
+    ])
+    results = run_site_sync(db, remote, ["1", "2", "3"], monkeypatch)
+
+    assert db.query(Attachment).filter(Attachment.file_path == "/a").one().show_name == "new"
+    assert db.query(Attachment).count() == 5
+    assert results["1"]["inserted"] == 3
+    assert "error" not in results["1"]
+
+
+def test_site_sync_updates_key_owned_by_another_site(db, monkeypatch):
+    run_attachment_sync(db, FakeRemote(attachments=[attachment_row("2", "/a", "old", datetime(2024, 1, 1))]))
+    db.commit()
+    remote = FakeRemote(attachments=[attachment_row("1", "/a", "moved", datetime(2024, 6, 1))])
+    results = run_site_sync(db, remote, ["1"], monkeypatch)
+
+    attachment = db.query(Attachment).one()
+    assert (attachment.site_id, attachment.show_name) == ("1", "moved")
+    assert results["1"]["updated"] == 1
@@ -0,0 +1,37 @@
+"""Compressed text storage: stored texts read back, searched and sorted like plain columns."""
+import pytest
+
+from config import settings
+from main import sort_attachments_query
+from models import Attachment
+from text_store import load_attachment_texts, store_attachment_texts, text_search_filter
+
+
+@pytest.fixture
+def compressed(db, monkeypatch):
+    """Attachments with compressed text_content, stored out of alphabetical order"""
+    monkeypatch.setattr(settings, "TEXT_COMPRESSION", "zlib")
+    for index, text_content in enumerate(["banana 13812345678", "apple", "cherry pie"]):
+        attachment = Attachment(site_id="1", file_path=f"/{index}", url_path=f"/files/{index}")
+        db.add(attachment)
+        db.flush()
+        store_attachment_texts(db, attachment, {"text_content": text_content, "ocr_content": ""})
+    db.commit()
+    return db
+
+
+def test_plain_column_is_empty_and_text_is_loaded(compressed):
+    attachment = compressed.query(Attachment).filter(Attachment.file_path == "/0").one()
+    assert attachment.text_content == ""
+    assert load_attachment_texts(compressed, attachment).text_content == "banana 13812345678"
+
+
+def test_search_matches_compressed_text(compressed):
+    query = compressed.query(Attachment.file_path).filter(text_search_filter(compressed, "text_content", "cherry"))
+    assert [path for (path,) in query] == ["/2"]
+
+
+@pytest.mark.parametrize("sort_order, expected", [("asc", ["/1", "/0", "/2"]), ("desc", ["/2", "/0", "/1"])])
+def test_sort_by_compressed_text(compressed, sort_order, expected):
+    query = sort_attachments_query(compressed, compressed.query(Attachment.file_path), "text_content", sort_order)
+    assert [path for (path,) in query] == expected
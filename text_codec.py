@@ -0,0 +1,45 @@
+"""Compression codecs for stored attachment text"""
+import logging
+import zlib
+
+from config import settings
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+
+def active_codec():
+    """The codec new text is stored with: none, zlib or zstd (zlib when zstandard is missing)"""
+    codec = settings.TEXT_COMPRESSION
+    if codec == "zstd" and zstandard is None:
+        logger.warning("TEXT_COMPRESSION=zstd but the zstandard package is not installed, using zlib")
+        return "zlib"
+    return codec
+
+
+def compress_text(codec, value):
+    data = value.encode("utf-8")
+    if codec == "zstd":
+        return zstandard.ZstdCompressor(level=settings.TEXT_COMPRESSION_LEVEL).compress(data)
+    if codec == "zlib":
+        return zlib.compress(data, settings.TEXT_COMPRESSION_LEVEL)
+    return data
+
+
+def decompress_text(codec, data):
+    if data is None:
+        return None
+    if codec == "zstd":
+        data = zstandard.ZstdDecompressor().decompress(data)
+    elif codec == "zlib":
+        data = zlib.decompress(data)
+    return data.decode("utf-8")
+
+
+def register_sqlite_functions(dbapi_connection):
+    """Make decompress_text(codec, data) available in SQL on a SQLite connection"""
+    dbapi_connection.create_function("decompress_text", 2, decompress_text, deterministic=True)
@@ -0,0 +1,206 @@
+"""Compressed storage and search for extracted attachment text.
+
+With TEXT_COMPRESSION set to zlib or zstd on SQLite, the text_content,
+ocr_content and llm_content of processed attachments are stored compressed in
+attachment_texts and the columns on attachments are left empty. Reads are
+transparent: load_attachment_texts() fills the columns of a loaded attachment,
+and stored_text_column() returns a SQL expression that decompresses through
+the decompress_text() function registered on SQLite connections.
+
+Substring search goes through a contentless FTS5 trigram index over the
+attachment_texts rows. It stores no text and no positions (detail=none), so it
+is a small fraction of the text size: the trigrams of a search term select
+candidate rows, which are then checked against the decompressed text.
+"""
+import logging
+import sys
+
+from sqlalchemy import Integer, Text, and_, column, func, inspect, or_, select, text
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import set_committed_value
+
+from config import settings
+from models import Attachment, AttachmentText
+from text_codec import active_codec, compress_text, decompress_text
+
+logger = logging.getLogger(__name__)
+
+
+STORED_TEXT_FIELDS = ("text_content", "ocr_content", "llm_content")
+# Fields searched through the trigram index
+INDEXED_TEXT_FIELDS = ("text_content", "ocr_content")
+SEARCH_INDEX_TABLE = "attachment_text_index"
+
+
+def ensure_text_search_index(engine):
+    """Create the trigram search index on SQLite builds with FTS5 (3.34 or newer)"""
+    if engine.dialect.name != "sqlite" or inspect(engine).has_table(SEARCH_INDEX_TABLE):
+        return
+    try:
+        with engine.begin() as conn:
+            conn.execute(text(
+                f"CREATE VIRTUAL TABLE {SEARCH_INDEX_TABLE} USING fts5("
+                "content, content='', tokenize='trigram', detail=none)"
+            ))
+    except Exception as e:
+        logger.warning(f"Text search index not available, compressed text is searched by scanning: {str(e)}")
+
+
+def compression_enabled(db: Session):
+    return settings.TEXT_COMPRESSION != "none" and db.bind.dialect.name == "sqlite"
+
+
+def compressed_texts_present(db: Session):
+    """Whether any attachment text is stored compressed, even if compression was disabled since"""
+    if db.bind.dialect.name != "sqlite":
+        return False
+    return compression_enabled(db) or db.query(AttachmentText.id).first() is not None
+
+
+def search_index_present(db: Session):
+    return db.execute(
+        text("SELECT 1 FROM sqlite_master WHERE name = :name"), {"name": SEARCH_INDEX_TABLE}
+    ).first() is not None
+
+
+def store_attachment_texts(db: Session, attachment: Attachment, texts: dict):
+    """Set the extracted text columns of an attachment, compressed when enabled.
+
+    Empty values are stored in the plain columns. The caller is responsible
+    for committing.
+    """
+    if db.bind.dialect.name != "sqlite":
+        for field, value in texts.items():
+            setattr(attachment, field, value)
+        return
+
+    enabled = compression_enabled(db)
+    codec = active_codec() if enabled else None
+    use_index = search_index_present(db)
+    existing_rows = {
+        row.field: row
+        for row in db.query(AttachmentText).filter(AttachmentText.attachment_id == attachment.id)
+    }
+    for field, value in texts.items():
+        row = existing_rows.get(field)
+        if row is not None and use_index and field in INDEXED_TEXT_FIELDS:
+            # A contentless index entry is removed by passing its original text
+            _update_search_index(db, "delete", row.id, decompress_text(row.codec, row.data))
+
+        if not enabled or not value:
+            # Text stored while compression was enabled must not shadow the new value
+            if row is not None:
+                db.delete(row)
+            setattr(attachment, field, value)
+            continue
+
+        if row is None:
+            row = AttachmentText(attachment_id=attachment.id, field=field)
+            db.add(row)
+        row.codec = codec
+        row.data = compress_text(codec, value)
+        row.length = len(value)
+        if use_index and field in INDEXED_TEXT_FIELDS:
+            db.flush()
+            _update_search_index(db, None, row.id, value)
+        setattr(attachment, field, "")
+
+
+def _update_search_index(db: Session, command, rowid, value):
+    if command:
+        db.execute(
+            text(f"INSERT INTO {SEARCH_INDEX_TABLE}({SEARCH_INDEX_TABLE}, rowid, content) VALUES (:command, :rowid, :content)"),
+            {"command": command, "rowid": rowid, "content": value},
+        )
+    else:
+        db.execute(
+            text(f"INSERT INTO {SEARCH_INDEX_TABLE}(rowid, content) VALUES (:rowid, :content)"),
+            {"rowid": rowid, "content": value},
+        )
+
+
+def load_attachment_texts(db: Session, attachment: Attachment):
+    """Fill the text columns of a loaded attachment from its compressed rows"""
+    if db.bind.dialect.name != "sqlite":
+        return attachment
+    for row in db.query(AttachmentText).filter(AttachmentText.attachment_id == attachment.id):
+        # Not a change, so the session does not write it back
+        set_committed_value(attachment, row.field, decompress_text(row.codec, row.data))
+    return attachment
+
+
+def _decompressed():
+    return func.decompress_text(AttachmentText.codec, AttachmentText.data, type_=Text)
+
+
+def stored_text_column(db: Session, field):
+    """SQL expression for the full text of a column, compressed or not"""
+    plain_column = getattr(Attachment, field)
+    if not compressed_texts_present(db):
+        return plain_column
+    compressed = select(_decompressed()).where(
+        AttachmentText.attachment_id == Attachment.id,
+        AttachmentText.field == field,
+    ).scalar_subquery()
+    return func.coalesce(compressed, plain_column, type_=Text)
+
+
+def text_search_filter(db: Session, field, search):
+    """Filter clause matching attachments whose text column contains search"""
+    plain_column = getattr(Attachment, field)
+    if not compressed_texts_present(db):
+        return plain_column.contains(search)
+
+    conditions = [AttachmentText.field == field, _decompressed().contains(search)]
+    trigrams = list(dict.fromkeys(search[i:i + 3] for i in range(len(search) - 2)))
+    if trigrams and field in INDEXED_TEXT_FIELDS and search_index_present(db):
+        match = " AND ".join('"' + trigram.replace('"', '""') + '"' for trigram in trigrams)
+        candidates = text(
+            f"SELECT rowid FROM {SEARCH_INDEX_TABLE} WHERE {SEARCH_INDEX_TABLE} MATCH :match"
+        ).bindparams(match=match).columns(column("rowid", Integer))
+        conditions.insert(0, AttachmentText.id.in_(candidates))
+
+    compressed_matches = select(AttachmentText.attachment_id).where(and_(*conditions))
+    # Attachments processed before compression was enabled still have plain text
+    return or_(Attachment.id.in_(compressed_matches), plain_column.contains(search))
+
+
+def compress_existing_texts(db: Session, batch_size=500):
+    """Move plain text columns of already processed attachments into compressed storage"""
+    if not compression_enabled(db):
+        raise ValueError("Set TEXT_COMPRESSION to zlib or zstd on a SQLite database first")
+
+    moved = 0
+    last_id = 0
+    while True:
+        attachments = db.query(Attachment).filter(
+            Attachment.id > last_id,
+            or_(*[func.length(getattr(Attachment, field)) > 0 for field in STORED_TEXT_FIELDS]),
+        ).order_by(Attachment.id).limit(batch_size).all()
+        if not attachments:
+            break
+        for attachment in attachments:
+            texts = {field: getattr(attachment, field) for field in STORED_TEXT_FIELDS if getattr(attachment, field)}
+            store_attachment_texts(db, attachment, texts)
+            moved += 1
+        last_id = attachments[-1].id
+        db.commit()
+        db.expunge_all()
+        logger.info(f"Compressed text of {moved} attachments")
+    return moved
+
+
+if __name__ == "__main__":
+    # python text_store.py compress: compress existing text, then VACUUM to shrink the file
+    if sys.argv[1:] != ["compress"]:
+        sys.exit("Usage: python text_store.py compress")
+    from models import SessionLocal, create_tables, engine
+
+    create_tables()
+    session = SessionLocal()
+    try:
+        print(f"Compressed text of {compress_existing_texts(session)} attachments")
+    finally:
+        session.close()
+    with engine.connect() as conn:
+        conn.execution_options(isolation_level="AUTOCOMMIT").execute(text("VACUUM"))
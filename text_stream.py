@@ -0,0 +1,190 @@
+"""Incremental text extraction for the fast "detect-only" detection mode.
+
+Normal detection extracts, OCRs and stores the whole text of an attachment
+before the patterns run once. The fast mode only needs to know whether an
+attachment contains any ID card or phone numbers, so extractors here yield
+the text in segments (a PDF page, a spreadsheet or text file chunk, a slide, an
+embedded picture, an archive member) and detection stops reading once every category
+in FAST_DETECT_CATEGORIES has been found.
+
+Segments are (kind, text) pairs, where kind is "text" for extracted text and
+"ocr" for OCR results, matching the text_content and ocr_content columns.
+"""
+import os
+
+from docx import Document
+from pptx import Presentation
+from PyPDF2 import PdfReader
+
+from config import settings
+from embedded_media import OOXML_EXTENSIONS, extract_embedded_images
+from file_types import REJECTED_FILE_TYPES, resolve_file_type
+from plain_text import PLAIN_TEXT_EXTENSIONS, iter_decoded_chunks
+from spreadsheets import SPREADSHEET_EXTENSIONS, iter_spreadsheet_rows, iter_text_chunks
+from utils import (
+    contains_id_card,
+    contains_phone,
+    extract_ocr_from_image,
+    extract_text_from_doc,
+    extract_text_from_ppt,
+    extract_zip_content,
+    iter_ocr_from_pdf,
+)
+
+
+DETECTORS = {
+    "id_card": contains_id_card,
+    "phone": contains_phone,
+}
+
+IMAGE_EXTENSIONS = ('.jpg', '.png', '.bmp', '.gif', '.tiff')
+
+ARCHIVE_EXTENSIONS = ('.zip', '.rar')
+
+# Characters of the previous segment checked again with the next one, longer than any pattern match
+SEGMENT_OVERLAP = 32
+
+# Paragraphs of a DOCX file per segment
+DOCX_PARAGRAPHS_PER_SEGMENT = 200
+
+
+def fast_detect_categories():
+    """The categories of FAST_DETECT_CATEGORIES, all of them when none is valid"""
+    categories = [name.strip() for name in settings.FAST_DETECT_CATEGORIES.split(",")]
+    return [name for name in DETECTORS if name in categories] or list(DETECTORS)
+
+
+def _iter_pdf(path):
+    reader = PdfReader(path)
+    length = 0
+    for page in reader.pages:
+        text = page.extract_text() or ""
+        length += len(text.strip())
+        yield "text", text
+    # Like extract_text_from_file: PDFs with hardly any text are scanned pages
+    if length < 100:
+        for text in iter_ocr_from_pdf(path):
+            yield "ocr", text
+
+
+def _iter_docx(path):
+    paragraphs = [paragraph.text for paragraph in Document(path).paragraphs]
+    for start in range(0, len(paragraphs), DOCX_PARAGRAPHS_PER_SEGMENT):
+        yield "text", "\n".join(paragraphs[start:start + DOCX_PARAGRAPHS_PER_SEGMENT])
+
+
+def _iter_pptx(path):
+    for slide in Presentation(path).slides:
+        yield "text", "\n".join(shape.text for shape in slide.shapes if hasattr(shape, "text"))
+
+
+def _iter_embedded_images(path):
+    if not settings.OCR_EMBEDDED_IMAGES:
+        return
+    # One picture at a time, so reading stops at the first picture with a hit
+    for image_path in extract_embedded_images(path):
+        yield "ocr", extract_ocr_from_image(image_path)
+
+
+def _iter_archive(path, file_type):
+    extract_dir = path + "_extracted"
+    if not os.path.exists(extract_dir):
+        print(f"Extracting archive {path} to {extract_dir}")
+        extract_zip_content(path, extract_dir, file_type)
+    for root, dirs, files in os.walk(extract_dir):
+        dirs.sort()
+        for file in sorted(files):
+            file_path = os.path.join(root, file)
+            try:
+                member_type = resolve_file_type(file_path)
+                # Archives inside archives are not opened, as in normal detection
+                if member_type in ARCHIVE_EXTENSIONS:
+                    continue
+                yield from iter_file_segments(file_path, member_type)
+            except Exception as e:
+                # A broken member does not end the scan of the others
+                print(f"Error reading {file_path} for fast detection: {str(e)}")
+
+
+def iter_file_segments(path, file_type=None):
+    """(kind, text) segments of a file, in reading order, sniffing its type unless given"""
+    ext = resolve_file_type(path) if file_type is None else file_type
+    if ext in REJECTED_FILE_TYPES:
+        return
+    if ext in ARCHIVE_EXTENSIONS:
+        yield from _iter_archive(path, ext)
+    elif ext == '.pdf':
+        yield from _iter_pdf(path)
+    elif ext in SPREADSHEET_EXTENSIONS:
+        for chunk in iter_text_chunks(iter_spreadsheet_rows(path, ext)):
+            yield "text", chunk
+    elif ext == '.docx':
+        yield from _iter_docx(path)
+    elif ext == '.pptx':
+        yield from _iter_pptx(path)
+    elif ext == '.doc':
+        yield "text", extract_text_from_doc(path)
+    elif ext == '.ppt':
+        yield "text", extract_text_from_ppt(path)
+    elif ext in PLAIN_TEXT_EXTENSIONS:
+        for chunk in iter_decoded_chunks(path):
+            yield "text", chunk
+    elif ext in IMAGE_EXTENSIONS:
+        yield "ocr", extract_ocr_from_image(path)
+
+    if ext in OOXML_EXTENSIONS:
+        yield from _iter_embedded_images(path)
+
+
+class StreamDetector:
+    """Runs the pattern detectors of some categories over text segments as they arrive"""
+
+    def __init__(self, categories):
+        self.categories = list(categories)
+        self.found = set()
+        self._tail = ""
+
+    @property
+    def done(self):
+        return all(category in self.found for category in self.categories)
+
+    def feed(self, text):
+        # The end of the previous segment is prepended, so a number split between segments is found
+        window = self._tail + text
+        for category in self.categories:
+            if category not in self.found and DETECTORS[category](window):
+                self.found.add(category)
+        self._tail = text[-SEGMENT_OVERLAP:]
+
+
+def detect_file_fast(path, categories, keep_text=False, file_type=None):
+    """Detect categories in a file, reading only until all of them are found.
+
+    Returns (found categories, {"text_content": ..., "ocr_content": ...} or
+    None, number of segments read). With keep_text, the texts hold what was
+    read before detection stopped.
+    """
+    detector = StreamDetector(categories)
+    texts = {"text": [], "ocr": []}
+    segments_read = 0
+    segments = iter_file_segments(path, file_type)
+    try:
+        for kind, text in segments:
+            segments_read += 1
+            if not text:
+                continue
+            if keep_text:
+                texts[kind].append(text)
+            detector.feed(text)
+            if detector.done:
+                break
+    except Exception as e:
+        print(f"Error reading {path} for fast detection: {str(e)}")
+    finally:
+        # Stops the extractor, closing workbooks and removing temporary files
+        segments.close()
+
+    stored = None
+    if keep_text:
+        stored = {"text_content": "\n".join(texts["text"]), "ocr_content": "\n".join(texts["ocr"])}
+    return detector.found, stored, segments_read
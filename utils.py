@@ -4,13 +4,21 @@ import zipfile
 import rarfile
 from PyPDF2 import PdfReader
 from PIL import Image
-import openpyxl
 from docx import Document
 import tempfile
+import threading
+from contextlib import ExitStack, contextmanager
+from concurrent.futures import ThreadPoolExecutor
 from config import settings
-import requests
+from llm_client import get_llm_client
+from llm_cache import llm_cache
+from text_presence import likely_contains_text
+from ocr_prep import ocr_pages, transient_ocr_pages
+from embedded_media import extract_embedded_images
+from file_types import REJECTED_FILE_TYPES, resolve_file_type
+from spreadsheets import iter_spreadsheet_rows, iter_text_chunks
+from plain_text import iter_decoded_chunks
 import json
-import xlrd
 from pptx import Presentation
 
 
@@ -22,6 +30,8 @@ PADDLE_OCR_AVAILABLE = False
 TESSERACT_OCR_AVAILABLE = False
 paddle_ocr = None
 tesseract_ocr = None
+# The PaddleOCR predictor is not thread-safe; attachments and embedded images are OCR'd from several threads
+paddle_ocr_lock = threading.Lock()
 
 def initialize_ocr():
     """Initialize OCR engines if not already initialized"""
@@ -80,36 +90,58 @@ def extract_text_from_docx(docx_path):
 
 def extract_text_from_xlsx(xlsx_path):
     """Extract text from XLSX file"""
-    try:
-        workbook = openpyxl.load_workbook(xlsx_path)
-        text = ""
-        for sheet in workbook.worksheets:
-            for row in sheet.iter_rows(values_only=True):
-                row_text = " ".join([str(cell) if cell else "" for cell in row])
-                text += row_text + "\n"
-        return text
-    except Exception as e:
-        print(f"Error extracting text from XLSX {xlsx_path}: {str(e)}")
-        return ""
+    return scan_spreadsheet(xlsx_path)[0]
 
 
 def extract_text_from_xls(xls_path):
     """Extract text from XLS file using xlrd"""
+    return scan_spreadsheet(xls_path)[0]
+
+
+def _scan_chunks(chunks, limit, path):
+    """Detect ID cards and phone numbers in text chunks, keeping at most limit characters (0 for all)"""
+    kept_chunks = []
+    size = 0
+    has_id_card = False
+    has_phone = False
+    tail = ""
     try:
-        workbook = xlrd.open_workbook(xls_path)
-        text = ""
-        for sheet in workbook.sheets():
-            for row_idx in range(sheet.nrows):
-                row_values = []
-                for col_idx in range(sheet.ncols):
-                    cell_value = sheet.cell_value(row_idx, col_idx)
-                    if cell_value is not None:
-                        row_values.append(str(cell_value))
-                text += " ".join(row_values) + "\n"
-        return text
+        for chunk in chunks:
+            # The end of the previous chunk is checked again, for numbers split between chunks
+            window = tail + chunk
+            has_id_card = has_id_card or contains_id_card(window)
+            has_phone = has_phone or contains_phone(window)
+            tail = chunk[-32:]
+            if limit <= 0 or size < limit:
+                kept = chunk if limit <= 0 else chunk[:limit - size]
+                kept_chunks.append(kept)
+                size += len(kept)
+        if limit > 0 and size >= limit:
+            print(f"Text of {path} cut at {limit} characters")
     except Exception as e:
-        print(f"Error extracting text from XLS {xls_path}: {str(e)}")
-        return ""
+        print(f"Error extracting text from {path}: {str(e)}")
+    return "".join(kept_chunks), has_id_card, has_phone
+
+
+def scan_spreadsheet(path, file_type=None):
+    """Stream the text of an XLSX or XLS workbook, detecting ID cards and phone numbers chunk by chunk.
+
+    Returns (text, has_id_card, has_phone). Detection covers every row read
+    (see spreadsheets), while the returned text is cut at
+    SPREADSHEET_MAX_TEXT_CHARS, so memory stays bounded for huge exports.
+    """
+    rows = iter_spreadsheet_rows(path, file_type)
+    return _scan_chunks(iter_text_chunks(rows), settings.SPREADSHEET_MAX_TEXT_CHARS, path)
+
+
+def scan_plain_text(path):
+    """Scan a TXT, CSV or LOG file through a memory map, detecting ID cards and phone numbers chunk by chunk.
+
+    Returns (text, has_id_card, has_phone). Detection covers the whole file
+    (see plain_text), while the returned excerpt is cut at
+    PLAIN_TEXT_MAX_TEXT_CHARS.
+    """
+    return _scan_chunks(iter_decoded_chunks(path), settings.PLAIN_TEXT_MAX_TEXT_CHARS, path)
 
 
 def extract_text_from_doc(doc_path):
@@ -147,13 +179,8 @@ def extract_text_from_doc(doc_path):
 
 
 def extract_text_from_txt(txt_path):
-    """Extract text from TXT file"""
-    try:
-        with open(txt_path, 'r', encoding='utf-8') as file:
-            return file.read()
-    except Exception as e:
-        print(f"Error extracting text from TXT {txt_path}: {str(e)}")
-        return ""
+    """Extract text from TXT, CSV or LOG file, in UTF-8, GBK or GB18030"""
+    return scan_plain_text(txt_path)[0]
 
 
 def extract_text_from_ppt(ppt_path):
@@ -188,7 +215,19 @@ def calculate_ocr_confidence_score(ocr_results):
 
     # If ocr_results is a list (like PaddleOCR output)
     if isinstance(ocr_results, list):
+        # PaddleOCR returns one list of lines per page (None for pages without text)
+        lines = []
         for result in ocr_results:
+            if result is None:
+                continue
+            if isinstance(result, list) and result and all(
+                isinstance(line, (list, tuple)) and len(line) == 2 and isinstance(line[1], (list, tuple))
+                for line in result
+            ):
+                lines.extend(result)
+            else:
+                lines.append(result)
+        for result in lines:
             if isinstance(result, (list, tuple)) and len(result) > 1:
                 # PaddleOCR format: [bbox, [text, confidence]]
                 if isinstance(result[1], (list, tuple)) and len(result[1]) == 2:
@@ -226,28 +265,52 @@ def calculate_ocr_confidence_score(ocr_results):
     return max(0.0, min(1.0, avg_confidence))
 
 
-def extract_ocr_from_image(image_path):
-    """Extract text from image using configured OCR engine"""
+@contextmanager
+def _ocr_page_paths(image_path, cache=True):
+    """Normalised pages of an image (see ocr_prep) that are likely to contain text.
+
+    Without cache the pages are temporary files, removed on exit.
+    """
+    with ExitStack() as stack:
+        try:
+            pages = ocr_pages(image_path) if cache else stack.enter_context(transient_ocr_pages(image_path))
+        except Exception as e:
+            print(f"Error normalising image {image_path} for OCR, using it as is: {str(e)}")
+            pages = [image_path]
+        yield [page for page in pages if likely_contains_text(page)]
+
+
+def extract_ocr_from_image(image_path, cache=True):
+    """Extract text from image using configured OCR engine.
+
+    cache=False is for images OCR'd only once, such as rendered PDF pages:
+    their normalised pages are not kept in the OCR image cache.
+    """
     initialize_ocr()
 
     if OCR_ENGINE == 'paddle' and PADDLE_OCR_AVAILABLE:
         try:
-            result = paddle_ocr.ocr(image_path, cls=True)
             text = ""
-            for page_result in result:
-                if page_result:  # Check if result is not None
-                    for item in page_result:
-                        if item and len(item) > 1:
-                            text += item[1][0] + " "  # Get the recognized text
+            with _ocr_page_paths(image_path, cache) as page_paths:
+                for page_path in page_paths:
+                    with paddle_ocr_lock:
+                        result = paddle_ocr.ocr(page_path, cls=True)
+                    for page_result in result:
+                        if page_result:  # Check if result is not None
+                            for item in page_result:
+                                if item and len(item) > 1:
+                                    text += item[1][0] + " "  # Get the recognized text
             return text
         except Exception as e:
             print(f"Error performing PaddleOCR on image {image_path}: {str(e)}")
             return ""
     elif OCR_ENGINE == 'tesseract' and TESSERACT_OCR_AVAILABLE:
         try:
-            from PIL import Image
-            img = Image.open(image_path)
-            text = tesseract_ocr.image_to_string(img, lang='chi_sim+eng')
+            text = ""
+            with _ocr_page_paths(image_path, cache) as page_paths:
+                for page_path in page_paths:
+                    with Image.open(page_path) as img:
+                        text += tesseract_ocr.image_to_string(img, lang='chi_sim+eng') + "\n"
             return text
         except Exception as e:
             print(f"Error performing Tesseract OCR on image {image_path}: {str(e)}")
@@ -261,25 +324,33 @@ def extract_ocr_from_image(image_path):
             return f"Unsupported OCR engine: {OCR_ENGINE}"
 
 
-def extract_ocr_from_image_with_confidence(image_path):
+def extract_ocr_from_image_with_confidence(image_path, cache=True):
     """Extract text from image using configured OCR engine and return results with confidence scores for calculating OCR score"""
     initialize_ocr()
 
     if OCR_ENGINE == 'paddle' and PADDLE_OCR_AVAILABLE:
         try:
-            result = paddle_ocr.ocr(image_path, cls=True)
-            # Return the raw result for confidence calculation
+            # Return the raw results of all pages for confidence calculation
+            result = []
+            with _ocr_page_paths(image_path, cache) as page_paths:
+                for page_path in page_paths:
+                    with paddle_ocr_lock:
+                        result.extend(paddle_ocr.ocr(page_path, cls=True))
             return result
         except Exception as e:
             print(f"Error performing PaddleOCR on image {image_path}: {str(e)}")
             return []
     elif OCR_ENGINE == 'tesseract' and TESSERACT_OCR_AVAILABLE:
         try:
-            from PIL import Image
             import pytesseract
-            img = Image.open(image_path)
-            # Get data with confidence scores
-            data = pytesseract.image_to_data(img, lang='chi_sim+eng', output_type=pytesseract.Output.DICT)
+            # Get data with confidence scores, the lists of all pages concatenated
+            data = {}
+            with _ocr_page_paths(image_path, cache) as page_paths:
+                for page_path in page_paths:
+                    with Image.open(page_path) as img:
+                        page_data = pytesseract.image_to_data(img, lang='chi_sim+eng', output_type=pytesseract.Output.DICT)
+                    for key, values in page_data.items():
+                        data.setdefault(key, []).extend(values)
             return data
         except Exception as e:
             print(f"Error performing Tesseract OCR with confidence on image {image_path}: {str(e)}")
@@ -294,6 +365,43 @@ def extract_ocr_from_image_with_confidence(image_path):
         return [] if OCR_ENGINE == 'paddle' else {}
 
 
+def ocr_text_from_results(ocr_results):
+    """The recognised text of extract_ocr_from_image_with_confidence results"""
+    if isinstance(ocr_results, dict):
+        # Tesseract: one entry per word
+        return " ".join(str(word).strip() for word in ocr_results.get('text', []) if str(word).strip())
+    text = ""
+    for page_result in ocr_results or []:
+        for item in page_result or []:
+            if item and len(item) > 1:
+                text += item[1][0] + " "
+    return text
+
+
+def extract_ocr_from_embedded_images(document_path):
+    """OCR the images embedded in a DOCX, PPTX or XLSX file.
+
+    Returns (text, ocr_score); the score averages the images that yielded OCR
+    results and is None when there were none.
+    """
+    if not settings.OCR_EMBEDDED_IMAGES:
+        return "", None
+    image_paths = extract_embedded_images(document_path)
+    if not image_paths:
+        return "", None
+
+    texts = []
+    scores = []
+    with ThreadPoolExecutor(max_workers=max(1, settings.OCR_EMBEDDED_WORKERS)) as executor:
+        # map keeps the document order of the images
+        for ocr_results in executor.map(extract_ocr_from_image_with_confidence, image_paths):
+            if ocr_results:
+                texts.append(ocr_text_from_results(ocr_results))
+                scores.append(calculate_ocr_confidence_score(ocr_results))
+    print(f"OCR'd {len(image_paths)} embedded images of {document_path}, {len(scores)} with text")
+    return "\n".join(texts), (sum(scores) / len(scores) if scores else None)
+
+
 def extract_ocr_from_pdf(pdf_path):
     """Extract text from PDF using OCR (for image-based PDFs)"""
     initialize_ocr()
@@ -307,12 +415,19 @@ def extract_ocr_from_pdf(pdf_path):
             return f"Unsupported OCR engine: {OCR_ENGINE}"
 
     try:
-        # For image-based PDFs, we need to convert each page to an image first
-        import fitz  # PyMuPDF
+        return "".join(text + "\n" for text in iter_ocr_from_pdf(pdf_path))
+    except Exception as e:
+        print(f"Error performing OCR on PDF {pdf_path}: {str(e)}")
+        return ""
 
-        doc = fitz.open(pdf_path)
-        all_text = ""
 
+def iter_ocr_from_pdf(pdf_path):
+    """OCR text of a PDF page by page, so callers can stop after any page"""
+    # For image-based PDFs, we need to convert each page to an image first
+    import fitz  # PyMuPDF
+
+    doc = fitz.open(pdf_path)
+    try:
         for page_num in range(len(doc)):
             page = doc.load_page(page_num)
             pix = page.get_pixmap()
@@ -320,17 +435,15 @@ def extract_ocr_from_pdf(pdf_path):
             # Save as temporary image
             with tempfile.NamedTemporaryFile(suffix=".png", delete=False) as tmp_file:
                 pix.save(tmp_file.name)
-                text = extract_ocr_from_image(tmp_file.name)
-                all_text += text + "\n"
-
+            try:
+                # Page renders are OCR'd once, so their normalised pages are not cached
+                text = extract_ocr_from_image(tmp_file.name, cache=False)
+            finally:
                 # Clean up temporary file
                 os.unlink(tmp_file.name)
-
+            yield text
+    finally:
         doc.close()
-        return all_text
-    except Exception as e:
-        print(f"Error performing OCR on PDF {pdf_path}: {str(e)}")
-        return ""
 
 
 def extract_ocr_from_pdf_with_confidence(pdf_path):
@@ -364,7 +477,7 @@ def extract_ocr_from_pdf_with_confidence(pdf_path):
                 pix.save(tmp_file.name)
                 # Get OCR results with confidence
                 from utils import extract_ocr_from_image_with_confidence
-                page_results = extract_ocr_from_image_with_confidence(tmp_file.name)
+                page_results = extract_ocr_from_image_with_confidence(tmp_file.name, cache=False)
                 all_results.extend(page_results if isinstance(page_results, list) else [page_results])
 
                 # Clean up temporary file
@@ -377,58 +490,75 @@ def extract_ocr_from_pdf_with_confidence(pdf_path):
         return []
 
 
-def extract_text_from_file(file_path):
-    """Extract text from various file types"""
-    _, ext = os.path.splitext(file_path.lower())
-
-    if ext == '.pdf':
-        # Try to extract text first, if it fails or returns little text, use OCR
-        text = extract_text_from_pdf(file_path)
-        if len(text.strip()) < 100:  # If less than 100 characters, try OCR
-            ocr_text = extract_ocr_from_pdf(file_path)
-            return max(text, ocr_text, key=len)  # Return the longer text
-        return text
-    elif ext == '.docx':
-        return extract_text_from_docx(file_path)
-    elif ext == '.doc':
-        return extract_text_from_doc(file_path)  # Use the new function for .doc files
-    elif ext in ['.ppt', '.pptx']:
-        return extract_text_from_ppt(file_path)  # Use the new function for .ppt/.pptx files
-    elif ext == '.xlsx':
-        return extract_text_from_xlsx(file_path)
-    elif ext == '.xls':
-        return extract_text_from_xls(file_path)  # Use the new function for .xls files
-    elif ext in ['.txt']:
-        return extract_text_from_txt(file_path)
-    elif ext in ['.jpg', '.jpeg', '.png', '.bmp', '.gif', '.tiff']:
-        return extract_ocr_from_image(file_path)
-    else:
+def extract_text_from_pdf_or_ocr(pdf_path):
+    """Extract text from PDF file, using OCR when it has little text"""
+    text = extract_text_from_pdf(pdf_path)
+    if len(text.strip()) < 100:  # If less than 100 characters, try OCR
+        ocr_text = extract_ocr_from_pdf(pdf_path)
+        return max(text, ocr_text, key=len)  # Return the longer text
+    return text
+
+
+# Text extractor of each file type (see file_types)
+TEXT_EXTRACTORS = {
+    '.pdf': extract_text_from_pdf_or_ocr,
+    '.docx': extract_text_from_docx,
+    '.doc': extract_text_from_doc,
+    '.ppt': extract_text_from_ppt,
+    '.pptx': extract_text_from_ppt,
+    '.xlsx': extract_text_from_xlsx,
+    '.xls': extract_text_from_xls,
+    '.txt': extract_text_from_txt,
+    '.csv': extract_text_from_txt,
+    '.log': extract_text_from_txt,
+    '.jpg': extract_ocr_from_image,
+    '.png': extract_ocr_from_image,
+    '.bmp': extract_ocr_from_image,
+    '.gif': extract_ocr_from_image,
+    '.tiff': extract_ocr_from_image,
+}
+
+
+def extract_text_from_file(file_path, file_type=None):
+    """Extract text from various file types, sniffing the type from the content unless given"""
+    if file_type is None:
+        file_type = resolve_file_type(file_path)
+    if file_type in REJECTED_FILE_TYPES:
+        print(f"Not extracting text from {file_path}: {file_type} content")
         return ""
+    extractor = TEXT_EXTRACTORS.get(file_type)
+    return extractor(file_path) if extractor else ""
 
 
-def extract_zip_content(zip_path, extract_to):
+def extract_zip_content(zip_path, extract_to, file_type=None):
     """Extract content from zip/rar files"""
+    if file_type is None:
+        file_type = resolve_file_type(zip_path)
     try:
         os.makedirs(extract_to, exist_ok=True)
-        if zip_path.lower().endswith('.zip'):
+        if file_type == '.zip':
             with zipfile.ZipFile(zip_path, 'r') as zip_ref:
                 zip_ref.extractall(extract_to)
-        elif zip_path.lower().endswith('.rar'):
+        elif file_type == '.rar':
             with rarfile.RarFile(zip_path, 'r') as rar_ref:
                 rar_ref.extractall(extract_to)
     except Exception as e:
         print(f"Error extracting archive {zip_path}: {str(e)}")
 
 
+# Chinese ID card number (18 digits, with possible X at the end)
+ID_CARD_PATTERN = r'\b[1-9]\d{5}(18|19|20)\d{2}((0[1-9])|(1[0-2]))(([0-2][1-9])|10|20|30|31)\d{3}[0-9Xx]\b'
+# Chinese mobile and landline phone numbers
+PHONE_PATTERN = r'(\b(?:\+?86[-\s]?)?(?:1[3-9]\d{9}|(?:[0-9]{3,4}[-\s]?)?[0-9]{7,8})\b)'
+
+
 def contains_id_card(text):
     """Check if text contains ID card numbers"""
     if not text:
         return False
 
-    # Pattern for Chinese ID card number (18 digits, with possible X at the end)
-    pattern = r'\b[1-9]\d{5}(18|19|20)\d{2}((0[1-9])|(1[0-2]))(([0-2][1-9])|10|20|30|31)\d{3}[0-9Xx]\b'
-    matches = re.findall(pattern, text)
-    return len(matches) > 0
+    # search stops at the first match; findall would collect every number in the text
+    return re.search(ID_CARD_PATTERN, text) is not None
 
 
 def contains_phone(text):
@@ -436,104 +566,242 @@ def contains_phone(text):
     if not text:
         return False
 
-    # Pattern for Chinese phone numbers
-    pattern = r'(\b(?:\+?86[-\s]?)?(?:1[3-9]\d{9}|(?:[0-9]{3,4}[-\s]?)?[0-9]{7,8})\b)'
-    matches = re.findall(pattern, text)
-    return len(matches) > 0
+    return re.search(PHONE_PATTERN, text) is not None
+
+
+def _image_message_parts(prepared, text):
+    """Chat message content with the text and every tile of a prepared image"""
+    if len(prepared.tiles) > 1:
+        text += f"\n\nThe image is split into {len(prepared.tiles)} overlapping parts, from top to bottom."
+    parts = [{"type": "text", "text": text}]
+    parts.extend({"type": "image_url", "image_url": {"url": url}} for url in prepared.data_urls())
+    return parts
 
 
 def get_llm_content(image_path):
     """Get content from image using LLM (OpenAI GPT-4 Vision or similar)"""
-    api_key = settings.OPENAI_API_KEY
-    api_base = settings.OPENAI_BASE_URL
-    model = settings.MODEL
-    
-    if not api_key:
+    if not settings.OPENAI_API_KEY:
         return "OpenAI API key not configured"
 
     try:
-        # Read image and encode to base64
-        import base64
-        with open(image_path, "rb") as image_file:
-            encoded_image = base64.b64encode(image_file.read()).decode('ascii')
-
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {api_key}"
-        }
-
-        payload = {
-            "model": model,
-            "messages": [
+        # Downscaled and re-encoded, from the prepared image cache when possible
+        from image_prep import prepare_image
+        prepared = prepare_image(image_path)
+
+        messages = [
+            {
+                "role": "user",
+                "content": _image_message_parts(
+                    prepared,
+                    "Describe the content of this image in detail, focusing on any text, documents, or important information visible in the image."
+                )
+            }
+        ]
+
+        result = get_llm_client().chat_completion(messages, max_tokens=500)
+        return result['choices'][0]['message']['content']
+    except Exception as e:
+        print(f"Error getting LLM content for {image_path}: {str(e)}")
+        return ""
+
+
+def get_image_analysis(prepared, usage=None):
+    """Get the JSON findings of the LLM for a prepared image, like get_content_analysis for text"""
+    from ai_findings import FINDINGS_INSTRUCTIONS, response_format
+
+    prompt = settings.PROMPTS
+
+    def analyse():
+        try:
+            messages = [
+                {
+                    "role": "system",
+                    "content": FINDINGS_INSTRUCTIONS
+                },
                 {
                     "role": "user",
-                    "content": [
-                        {
-                            "type": "text",
-                            "text": "Describe the content of this image in detail, focusing on any text, documents, or important information visible in the image."
-                        },
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:image/jpeg;base64,{encoded_image}"
-                            }
-                        }
-                    ]
+                    "content": _image_message_parts(prepared, f"{prompt}\n\nContent to analyze is the attached image.")
                 }
-            ],
-            "max_tokens": 500
-        }
+            ]
+
+            options = {"response_format": response_format()} if response_format() else {}
+            result = get_llm_client().chat_completion(messages, max_tokens=500, **options)
+            if usage is not None:
+                usage["prompt_tokens"] += result.get("usage", {}).get("prompt_tokens", 0)
+                usage["completion_tokens"] += result.get("usage", {}).get("completion_tokens", 0)
+            return result['choices'][0]['message']['content']
+        except Exception as e:
+            print(f"Error getting image analysis: {str(e)}")
+            return ""
 
-        response = requests.post(api_base + "/chat/completions", headers=headers, json=payload)
-        response.raise_for_status()
+    # The digest identifies the image bytes and how they were prepared
+    cache_prompt = "\n".join([prompt, FINDINGS_INSTRUCTIONS, settings.LLM_RESPONSE_FORMAT])
+    return llm_cache.get_or_compute(f"image:{prepared.digest}", cache_prompt, settings.MODEL, 500, analyse)
 
-        result = response.json()
-        return result['choices'][0]['message']['content']
-    except Exception as e:
-        print(f"Error getting LLM content for {image_path}: {str(e)}")
-        return ""
 
+def get_content_analysis(content, usage=None):
+    """Get content analysis from LLM to identify sensitive information.
+
+    The answer is requested as a JSON findings object (see ai_findings.py).
+    Token usage reported by the API is added to the usage dict when given;
+    answers from the cache cost nothing.
+    """
+    from ai_findings import FINDINGS_INSTRUCTIONS, response_format
 
-def get_content_analysis(content):
-    """Get content analysis from LLM to identify sensitive information"""
-    api_key = settings.OPENAI_API_KEY
-    api_base = settings.OPENAI_BASE_URL
-    model = settings.MODEL
     prompt = settings.PROMPTS
-    
-    if not api_key:
+
+    if not settings.OPENAI_API_KEY:
         return "OpenAI API key not configured"
 
-    try:
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {api_key}"
-        }
-
-        payload = {
-            "model": model,
-            "messages": [
+    def analyse():
+        try:
+            messages = [
+                {
+                    "role": "system",
+                    "content": FINDINGS_INSTRUCTIONS
+                },
                 {
                     "role": "user",
                     "content": f"{prompt}\n\nContent to analyze:\n{content}"
                 }
-            ],
-            "max_tokens": 500
-        }
+            ]
+
+            options = {"response_format": response_format()} if response_format() else {}
+            result = get_llm_client().chat_completion(messages, max_tokens=500, **options)
+            if usage is not None:
+                usage["prompt_tokens"] += result.get("usage", {}).get("prompt_tokens", 0)
+                usage["completion_tokens"] += result.get("usage", {}).get("completion_tokens", 0)
+            return result['choices'][0]['message']['content']
+        except Exception as e:
+            print(f"Error getting content analysis: {str(e)}")
+            return ""
 
-        response = requests.post(api_base + "/chat/completions", headers=headers, json=payload)
-        response.raise_for_status()
+    # Unchanged content with the same prompts, answer format and model is answered from the cache
+    cache_prompt = "\n".join([prompt, FINDINGS_INSTRUCTIONS, settings.LLM_RESPONSE_FORMAT])
+    return llm_cache.get_or_compute(content, cache_prompt, settings.MODEL, 500, analyse)
 
-        result = response.json()
-        return result['choices'][0]['message']['content']
+
+def analyse_content_in_chunks(content, token_budget=None):
+    """Analyse the candidate windows of content, chunk by chunk and concurrently.
+
+    Returns the non-empty analyses of the chunks and a usage dict with the
+    prompt and completion tokens spent and the number of chunks analysed and
+    skipped. Chunks that do not fit into the job's token_budget are skipped.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    from ai_findings import FINDINGS_INSTRUCTIONS
+    from llm_windows import build_prompt_chunks, estimate_tokens
+
+    chunks, skipped = build_prompt_chunks(content, (ID_CARD_PATTERN, PHONE_PATTERN))
+    usage = {"prompt_tokens": 0, "completion_tokens": 0, "chunks": 0, "skipped_chunks": skipped}
+    lock = threading.Lock()
+    prompt_tokens = estimate_tokens(settings.PROMPTS) + estimate_tokens(FINDINGS_INSTRUCTIONS)
+
+    def analyse_chunk(chunk):
+        reserved = prompt_tokens + estimate_tokens(chunk) + 500
+        if token_budget is not None and not token_budget.reserve(reserved):
+            with lock:
+                usage["skipped_chunks"] += 1
+            return ""
+        chunk_usage = {"prompt_tokens": 0, "completion_tokens": 0}
+        analysis = get_content_analysis(chunk, chunk_usage)
+        if token_budget is not None:
+            token_budget.adjust(chunk_usage["prompt_tokens"] + chunk_usage["completion_tokens"] - reserved)
+        with lock:
+            usage["prompt_tokens"] += chunk_usage["prompt_tokens"]
+            usage["completion_tokens"] += chunk_usage["completion_tokens"]
+            usage["chunks"] += 1
+        return analysis
+
+    if len(chunks) > 1:
+        with ThreadPoolExecutor(max_workers=min(len(chunks), settings.LLM_MAX_CONCURRENCY)) as executor:
+            analyses = list(executor.map(analyse_chunk, chunks))
+    else:
+        analyses = [analyse_chunk(chunk) for chunk in chunks]
+    return [analysis for analysis in analyses if analysis], usage
+
+
+def analyse_image(image_path, usage, token_budget=None):
+    """Vision analysis of an image attachment, counted in usage and against token_budget"""
+    from image_prep import prepare_image
+
+    try:
+        prepared = prepare_image(image_path)
     except Exception as e:
-        print(f"Error getting content analysis: {str(e)}")
+        print(f"Error preparing image {image_path}: {str(e)}")
         return ""
 
+    reserved = prepared.estimated_tokens() + 500
+    if token_budget is not None and not token_budget.reserve(reserved):
+        usage["skipped_chunks"] += 1
+        return ""
+    image_usage = {"prompt_tokens": 0, "completion_tokens": 0}
+    analysis = get_image_analysis(prepared, image_usage)
+    if token_budget is not None:
+        token_budget.adjust(image_usage["prompt_tokens"] + image_usage["completion_tokens"] - reserved)
+    usage["prompt_tokens"] += image_usage["prompt_tokens"]
+    usage["completion_tokens"] += image_usage["completion_tokens"]
+    usage["chunks"] += 1
+    return analysis
+
+
+def merge_image_findings(text_findings, image_findings):
+    """Image findings that are not already among the findings of the image's OCR text.
+
+    Masked values are not unique (two phone numbers can mask alike), so each
+    text finding matches at most one image finding, and takes its confidence
+    when that is higher.
+    """
+    unmatched = {}
+    for finding in text_findings:
+        unmatched.setdefault((finding.type, finding.value), []).append(finding)
+    new_findings = []
+    for finding in image_findings:
+        matches = unmatched.get((finding.type, finding.value))
+        if matches:
+            match = matches.pop()
+            match.confidence = max(match.confidence, finding.confidence)
+        else:
+            new_findings.append(finding)
+    return new_findings
 
-def detect_sensitive_info_ai(content):
-    """Detect sensitive information using AI analysis"""
-    analysis = get_content_analysis(content)
-    has_id_card = contains_id_card(content) or "id card" in analysis.lower() or "identity card" in analysis.lower()
-    has_phone = contains_phone(content) or "phone" in analysis.lower() or "mobile" in analysis.lower()
-    return has_id_card, has_phone, analysis
\ No newline at end of file
+
+def detect_sensitive_info_ai(content, token_budget=None, image_path=None):
+    """Detect sensitive information using AI analysis.
+
+    Returns the flags, the findings as the JSON stored in llm_content, the
+    token usage and the findings. Answers that are not a findings object are
+    kept in llm_content as unparsed and only pattern matching sets the flags.
+    With LLM_VISION_ENABLED, the image at image_path is analysed as well.
+    """
+    from ai_findings import findings_json, flags_from_findings, parse_findings
+
+    analyses, usage = analyse_content_in_chunks(content, token_budget)
+    image_analyses = []
+    if image_path and settings.LLM_VISION_ENABLED:
+        analysis = analyse_image(image_path, usage, token_budget)
+        if analysis:
+            image_analyses.append(analysis)
+    unparsed = []
+
+    def parse(analyses):
+        findings = []
+        for analysis in analyses:
+            parsed = parse_findings(analysis)
+            if parsed is None:
+                unparsed.append(analysis)
+            else:
+                findings.extend(parsed)
+        return findings
+
+    # Chunks are built from merged windows and never overlap, so all their findings are kept
+    findings = parse(analyses)
+    findings.extend(merge_image_findings(findings, parse(image_analyses)))
+    findings.sort(key=lambda finding: -finding.confidence)
+    analyses.extend(image_analyses)
+
+    ai_has_id_card, ai_has_phone = flags_from_findings(findings)
+    has_id_card = contains_id_card(content) or ai_has_id_card
+    has_phone = contains_phone(content) or ai_has_phone
+    llm_content = findings_json(findings, unparsed) if analyses else ""
+    return has_id_card, has_phone, llm_content, usage, findings